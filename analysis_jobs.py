@@ -0,0 +1,227 @@
+import os
+import json
+import time
+import uuid
+import logging
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import Dict, Any, Callable, Optional
+import metrics
+from sqlite_store import ThreadLocalConnection
+
+logger = logging.getLogger(__name__)
+
+JOB_WAIT_SECONDS = metrics.histogram('mf_analysis_job_wait_seconds', "Time analysis jobs spend queued before they start")
+JOBS_REJECTED = metrics.counter('mf_analysis_jobs_rejected_total', "Analysis jobs refused because the queue was full")
+
+
+class AnalysisQueueFullError(RuntimeError):
+    """Raised by submit() when `max_queue` jobs are already waiting to start"""
+
+
+class AnalysisJobStore:
+    """Job records in a small SQLite table shared by every worker process on the host.
+
+    Reads never write, so polling a job is cheap. Rows are only removed once
+    they are older than the retention window, never to make room, so a
+    pending job cannot disappear from under a client polling it.
+    """
+
+    def __init__(self, path: str = None, retention_seconds: int = 600):
+        self.path = path or os.path.join(tempfile.gettempdir(), 'mf_analysis_jobs.sqlite3')
+        self.retention_seconds = retention_seconds
+        self._connection = ThreadLocalConnection(self.path)
+        self._connection().execute("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                job_id TEXT PRIMARY KEY,
+                status TEXT NOT NULL,
+                record TEXT NOT NULL,
+                created_at REAL NOT NULL
+            )
+        """)
+
+    def put(self, job_id: str, record: Dict[str, Any]):
+        """Insert or update a job record, dropping records past the retention window"""
+        try:
+            now = time.time()
+            connection = self._connection()
+            connection.execute(
+                """
+                INSERT INTO jobs (job_id, status, record, created_at) VALUES (?, ?, ?, ?)
+                ON CONFLICT(job_id) DO UPDATE SET status = excluded.status, record = excluded.record
+                """,
+                (job_id, record['status'], json.dumps(record), now)
+            )
+            connection.execute('DELETE FROM jobs WHERE created_at < ?', (now - self.retention_seconds,))
+        except Exception as e:
+            logger.warning(f"Analysis job store write failed: {e}")
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Job record, or None if unknown or expired"""
+        try:
+            row = self._connection().execute(
+                'SELECT record FROM jobs WHERE job_id = ? AND created_at >= ?',
+                (job_id, time.time() - self.retention_seconds)
+            ).fetchone()
+            return json.loads(row[0]) if row else None
+        except Exception as e:
+            logger.warning(f"Analysis job store read failed: {e}")
+            return None
+
+
+class AnalysisJobManager:
+    """Runs slow LLM analyses on a bounded thread pool behind job ids.
+
+    At most `max_queue` jobs wait for a thread; beyond that submit() refuses
+    new ones, so a burst can't build a backlog that outlives every deadline.
+
+    Job records are mirrored into an AnalysisJobStore shared by every worker
+    process, so a job can be polled from any worker, not only the one that
+    started it.
+
+    Background jobs need a long-lived server process. On serverless hosts
+    (Vercel) the function is frozen once the response is sent and /tmp is not
+    shared between instances, so the manager is disabled there and /analyze
+    falls back to generating the analysis inline.
+    """
+
+    def __init__(self, max_workers: int = 4, store: AnalysisJobStore = None, retention_seconds: int = 600,
+                 enabled: bool = True, max_queue: int = 16):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.retention_seconds = retention_seconds
+        self.store = store
+        self.enabled = enabled
+        self._executor = None
+        self._executor_pid = None
+        self._futures = {}
+        self.queued = 0
+        self.running = 0
+        self.rejected = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> 'AnalysisJobManager':
+        """Build the job manager from environment settings"""
+        retention_seconds = int(os.getenv('ANALYSIS_JOB_RETENTION', 600))
+        default_enabled = '0' if os.getenv('VERCEL') else '1'
+        enabled = os.getenv('ANALYSIS_JOBS_ENABLED', default_enabled).lower() not in ('0', 'false', 'no')
+
+        store = None
+        if enabled:
+            try:
+                store = AnalysisJobStore(os.getenv('ANALYSIS_JOB_STORE_PATH') or None, retention_seconds)
+            except Exception as e:
+                logger.warning(f"Shared analysis job store disabled: {e}")
+
+        return cls(max_workers=int(os.getenv('LLM_WORKERS', 4)), store=store,
+                   retention_seconds=retention_seconds, enabled=enabled,
+                   max_queue=int(os.getenv('ANALYSIS_JOB_MAX_QUEUE', 16)))
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        """Thread pool for this process, created on first use.
+
+        Creating it lazily keeps worker threads out of a preforking master, and
+        a forked child gets a fresh pool instead of the parent's dead threads.
+        """
+        if self._executor is None or self._executor_pid != os.getpid():
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='llm-analysis')
+            self._executor_pid = os.getpid()
+            self._futures = {}
+            self.queued = self.running = 0
+        return self._executor
+
+    @property
+    def backlog(self) -> int:
+        """Jobs in this process that are queued or running"""
+        return self.queued + self.running
+
+    def submit(self, fn: Callable, *args: Any) -> str:
+        """Start fn(*args) in the background and return its job id.
+
+        Raises AnalysisQueueFullError when `max_queue` jobs are already waiting.
+        """
+        job_id = uuid.uuid4().hex
+        with self._lock:
+            executor = self._get_executor()
+            # Jobs beyond the free threads wait in the executor's queue
+            if self.queued + self.running >= self.max_workers + self.max_queue:
+                self.rejected += 1
+                JOBS_REJECTED.inc()
+                raise AnalysisQueueFullError(f"{self.queued} analysis jobs are already queued")
+            self.queued += 1
+
+        self._publish(job_id, {'status': 'pending'})
+        with self._lock:
+            future = executor.submit(self._run, job_id, fn, args, time.monotonic())
+            self._prune()
+            self._futures[job_id] = (future, time.time())
+        return job_id
+
+    def _run(self, job_id: str, fn: Callable, args: tuple, submitted: float) -> Dict[str, Any]:
+        JOB_WAIT_SECONDS.observe(time.monotonic() - submitted)
+        with self._lock:
+            self.queued -= 1
+            self.running += 1
+        try:
+            record = {'status': 'done', 'result': fn(*args)}
+        except Exception as e:
+            logger.error(f"Analysis job {job_id} failed: {e}")
+            record = {'status': 'error', 'error': str(e)}
+        finally:
+            with self._lock:
+                self.running -= 1
+
+        record['finished_at'] = time.time()
+        self._publish(job_id, record)
+        return record
+
+    def _publish(self, job_id: str, record: Dict[str, Any]):
+        if self.store:
+            self.store.put(job_id, record)
+
+    def _prune(self):
+        """Forget local futures older than the retention window"""
+        cutoff = time.time() - self.retention_seconds
+        expired = [job_id for job_id, (future, created_at) in self._futures.items()
+                   if created_at < cutoff and future.done()]
+        for job_id in expired:
+            del self._futures[job_id]
+
+    def get(self, job_id: str, wait: float = 0) -> Optional[Dict[str, Any]]:
+        """Job record, waiting up to `wait` seconds for it to finish; None if unknown"""
+        with self._lock:
+            entry = self._futures.get(job_id)
+
+        if entry is not None:
+            future = entry[0]
+            try:
+                return future.result(timeout=wait) if wait > 0 or future.done() else {'status': 'pending'}
+            except FutureTimeoutError:
+                return {'status': 'pending'}
+
+        # Started by another worker process: poll the shared store
+        if not self.store:
+            return None
+        deadline = time.monotonic() + wait
+        while True:
+            record = self.store.get(job_id)
+            if record is None or record['status'] != 'pending' or time.monotonic() >= deadline:
+                return record
+            time.sleep(0.2)
+
+    def stats(self) -> Dict[str, Any]:
+        """Local job counts"""
+        with self._lock:
+            pending = sum(1 for future, _ in self._futures.values() if not future.done())
+            return {
+                'enabled': self.enabled,
+                'max_workers': self.max_workers,
+                'max_queue': self.max_queue,
+                'queued': self.queued,
+                'running': self.running,
+                'rejected': self.rejected,
+                'pending': pending,
+                'tracked': len(self._futures)
+            }
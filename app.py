@@ -1,18 +1,237 @@
-from flask import Flask, render_template, request, jsonify
+from flask import Flask, Response, render_template, request, jsonify, stream_with_context
 import os
 from dotenv import load_dotenv
 from mutual_fund_analyzer import MutualFundAnalyzer
 from llm_recommender import LLMRecommender
+from analysis_jobs import AnalysisJobManager, AnalysisQueueFullError
+from fast_json import FastJSONProvider
+from prerendered import PrerenderedCache
+from rate_limiter import RateLimiter
+from request_schema import UserProfile, ValidationError, loads as load_request
+import timing
+from timing import stage
+import metrics
+import time
 import json
+import math
 
 load_dotenv()
 
 app = Flask(__name__)
+app.json = FastJSONProvider(app)
 app.secret_key = os.getenv('SECRET_KEY', 'your-secret-key-here')
 
 # Initialize components
 analyzer = MutualFundAnalyzer()
 llm_recommender = LLMRecommender()
+analysis_jobs = AnalysisJobManager.from_env()
+top_funds_responses = PrerenderedCache('top_funds')
+rate_limiter = RateLimiter.from_env()
+
+# Longest a client may block on /analysis/<job_id>; kept short so polls
+# don't pin a WSGI worker while the LLM call runs
+MAX_ANALYSIS_WAIT_SECONDS = 5
+
+# How long browsers and CDNs may reuse a GET /top-funds response before
+# revalidating it with If-None-Match
+TOP_FUNDS_MAX_AGE = int(os.getenv('TOP_FUNDS_MAX_AGE', 300))
+
+HTTP_REQUESTS = metrics.counter('mf_http_requests_total', "Requests by route, method and status", ('route', 'method', 'status'))
+HTTP_SECONDS = metrics.histogram('mf_http_request_seconds', "Request latency by route", ('route',))
+REJECTED_REQUESTS = metrics.counter('mf_requests_rejected_total', "Requests turned away by rate limiting or load shedding",
+                                    ('reason', 'bucket'))
+STAGE_SECONDS = metrics.histogram('mf_request_stage_seconds', "Time spent in each stage of a request (see Server-Timing)", ('stage',))
+metrics.gauge('mf_fund_snapshot_age_seconds', "Seconds since the served fund snapshot was built",
+              lambda: time.time() - analyzer.snapshot_built_at)
+
+def _validation_error(e):
+    """400 response listing each invalid request field"""
+    return jsonify({
+        'success': False,
+        'error': str(e),
+        'errors': e.errors
+    }), 400
+
+def _build_recommendations(user_info):
+    """Analyzer recommendations with GROW URLs added to each fund"""
+    recommendations = analyzer.get_recommendations(user_info)
+    
+    with stage('grow_urls'):
+        for category, funds in recommendations['recommendations'].items():
+            for fund in funds:
+                fund['grow_url'] = analyzer.get_grow_url(fund['name'])
+    
+    return recommendations
+
+def _analyze_inline(data):
+    """Whether /analyze generates the LLM analysis before responding"""
+    # Inline when the client asks to wait for it, or when background jobs are
+    # disabled (serverless deployments)
+    return bool(data.get('wait_for_analysis')) or not analysis_jobs.enabled
+
+def _analyze_payload(user_info, recommendations, llm_analysis=None):
+    """Response body for /analyze; without an inline analysis, one is started in the background"""
+    if llm_analysis is not None:
+        return {
+            'success': True,
+            'recommendations': recommendations,
+            'llm_analysis': llm_analysis,
+            'user_info': user_info
+        }
+    
+    # Run it on the LLM worker pool and hand back a job to poll. The deadline
+    # starts now, so a job that waited too long in the queue falls back at once.
+    deadline = time.monotonic() + llm_recommender.deadline_seconds
+    try:
+        job_id = analysis_jobs.submit(llm_recommender.generate_recommendations, user_info, recommendations, deadline)
+    except AnalysisQueueFullError:
+        timing.note('llm_analysis', 'queue_full')
+        return _analyze_payload(user_info, recommendations,
+                                llm_recommender.generate_fallback_analysis(user_info, recommendations))
+    timing.note('llm_analysis', 'background')
+    
+    return {
+        'success': True,
+        'recommendations': recommendations,
+        'llm_analysis': llm_recommender.generate_preliminary_analysis(user_info, recommendations),
+        'analysis_job': {
+            'id': job_id,
+            'status': 'pending',
+            'poll_url': f'/analysis/{job_id}'
+        },
+        'user_info': user_info
+    }
+
+def _slim_payload(payload, fields=None):
+    """Payload with each fund sent once, in a `funds` table keyed by id, and referenced by id elsewhere.
+    
+    `fields` limits the attributes sent for each fund (the id is always sent).
+    The user_info echo is dropped since the client sent it.
+    """
+    funds = {}
+    
+    def refs(category_funds):
+        for fund in category_funds:
+            funds.setdefault(fund['id'], fund)
+        return [fund['id'] for fund in category_funds]
+    
+    slim = {key: value for key, value in payload.items() if key != 'user_info'}
+    if 'recommendations' in slim:
+        slim['recommendations'] = dict(slim['recommendations'])
+        slim['recommendations']['recommendations'] = {
+            category: refs(category_funds) for category, category_funds in slim['recommendations']['recommendations'].items()
+        }
+    if slim.get('llm_analysis'):
+        slim['llm_analysis'] = dict(slim['llm_analysis'])
+        slim['llm_analysis']['suggested_allocations'] = {
+            category: dict(suggestion, funds=refs(suggestion['funds']))
+            for category, suggestion in slim['llm_analysis'].get('suggested_allocations', {}).items()
+        }
+    
+    if fields:
+        wanted = set(fields) | {'id'}
+        funds = {fund_id: {key: value for key, value in fund.items() if key in wanted} for fund_id, fund in funds.items()}
+    slim['funds'] = funds
+    return slim
+
+def _shape_payload(payload, args):
+    """Apply the ?format=slim and ?fields=a,b response options"""
+    if args.get('format') != 'slim':
+        return payload
+    fields = [field.strip() for field in args.get('fields', '').split(',') if field.strip()]
+    return _slim_payload(payload, fields)
+
+def _with_debug_timing(payload, args):
+    """Add the request's stage timings and cache flags when the client asked for them with ?debug_timing=1"""
+    timer = timing.current()
+    if timer is None or args.get('debug_timing') not in ('1', 'true'):
+        return payload
+    return dict(payload, debug_timing=timer.summary())
+
+def _sse(event, data):
+    """Format one Server-Sent Event"""
+    return f"event: {event}\ndata: {app.json.dumps(data)}\n\n"
+
+# Routes that run the analyzer and the LLM get their own, smaller rate limit
+ANALYZE_ROUTES = ('/analyze', '/analyze/stream')
+
+def _analysis_backlog():
+    """Analyses queued or running in this worker, and how many it can hold"""
+    limiter = llm_recommender.limiter
+    # Inline analyses wait on the LLM limiter; background ones pile up in the job queue
+    backlog, capacity = limiter.waiting, limiter.max_queue
+    if analysis_jobs.enabled:
+        backlog += analysis_jobs.backlog
+        capacity = analysis_jobs.max_workers + analysis_jobs.max_queue
+    return backlog, capacity
+
+def _admit(path, client):
+    """Rate limiting and load shedding for one request.
+
+    Returns None to serve it, or the (status, body, retry_after) to refuse it with.
+    """
+    if rate_limiter is None:
+        return None
+
+    bucket = 'analyze' if path in ANALYZE_ROUTES else 'default'
+    if bucket == 'analyze' and rate_limiter.should_shed(*_analysis_backlog()):
+        REJECTED_REQUESTS.inc('shed', bucket)
+        return 503, {
+            'success': False,
+            'error': 'The analysis service is overloaded, please retry shortly',
+            'retry_after': math.ceil(rate_limiter.shed_retry_after)
+        }, rate_limiter.shed_retry_after
+
+    allowed, retry_after = rate_limiter.acquire(bucket, client)
+    if not allowed:
+        REJECTED_REQUESTS.inc('rate_limited', bucket)
+        return 429, {
+            'success': False,
+            'error': 'Too many requests, please slow down',
+            'retry_after': math.ceil(retry_after)
+        }, retry_after
+    return None
+
+def _record_request(route, method, status, timer):
+    """Request count, latency and per-stage timings for the metrics endpoint"""
+    HTTP_REQUESTS.inc(route, method, str(status))
+    HTTP_SECONDS.observe(timer.elapsed(), route)
+    for name, seconds in timer.stages.items():
+        STAGE_SECONDS.observe(seconds, name)
+
+@app.before_request
+def _start_timer():
+    metrics.REGISTRY.start_flusher()
+    timing.start()
+
+@app.before_request
+def _limit_request():
+    # Scrapes and static files are never limited
+    if rate_limiter is None or request.endpoint in ('static', 'prometheus_metrics'):
+        return None
+    client = rate_limiter.client_id(request.headers.get('X-API-Key'), request.remote_addr,
+                                    request.headers.get('X-Forwarded-For'))
+    refused = _admit(request.path, client)
+    if refused is None:
+        return None
+    status, body, retry_after = refused
+    response = jsonify(body)
+    response.status_code = status
+    response.headers['Retry-After'] = str(math.ceil(retry_after))
+    return response
+
+@app.after_request
+def _add_server_timing(response):
+    timer = timing.current()
+    if timer is not None:
+        response.headers['Server-Timing'] = timer.server_timing()
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        _record_request(route, request.method, response.status_code, timer)
+    return response
+
+@app.teardown_request
+def _stop_timer(exc):
+    timing.stop()
 
 @app.route('/')
 def index():
@@ -21,45 +240,99 @@ def index():
 @app.route('/analyze', methods=['POST'])
 def analyze():
     try:
-        data = request.get_json()
-        
-        # Extract user information with all new fields
-        user_info = {
-            'name': data.get('name'),
-            'age': int(data.get('age')),
-            'annual_income': float(data.get('annual_income')),
-            'investment_amount': float(data.get('investment_amount')),
-            'risk_tolerance': data.get('risk_tolerance', 'moderate'),
-            'investment_goal': data.get('investment_goal', 'wealth_creation'),
-            'investment_horizon': data.get('investment_horizon', '5-10 years'),
-            'monthly_sip': float(data.get('monthly_sip', 0)),
-            'existing_investments': float(data.get('existing_investments', 0)),
-            'tax_bracket': int(data.get('tax_bracket', 20)),
-            'emergency_fund': data.get('emergency_fund', 'yes'),
-            'fund_type_preference': data.get('fund_type_preference', 'direct'),
-            'esg_preference': data.get('esg_preference', 'no_preference'),
-            'dividend_preference': data.get('dividend_preference', 'growth'),
-            'lumpsum_investment': float(data.get('lumpsum_investment', 0)),
-            'sip_investment': float(data.get('sip_investment', 0))
-        }
+        with stage('parse'):
+            data = load_request(request.get_data())
+            user_info = UserProfile.decode(data)
+        recommendations = _build_recommendations(user_info)
         
-        # Get recommendations from analyzer
-        recommendations = analyzer.get_recommendations(user_info)
+        llm_analysis = None
+        if _analyze_inline(data):
+            llm_analysis = llm_recommender.generate_recommendations(user_info, recommendations)
         
-        # Add GROW URLs to each fund
-        for category, funds in recommendations['recommendations'].items():
-            for fund in funds:
-                fund['grow_url'] = analyzer.get_grow_url(fund['name'])
+        payload = _shape_payload(_analyze_payload(user_info, recommendations, llm_analysis), request.args)
+        payload = _with_debug_timing(payload, request.args)
+        with stage('serialize'):
+            return jsonify(payload)
         
-        # Generate LLM analysis
-        llm_analysis = llm_recommender.generate_recommendations(user_info, recommendations)
+    except ValidationError as e:
+        return _validation_error(e)
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+@app.route('/analyze/stream', methods=['POST'])
+def analyze_stream():
+    """Recommendations first, then the LLM analysis streamed as Server-Sent Events"""
+    try:
+        with stage('parse'):
+            user_info = UserProfile.decode(load_request(request.get_data()))
+        recommendations = _build_recommendations(user_info)
         
+    except ValidationError as e:
+        return _validation_error(e)
+    except Exception as e:
         return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+    
+    def generate():
+        yield _sse('recommendations', {
             'success': True,
             'recommendations': recommendations,
-            'llm_analysis': llm_analysis,
+            'llm_analysis': llm_recommender.generate_preliminary_analysis(user_info, recommendations),
             'user_info': user_info
         })
+        for event in llm_recommender.stream_recommendations(user_info, recommendations):
+            yield _sse(event['event'], event['data'])
+        yield _sse('done', {'success': True})
+    
+    return Response(stream_with_context(generate()), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
+@app.route('/analysis/<job_id>')
+def analysis_status(job_id):
+    try:
+        try:
+            wait = float(request.args.get('wait', 0))
+        except ValueError:
+            wait = math.nan
+        if not math.isfinite(wait) or wait < 0:
+            return jsonify({
+                'success': False,
+                'error': 'wait must be a non-negative number of seconds'
+            }), 400
+        
+        job = analysis_jobs.get(job_id, wait=min(wait, MAX_ANALYSIS_WAIT_SECONDS))
+        
+        if job is None:
+            return jsonify({
+                'success': False,
+                'error': 'Unknown or expired analysis job'
+            }), 404
+        
+        if job['status'] == 'pending':
+            return jsonify({
+                'success': True,
+                'status': 'pending'
+            }), 202
+        
+        if job['status'] == 'error':
+            return jsonify({
+                'success': False,
+                'status': 'error',
+                'error': job.get('error')
+            }), 500
+        
+        return jsonify(_shape_payload({
+            'success': True,
+            'status': 'done',
+            'llm_analysis': job['result']
+        }, request.args))
         
     except Exception as e:
         return jsonify({
@@ -81,25 +354,116 @@ def fund_details(fund_id):
             'error': str(e)
         }), 500
 
-@app.route('/top-funds', methods=['POST'])
+def _render_top_funds(category):
+    """Response body for the top funds of a (resolved) category"""
+    top_funds = analyzer.get_top_funds(category)
+    if not top_funds:
+        # get_top_funds logs and returns nothing on errors; don't cache that
+        raise RuntimeError(f"No funds available for {category}")
+    return {
+        'success': True,
+        'funds': top_funds
+    }
+
+@app.route('/top-funds', methods=['GET', 'POST'])
 def get_top_funds():
     try:
-        data = request.get_json()
-        category = data.get('category', 'large_cap')
+        if request.method == 'POST':
+            category = (request.get_json(silent=True) or {}).get('category', 'large_cap')
+        else:
+            category = request.args.get('category', 'large_cap')
         
-        # Get top 5 funds for the specified category
-        top_funds = analyzer.get_top_funds(category)
+        # The top 5 only change with the fund data, so each category's response
+        # is rendered and compressed once per data version
+        category = analyzer.resolve_category(category)
+        rendered = top_funds_responses.get(category, analyzer.data_version, lambda: _render_top_funds(category))
+        
+        if request.method == 'POST':
+            return Response(rendered.body, mimetype='application/json')
+        
+        coding = rendered.select(request.accept_encodings)
+        headers = {
+            'ETag': rendered.etags[coding],
+            'Cache-Control': f'public, max-age={TOP_FUNDS_MAX_AGE}',
+            'Vary': 'Accept-Encoding'
+        }
+        if rendered.matches(request.if_none_match):
+            return Response(status=304, headers=headers)
+        if coding != 'identity':
+            headers['Content-Encoding'] = coding
+        return Response(rendered.bodies[coding], mimetype='application/json', headers=headers)
+        
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+@app.route('/backtest', methods=['POST'])
+def backtest():
+    try:
+        data = request.get_json(silent=True) or {}
+        fund_ids = data.get('fund_ids')
+        allocations = data.get('allocations')
+        if not isinstance(fund_ids, list) or not fund_ids:
+            raise ValueError("fund_ids must be a non-empty list of fund ids")
+        if allocations is not None and not (isinstance(allocations, dict) and all(isinstance(a, dict) for a in allocations.values())):
+            raise ValueError("allocations must map names to {fund_id: weight} objects")
+        
+        years = data.get('years')
+        if years is not None:
+            years = float(years)
+            if not math.isfinite(years) or years <= 0:
+                raise ValueError("years must be a positive number")
+        
+        # Historical replay of one or more allocations over the same funds
+        results = analyzer.backtest_allocations(
+            fund_ids,
+            allocations=allocations,
+            lumpsum=float(data.get('lumpsum_investment', 0)),
+            monthly_sip=float(data.get('monthly_sip', 0)),
+            years=years,
+            rebalance=data.get('rebalance', 'annual'),
+            include_series=bool(data.get('include_series', False))
+        )
         
         return jsonify({
             'success': True,
-            'funds': top_funds
+            'backtests': results
         })
         
+    except (ValueError, TypeError) as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
     except Exception as e:
         return jsonify({
             'success': False,
             'error': str(e)
         }), 500
 
+@app.route('/llm-stats')
+def llm_stats():
+    return jsonify({
+        'success': True,
+        'llm': llm_recommender.stats(),
+        'analysis_jobs': analysis_jobs.stats(),
+        'rate_limits': rate_limiter.stats() if rate_limiter else None
+    })
+
+@app.route('/cache-stats')
+def cache_stats():
+    return jsonify({
+        'success': True,
+        'llm_cache': llm_recommender.cache_stats(),
+        'frontier_cache': analyzer.optimizer.cache_stats()
+    })
+
+@app.route('/metrics')
+def prometheus_metrics():
+    """Metrics in the Prometheus text format, totalled over every worker"""
+    return Response(metrics.REGISTRY.render(), mimetype='text/plain; version=0.0.4')
+
 if __name__ == '__main__':
     app.run(debug=False, host='0.0.0.0', port=5000)
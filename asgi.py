@@ -0,0 +1,118 @@
+"""
+ASGI entry point for serving with uvicorn:
+
+    uvicorn asgi:app --host 0.0.0.0 --port 5000
+
+POST /analyze runs on the event loop: the recommendations are computed in a
+worker thread and the LLM call is awaited, so a request waiting on the LLM
+holds no thread and one process can keep hundreds of them in flight. Every
+other route is the Flask app, run through asgiref's WSGI adapter. Both share
+the analyzer and LLM recommender created in app.py.
+"""
+
+import math
+import asyncio
+from urllib.parse import parse_qsl
+from asgiref.wsgi import WsgiToAsgi
+from fast_json import dumps_bytes
+from request_schema import UserProfile, ValidationError, loads as load_request
+import timing
+from timing import stage
+import metrics
+import app as flask_app
+
+wsgi_app = WsgiToAsgi(flask_app.app)
+
+async def _read_body(receive) -> bytes:
+    chunks = []
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            raise ConnectionError("Client disconnected before sending the request body")
+        chunks.append(message.get('body', b''))
+        if not message.get('more_body'):
+            return b''.join(chunks)
+
+async def _send_json(send, status: int, payload, headers=()):
+    with stage('serialize'):
+        body = dumps_bytes(payload)
+    headers = [(b'content-type', b'application/json'), (b'content-length', str(len(body)).encode()), *headers]
+    timer = timing.current()
+    if timer is not None:
+        headers.append((b'server-timing', timer.server_timing().encode()))
+        flask_app._record_request('/analyze', 'POST', status, timer)
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': headers
+    })
+    await send({'type': 'http.response.body', 'body': body})
+
+async def analyze(scope, receive, send):
+    """Async POST /analyze, with the same request and response as the Flask view"""
+    # Each request runs in its own task, so the timer is this request's alone
+    metrics.REGISTRY.start_flusher()
+    timing.start()
+
+    limiter = flask_app.rate_limiter
+    if limiter is not None:
+        request_headers = dict(scope.get('headers', []))
+        api_key = request_headers.get(b'x-api-key')
+        forwarded_for = request_headers.get(b'x-forwarded-for')
+        client = limiter.client_id(api_key and api_key.decode('latin-1'), (scope.get('client') or (None,))[0],
+                                   forwarded_for and forwarded_for.decode('latin-1'))
+        # The limiter's SQLite transaction is quick, but it can wait on another worker's lock
+        refused = await asyncio.to_thread(flask_app._admit, scope['path'], client)
+        if refused is not None:
+            status, payload, retry_after = refused
+            await _send_json(send, status, payload, [(b'retry-after', str(math.ceil(retry_after)).encode())])
+            return
+
+    try:
+        body = await _read_body(receive)
+        with stage('parse'):
+            data = load_request(body)
+            user_info = UserProfile.decode(data)
+        recommendations = await asyncio.to_thread(flask_app._build_recommendations, user_info)
+
+        llm_analysis = None
+        if flask_app._analyze_inline(data):
+            llm_analysis = await flask_app.llm_recommender.agenerate_recommendations(user_info, recommendations)
+
+        payload = flask_app._analyze_payload(user_info, recommendations, llm_analysis)
+        args = dict(parse_qsl(scope.get('query_string', b'').decode()))
+        payload = flask_app._with_debug_timing(flask_app._shape_payload(payload, args), args)
+
+    except ValidationError as e:
+        await _send_json(send, 400, {
+            'success': False,
+            'error': str(e),
+            'errors': e.errors
+        })
+        return
+    except Exception as e:
+        await _send_json(send, 500, {
+            'success': False,
+            'error': str(e)
+        })
+        return
+
+    await _send_json(send, 200, payload)
+
+async def _lifespan(receive, send):
+    # Everything is initialised when app.py is imported
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+async def app(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        await _lifespan(receive, send)
+    elif scope['type'] == 'http' and scope['method'] == 'POST' and scope['path'] == '/analyze':
+        await analyze(scope, receive, send)
+    else:
+        await wsgi_app(scope, receive, send)
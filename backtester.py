@@ -0,0 +1,156 @@
+import numpy as np
+from typing import Dict, List, Any
+
+from fund_snapshot import FundSnapshot, TRADING_DAYS
+
+
+class PortfolioBacktester:
+    """Replay fund allocations (lumpsum plus monthly SIP) over historical NAVs.
+
+    Many allocations are valued at once: portfolio values for every date and
+    every allocation come out of (dates x funds) @ (funds x allocations)
+    matrix products, so comparing risk profiles costs about the same as one.
+    """
+
+    # Rebalancing interval in months (None = buy and hold)
+    REBALANCE_FREQUENCIES = {
+        'none': None,
+        'monthly': 1,
+        'quarterly': 3,
+        'semi_annual': 6,
+        'annual': 12
+    }
+
+    def __init__(self, snapshot: FundSnapshot):
+        self.snapshot = snapshot
+
+    def backtest(self, fund_weights: Dict[str, float], lumpsum: float = 0, monthly_sip: float = 0,
+                 years: float = None, rebalance: str = 'annual') -> Dict[str, Any]:
+        """Backtest a single {fund_id: weight} allocation"""
+        fund_ids = list(fund_weights)
+        weights = np.array([[fund_weights[fund_id] for fund_id in fund_ids]], dtype=float)
+        results = self.backtest_many(fund_ids, weights, lumpsum, monthly_sip, years, rebalance)
+        return results[0]
+
+    def backtest_many(self, fund_ids: List[str], weights: np.ndarray, lumpsum: float = 0, monthly_sip: float = 0,
+                      years: float = None, rebalance: str = 'annual', include_series: bool = False) -> List[Dict[str, Any]]:
+        """Backtest an (allocations x funds) weight matrix over the same funds"""
+        if rebalance not in self.REBALANCE_FREQUENCIES:
+            raise ValueError(f"Unknown rebalance frequency: {rebalance}")
+        if not (np.isfinite(lumpsum) and np.isfinite(monthly_sip)) or lumpsum < 0 or monthly_sip < 0:
+            raise ValueError("Investment amounts must be non-negative numbers")
+        if lumpsum <= 0 and monthly_sip <= 0:
+            raise ValueError("Backtest needs a lumpsum or a monthly SIP amount")
+
+        unknown = [fund_id for fund_id in fund_ids if fund_id not in self.snapshot.fund_index]
+        if not fund_ids or unknown:
+            raise ValueError(f"Unknown fund ids: {', '.join(unknown)}" if unknown else "Backtest needs at least one fund")
+
+        # Normalize each allocation to a fully invested weight vector
+        weights = np.atleast_2d(np.asarray(weights, dtype=float))
+        if weights.shape[1] != len(fund_ids):
+            raise ValueError("Allocation weights do not match the backtested funds")
+        if not np.all(np.isfinite(weights)) or np.any(weights < 0):
+            raise ValueError("Allocation weights must be non-negative numbers")
+        totals = weights.sum(axis=1, keepdims=True)
+        if np.any(totals <= 0):
+            raise ValueError("Every allocation needs a positive weight on at least one fund")
+        weights = weights / totals
+
+        dates, navs = self._window(fund_ids, years)
+        values, invested = self._simulate(dates, navs, weights.T, lumpsum, monthly_sip, rebalance)
+        metrics = self._metrics(dates, values, invested, monthly_sip)
+
+        results = []
+        for i in range(weights.shape[0]):
+            result = {key: round(float(metric[i]), 4) for key, metric in metrics.items()}
+            result['start_date'] = str(dates[0])
+            result['end_date'] = str(dates[-1])
+            result['rebalance'] = rebalance
+            if include_series:
+                # Month-end values are plenty for charting and keep payloads small
+                month_ends = self._month_starts(dates)[1:] - 1
+                result['series'] = {
+                    'dates': [str(d) for d in dates[month_ends]],
+                    'values': np.round(values[month_ends, i], 2).tolist(),
+                    'invested': np.round(invested[month_ends], 2).tolist()
+                }
+            results.append(result)
+
+        return results
+
+    def _window(self, fund_ids: List[str], years: float = None):
+        """Dates and NAVs for the backtest window"""
+        navs = self.snapshot.nav_for(fund_ids)
+        dates = self.snapshot.nav_dates
+        if years:
+            days = min(int(years * TRADING_DAYS), len(dates) - 1)
+            dates, navs = dates[-(days + 1):], navs[-(days + 1):]
+        return dates, navs
+
+    @staticmethod
+    def _month_starts(dates: np.ndarray) -> np.ndarray:
+        """Indexes of the first trading day of every month in the window"""
+        months = dates.astype('datetime64[M]')
+        return np.flatnonzero(np.r_[True, months[1:] != months[:-1]])
+
+    def _simulate(self, dates: np.ndarray, navs: np.ndarray, weights: np.ndarray,
+                  lumpsum: float, monthly_sip: float, rebalance: str):
+        """Portfolio value (dates x allocations) and cumulative invested amount"""
+        n_dates = len(dates)
+        sip_days = self._month_starts(dates)
+
+        # Rebalancing periods start on SIP days every `interval` months
+        interval = self.REBALANCE_FREQUENCIES[rebalance]
+        period_starts = sip_days[::interval] if interval else sip_days[:1]
+        period_of_day = np.searchsorted(period_starts, np.arange(n_dates), side='right') - 1
+        period_start_of_day = period_starts[period_of_day]
+
+        # Units bought per rupee of SIP since the period started (start-day SIP is
+        # folded into the period's opening value instead)
+        sip_flags = np.zeros(n_dates)
+        sip_flags[sip_days] = monthly_sip
+        unit_flows = sip_flags[:, None] / navs
+        unit_flows[period_starts] = 0
+        cumulative_units = np.cumsum(unit_flows, axis=0)
+        units_since_start = cumulative_units - cumulative_units[period_start_of_day]
+
+        # Growth of opening value and value of in-period SIPs, per allocation
+        growth = (navs / navs[period_start_of_day]) @ weights
+        sip_value = (navs * units_since_start) @ weights
+
+        # Opening value of each period follows V[p+1] = a[p] * V[p] + c[p]
+        opening = lumpsum + sip_flags[period_starts[0]]
+        if len(period_starts) > 1:
+            ends = period_starts[1:]
+            a = (navs[ends] / navs[period_starts[:-1]]) @ weights
+            c = (navs[ends] * units_since_start[ends - 1]) @ weights + sip_flags[ends][:, None]
+            growth_to = np.vstack([np.ones((1, weights.shape[1])), np.cumprod(a, axis=0)])
+            discounted = np.vstack([np.zeros((1, weights.shape[1])), np.cumsum(c / growth_to[1:], axis=0)])
+            opening = growth_to * (opening + discounted)
+        else:
+            opening = np.full((1, weights.shape[1]), opening)
+
+        values = opening[period_of_day] * growth + sip_value
+        invested = lumpsum + np.cumsum(sip_flags)
+        return values, invested
+
+    def _metrics(self, dates: np.ndarray, values: np.ndarray, invested: np.ndarray,
+                 monthly_sip: float) -> Dict[str, np.ndarray]:
+        """CAGR, volatility and drawdown of the time-weighted return series"""
+        # Strip same-day contributions out of the daily returns
+        flows = np.diff(invested)[:, None]
+        daily_returns = (values[1:] - flows) / values[:-1] - 1
+        unit_value = np.vstack([np.ones((1, values.shape[1])), np.cumprod(1 + daily_returns, axis=0)])
+
+        elapsed_years = max((dates[-1] - dates[0]).astype(int) / 365.25, 1 / 365.25)
+        running_peak = np.maximum.accumulate(unit_value, axis=0)
+
+        return {
+            'final_value': values[-1],
+            'total_invested': np.full(values.shape[1], invested[-1]),
+            'absolute_return': (values[-1] / invested[-1] - 1) * 100,
+            'cagr': (unit_value[-1] ** (1 / elapsed_years) - 1) * 100,
+            'volatility': daily_returns.std(axis=0) * np.sqrt(TRADING_DAYS) * 100,
+            'max_drawdown': (unit_value / running_peak - 1).min(axis=0) * 100
+        }
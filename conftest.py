@@ -0,0 +1,37 @@
+"""
+Shared pytest fixtures
+"""
+
+import os
+import importlib
+import pytest
+
+
+def _import_isolated(name: str):
+    """Import a module that loads .env without leaking its settings (like the API key) into other tests"""
+    environ = dict(os.environ)
+    try:
+        return importlib.import_module(name)
+    finally:
+        os.environ.clear()
+        os.environ.update(environ)
+
+
+def load_app():
+    """The Flask app module (app.py)"""
+    return _import_isolated('app')
+
+
+def load_asgi():
+    """The ASGI entry point module (asgi.py), which wraps app.py"""
+    return _import_isolated('asgi')
+
+
+@pytest.fixture
+def app_module():
+    return load_app()
+
+
+@pytest.fixture
+def asgi_module():
+    return load_asgi()
@@ -3,13 +3,28 @@ import pandas as pd
 from bs4 import BeautifulSoup
 import time
 import json
+import functools
 from typing import Dict, List, Any
 import logging
+import metrics
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+FETCH_SECONDS = metrics.histogram('mf_fetch_seconds', "Time to fetch fund data from each source", ('source',))
+FETCH_ERRORS = metrics.counter('mf_fetch_errors_total', "Failed fetches from each source", ('source',))
+
+def _timed_fetch(source: str):
+    """Record the duration of a fetch_* method under `source`"""
+    def decorator(fetch):
+        @functools.wraps(fetch)
+        def wrapper(*args, **kwargs):
+            with FETCH_SECONDS.time(source):
+                return fetch(*args, **kwargs)
+        return wrapper
+    return decorator
+
 class MutualFundDataFetcher:
     """Fetcher for mutual fund data from various sources"""
     
@@ -19,6 +34,7 @@ class MutualFundDataFetcher:
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
         })
         
+    @_timed_fetch('amfi')
     def fetch_amfi_data(self) -> Dict[str, Any]:
         """Fetch data from AMFI (Association of Mutual Funds in India)"""
         try:
@@ -34,8 +50,10 @@ class MutualFundDataFetcher:
             
         except Exception as e:
             logger.error(f"Error fetching AMFI data: {e}")
+            FETCH_ERRORS.inc('amfi')
             return {}
     
+    @_timed_fetch('tickertape')
     def fetch_tickertape_data(self, api_key: str = None) -> Dict[str, Any]:
         """Fetch data from TickerTape API"""
         try:
@@ -46,8 +64,10 @@ class MutualFundDataFetcher:
             
         except Exception as e:
             logger.error(f"Error fetching TickerTape data: {e}")
+            FETCH_ERRORS.inc('tickertape')
             return {}
     
+    @_timed_fetch('moneycontrol')
     def fetch_moneycontrol_data(self) -> Dict[str, Any]:
         """Fetch data from MoneyControl website"""
         try:
@@ -64,8 +84,10 @@ class MutualFundDataFetcher:
             
         except Exception as e:
             logger.error(f"Error fetching MoneyControl data: {e}")
+            FETCH_ERRORS.inc('moneycontrol')
             return {}
     
+    @_timed_fetch('yahoo_finance')
     def fetch_yahoo_finance_data(self, fund_symbols: List[str]) -> Dict[str, Any]:
         """Fetch data from Yahoo Finance"""
         try:
@@ -92,6 +114,7 @@ class MutualFundDataFetcher:
                     
                 except Exception as e:
                     logger.warning(f"Error fetching data for {symbol}: {e}")
+                    FETCH_ERRORS.inc('yahoo_finance')
                     continue
             
             logger.info(f"Successfully fetched Yahoo Finance data for {len(data)} funds")
@@ -99,6 +122,7 @@ class MutualFundDataFetcher:
             
         except Exception as e:
             logger.error(f"Error fetching Yahoo Finance data: {e}")
+            FETCH_ERRORS.inc('yahoo_finance')
             return {}
     
     def _parse_amfi_nav_data(self, nav_text: str) -> Dict[str, Any]:
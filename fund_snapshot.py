@@ -0,0 +1,294 @@
+import os
+import json
+import zlib
+import struct
+import hashlib
+import numpy as np
+from typing import Dict, List, Any
+
+TRADING_DAYS = 252
+
+# Binary snapshot layout: magic, format version and header length, a JSON
+# header describing every array, then the arrays themselves, each aligned so
+# they can be used in place from a read-only memory map
+SNAPSHOT_MAGIC = b'MFSNAP\x00\x00'
+SNAPSHOT_FORMAT_VERSION = 1
+SNAPSHOT_ALIGNMENT = 64
+
+# Market-wide crash and rebound windows baked into the sample NAV history so
+# that drawdown and stress analysis has realistic episodes to work with
+SAMPLE_MARKET_SHOCKS = [
+    {'start': '2008-01-14', 'end': '2009-03-09', 'total_return': -0.55},
+    {'start': '2009-03-10', 'end': '2009-12-31', 'total_return': 0.80},
+    {'start': '2020-02-20', 'end': '2020-03-23', 'total_return': -0.38},
+    {'start': '2020-03-24', 'end': '2020-12-31', 'total_return': 0.75},
+]
+
+
+class SnapshotFormatError(ValueError):
+    """Raised when a file is not a snapshot in the current binary format"""
+
+
+def _aligned(offset: int) -> int:
+    return -(-offset // SNAPSHOT_ALIGNMENT) * SNAPSHOT_ALIGNMENT
+
+
+class FundSnapshot:
+    """Column-oriented view of the fund universe and its NAV history.
+
+    Funds are stored as columns of a (dates x funds) NAV matrix so that
+    analytics over the whole universe can be computed with array operations.
+    Per-fund scores and the rankings they induce within each category are
+    computed once when the snapshot is built. A snapshot can be saved to a
+    versioned binary file and loaded back as read-only memory-mapped arrays,
+    so startup does not grow with the universe and forked workers share the
+    same pages.
+    """
+
+    def __init__(self, fund_ids: List[str], categories: List[str], nav_dates: np.ndarray, nav_matrix: np.ndarray,
+                 fund_records: List[Dict[str, Any]] = None, scores: Dict[str, Any] = None, metadata: Dict[str, Any] = None):
+        self.fund_ids = list(fund_ids)
+        self.categories = list(categories)
+        self.fund_index = {fund_id: i for i, fund_id in enumerate(self.fund_ids)}
+        self.fund_records = list(fund_records or [])
+        self.metadata = dict(metadata or {})
+        self.nav_dates = nav_dates
+        self.nav_matrix = nav_matrix
+        self.scores = {name: np.asarray(values, dtype=float) for name, values in (scores or {}).items()}
+        self.snapshot_id = self._compute_snapshot_id()
+        self.drawdowns = self._compute_drawdowns()
+        self.category_slices, self.rankings = self._compute_rankings()
+
+    @classmethod
+    def from_sample_data(cls, fund_data: Dict[str, List[Dict]], start_date: str = '2007-01-01',
+                         end_date: str = '2025-06-30', scores: Dict[str, List[float]] = None,
+                         metadata: Dict[str, Any] = None) -> 'FundSnapshot':
+        """Build a snapshot with synthetic daily NAV history for the sample funds.
+
+        `scores` maps a score name to one value per fund, in `fund_data` order.
+        """
+        days = np.arange(np.datetime64(start_date, 'D'), np.datetime64(end_date, 'D') + np.timedelta64(1, 'D'), dtype='datetime64[D]')
+        nav_dates = days[np.is_busday(days)]
+        market_returns = cls._sample_market_returns(nav_dates)
+        market_vol = 0.16
+
+        fund_ids, categories, records, columns = [], [], [], []
+        for category, funds in fund_data.items():
+            for fund in funds:
+                # One-factor model: fund = alpha + beta * market + idiosyncratic noise
+                rng = np.random.default_rng(zlib.crc32(fund['id'].encode()))
+                beta = fund.get('beta', 1.0)
+                total_vol = fund.get('std_dev', 15.0) / 100
+                idio_vol = np.sqrt(max(total_vol ** 2 - (beta * market_vol) ** 2, 0.02 ** 2))
+                drift = (fund.get('sip_10yr_return', 12.0) - beta * 12.0) / 100 / TRADING_DAYS
+                noise = rng.normal(0.0, idio_vol / np.sqrt(TRADING_DAYS), len(nav_dates))
+                log_returns = drift + beta * market_returns + noise
+
+                # Anchor the series so it ends at the fund's current NAV
+                path = np.cumsum(log_returns)
+                columns.append(fund.get('nav', 10.0) * np.exp(path - path[-1]))
+                fund_ids.append(fund['id'])
+                categories.append(category)
+                records.append(fund)
+
+        nav_matrix = np.column_stack(columns) if columns else np.empty((len(nav_dates), 0))
+        return cls(fund_ids, categories, nav_dates, nav_matrix, records, scores, metadata)
+
+    def save(self, path: str):
+        """Write the snapshot to `path` atomically in the binary snapshot format"""
+        arrays = {'nav_dates': self.nav_dates, 'nav_matrix': self.nav_matrix}
+        arrays.update({f'drawdown.{name}': values for name, values in self.drawdowns.items()})
+        arrays.update({f'score.{name}': values for name, values in self.scores.items()})
+        arrays.update({f'ranking.{name}': values for name, values in self.rankings.items()})
+
+        layout, offset = {}, 0
+        for name, array in arrays.items():
+            arrays[name] = array = np.ascontiguousarray(array)
+            layout[name] = {'offset': offset, 'dtype': array.dtype.str, 'shape': list(array.shape)}
+            offset = _aligned(offset + array.nbytes)
+
+        header = json.dumps({
+            'snapshot_id': self.snapshot_id,
+            'fund_ids': self.fund_ids,
+            'categories': self.categories,
+            'fund_records': self.fund_records,
+            'metadata': self.metadata,
+            'category_slices': self.category_slices,
+            'arrays': layout
+        }).encode()
+        data_start = _aligned(len(SNAPSHOT_MAGIC) + 8 + len(header))
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            with open(temp_path, 'wb') as f:
+                f.write(SNAPSHOT_MAGIC + struct.pack('<II', SNAPSHOT_FORMAT_VERSION, len(header)) + header)
+                for name, array in arrays.items():
+                    f.seek(data_start + layout[name]['offset'])
+                    f.write(array.tobytes())
+            # Readers either see the previous file or the complete new one
+            os.replace(temp_path, path)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+    @classmethod
+    def load(cls, path: str) -> 'FundSnapshot':
+        """Load a saved snapshot; arrays are read-only views of a memory map of the file"""
+        with open(path, 'rb') as f:
+            prefix = f.read(len(SNAPSHOT_MAGIC) + 8)
+            if len(prefix) < len(SNAPSHOT_MAGIC) + 8 or not prefix.startswith(SNAPSHOT_MAGIC):
+                raise SnapshotFormatError(f"{path} is not a fund snapshot")
+            version, header_length = struct.unpack('<II', prefix[len(SNAPSHOT_MAGIC):])
+            if version != SNAPSHOT_FORMAT_VERSION:
+                raise SnapshotFormatError(f"{path} has snapshot format {version}, expected {SNAPSHOT_FORMAT_VERSION}")
+            header = json.loads(f.read(header_length))
+
+        data = np.memmap(path, dtype=np.uint8, mode='r')
+        data_start = _aligned(len(prefix) + header_length)
+        arrays = {}
+        for name, layout in header['arrays'].items():
+            dtype = np.dtype(layout['dtype'])
+            start = data_start + layout['offset']
+            stop = start + dtype.itemsize * int(np.prod(layout['shape']))
+            if stop > len(data):
+                raise SnapshotFormatError(f"{path} is truncated")
+            arrays[name] = data[start:stop].view(dtype).reshape(layout['shape'])
+
+        def group(prefix: str) -> Dict[str, np.ndarray]:
+            return {name[len(prefix):]: array for name, array in arrays.items() if name.startswith(prefix)}
+
+        snapshot = cls.__new__(cls)
+        snapshot.fund_ids = header['fund_ids']
+        snapshot.categories = header['categories']
+        snapshot.fund_index = {fund_id: i for i, fund_id in enumerate(snapshot.fund_ids)}
+        snapshot.fund_records = header['fund_records']
+        snapshot.metadata = header['metadata']
+        snapshot.nav_dates = arrays['nav_dates']
+        snapshot.nav_matrix = arrays['nav_matrix']
+        snapshot.scores = group('score.')
+        snapshot.snapshot_id = header['snapshot_id']
+        snapshot.drawdowns = group('drawdown.')
+        snapshot.category_slices = {category: tuple(bounds) for category, bounds in header['category_slices'].items()}
+        snapshot.rankings = group('ranking.')
+        return snapshot
+
+    @staticmethod
+    def _sample_market_returns(nav_dates: np.ndarray) -> np.ndarray:
+        """Daily log returns of a synthetic equity market factor"""
+        rng = np.random.default_rng(0)
+        returns = rng.normal(0.12 / TRADING_DAYS, 0.16 / np.sqrt(TRADING_DAYS), len(nav_dates))
+
+        for shock in SAMPLE_MARKET_SHOCKS:
+            window = (nav_dates >= np.datetime64(shock['start'])) & (nav_dates <= np.datetime64(shock['end']))
+            days = int(window.sum())
+            if days:
+                # Replace the drift inside the window so the window compounds to the shock
+                returns[window] += np.log1p(shock['total_return']) / days - returns[window].mean()
+
+        return returns
+
+    def _compute_snapshot_id(self) -> str:
+        """Content hash identifying this snapshot, used as a cache key"""
+        digest = hashlib.sha1()
+        digest.update('|'.join(self.fund_ids).encode())
+        digest.update(np.ascontiguousarray(self.nav_dates).tobytes())
+        digest.update(np.ascontiguousarray(self.nav_matrix).tobytes())
+        return digest.hexdigest()[:16]
+
+    def _compute_drawdowns(self) -> Dict[str, np.ndarray]:
+        """Drawdown and recovery metrics for every fund in one pass over the NAV matrix"""
+        navs = self.nav_matrix
+        n_dates, n_funds = navs.shape
+        if n_dates == 0 or n_funds == 0:
+            return {}
+
+        running_peak = np.maximum.accumulate(navs, axis=0)
+        drawdown = navs / running_peak - 1
+        at_peak = drawdown >= 0
+        rows = np.arange(n_dates)[:, None]
+        cols = np.arange(n_funds)
+
+        # Index of the latest peak at or before each date, and of the next peak after it
+        last_peak = np.maximum.accumulate(np.where(at_peak, rows, 0), axis=0)
+        next_peak = np.minimum.accumulate(np.where(at_peak, rows, n_dates)[::-1], axis=0)[::-1]
+
+        trough = drawdown.argmin(axis=0)
+        recovery = next_peak[trough, cols]
+        recovered = recovery < n_dates
+
+        # Calendar days spent below a previous peak, and trough-to-recovery time
+        day_numbers = self.nav_dates.astype('datetime64[D]').astype(np.int64)
+        underwater_days = day_numbers[:, None] - day_numbers[last_peak]
+        recovery_days = np.where(recovered, day_numbers[np.minimum(recovery, n_dates - 1)] - day_numbers[trough], -1)
+
+        years = max((day_numbers[-1] - day_numbers[0]) / 365.25, 1 / 365.25)
+        cagr = (navs[-1] / navs[0]) ** (1 / years) - 1
+        max_drawdown = drawdown[trough, cols]
+
+        return {
+            'max_drawdown': max_drawdown * 100,
+            'current_drawdown': drawdown[-1] * 100,
+            'peak_date': self.nav_dates[last_peak[trough, cols]],
+            'trough_date': self.nav_dates[trough],
+            'max_drawdown_duration_days': underwater_days.max(axis=0),
+            'recovery_days': recovery_days,
+            'calmar_ratio': np.divide(cagr, -max_drawdown, out=np.full(n_funds, np.nan), where=max_drawdown < 0)
+        }
+
+    def _compute_rankings(self):
+        """Fund indexes grouped by category and ordered from best to worst on each score"""
+        codes = {}
+        category_codes = np.array([codes.setdefault(category, len(codes)) for category in self.categories], dtype=np.intp)
+        bounds = np.concatenate([[0], np.cumsum(np.bincount(category_codes, minlength=len(codes)))]).tolist()
+        category_slices = {category: (bounds[code], bounds[code + 1]) for category, code in codes.items()}
+
+        # lexsort is stable, so funds with equal scores keep their universe order
+        rankings = {name: np.lexsort((-values, category_codes)) for name, values in self.scores.items()}
+        return category_slices, rankings
+
+    def ranked(self, score: str, category: str) -> np.ndarray:
+        """Indexes of the funds in `category`, best `score` first"""
+        start, stop = self.category_slices.get(category, (0, 0))
+        return self.rankings[score][start:stop]
+
+    def records_by_category(self) -> Dict[str, List[Dict[str, Any]]]:
+        """Fund attribute records grouped by category, in universe order"""
+        grouped = {}
+        for category, record in zip(self.categories, self.fund_records):
+            grouped.setdefault(category, []).append(record)
+        return grouped
+
+    def drawdown_for(self, fund_id: str) -> Dict[str, Any]:
+        """Precomputed drawdown metrics for a single fund"""
+        i = self.fund_index.get(fund_id)
+        if i is None or not self.drawdowns:
+            return {}
+
+        recovery_days = int(self.drawdowns['recovery_days'][i])
+        calmar_ratio = float(self.drawdowns['calmar_ratio'][i])
+        return {
+            'max_drawdown': round(float(self.drawdowns['max_drawdown'][i]), 2),
+            'current_drawdown': round(float(self.drawdowns['current_drawdown'][i]), 2),
+            'peak_date': str(self.drawdowns['peak_date'][i]),
+            'trough_date': str(self.drawdowns['trough_date'][i]),
+            'max_drawdown_duration_days': int(self.drawdowns['max_drawdown_duration_days'][i]),
+            'recovery_days': recovery_days if recovery_days >= 0 else None,
+            'calmar_ratio': round(calmar_ratio, 3) if np.isfinite(calmar_ratio) else None
+        }
+
+    def columns_for(self, fund_ids: List[str]) -> np.ndarray:
+        """Column indexes for the given fund ids"""
+        return np.array([self.fund_index[fund_id] for fund_id in fund_ids], dtype=np.intp)
+
+    def nav_for(self, fund_ids: List[str], lookback_days: int = None) -> np.ndarray:
+        """NAV history (dates x funds) for the given fund ids"""
+        navs = self.nav_matrix[:, self.columns_for(fund_ids)]
+        if lookback_days:
+            navs = navs[-(lookback_days + 1):]
+        return navs
+
+    def log_returns_for(self, fund_ids: List[str], lookback_days: int = None) -> np.ndarray:
+        """Daily log returns (dates x funds) for the given fund ids"""
+        return np.diff(np.log(self.nav_for(fund_ids, lookback_days)), axis=0)
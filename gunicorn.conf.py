@@ -0,0 +1,80 @@
+"""
+Gunicorn settings for production serving.
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+The app (with its fund snapshot, analytics caches and LLM client settings) is
+imported once in the master and forked into every worker. Each worker runs
+a pool of threads because requests mostly wait on the LLM API rather than
+use the CPU.
+"""
+
+import gc
+import os
+import shutil
+import tempfile
+import multiprocessing
+
+bind = f"0.0.0.0:{os.getenv('PORT', '5000')}"
+
+# Import the app before forking so workers share its memory copy-on-write
+preload_app = True
+
+# Threads serve the I/O-bound LLM calls; workers add CPU parallelism for the analytics
+worker_class = 'gthread'
+workers = int(os.getenv('WEB_CONCURRENCY', min(multiprocessing.cpu_count() + 1, 8)))
+threads = int(os.getenv('GUNICORN_THREADS', 16))
+
+# Inline analyses can legitimately take as long as the LLM deadline plus the analytics
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 60))
+graceful_timeout = 30
+keepalive = 5
+
+accesslog = '-'
+errorlog = '-'
+loglevel = os.getenv('GUNICORN_LOG_LEVEL', 'info')
+
+# Workers write their metric totals here and /metrics merges them
+os.environ.setdefault('METRICS_DIR', os.path.join(tempfile.gettempdir(), f"mf_metrics_{os.getenv('PORT', '5000')}"))
+
+# Per-client rate limits and load shedding are on in production serving
+os.environ.setdefault('RATE_LIMIT_ENABLED', '1')
+
+# Collections during the preload would free memory in pages the workers then
+# write new objects into; the collector is re-enabled once the app is frozen.
+# A SIGHUP reload runs this file again without preloading or when_ready, so
+# on_reload and post_fork turn the collector back on.
+gc.disable()
+
+
+def on_starting(server):
+    """Start the metrics from zero; files left by a previous run would be merged into the totals"""
+    shutil.rmtree(os.environ['METRICS_DIR'], ignore_errors=True)
+
+
+def when_ready(server):
+    """Freeze everything the preloaded app allocated before the first fork.
+
+    Frozen objects move to a permanent generation the collector never scans,
+    so it does not write to their headers and the pages stay shared between
+    the master and every worker.
+    """
+    gc.freeze()
+    gc.enable()
+    server.log.info(f"Froze {gc.get_freeze_count()} objects before forking {server.num_workers} workers")
+
+
+def on_reload(server):
+    """The reloaded config disabled the collector again; nothing is preloaded this time"""
+    gc.enable()
+
+
+def post_fork(server, worker):
+    """Every worker runs with the collector on, whenever it was forked"""
+    gc.enable()
+
+
+def worker_exit(server, worker):
+    """Write the exiting worker's final metric totals; its file keeps counting towards /metrics"""
+    import metrics
+    metrics.REGISTRY.flush()
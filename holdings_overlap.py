@@ -0,0 +1,199 @@
+import os
+import zlib
+import logging
+import numpy as np
+from typing import Dict, List, Any, Iterable, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Column names used for the same field across AMC monthly portfolio disclosures
+FUND_COLUMNS = ['fund_id', 'scheme_code', 'scheme', 'fund']
+SECURITY_COLUMNS = ['isin', 'security_id', 'security', 'name of the instrument', 'instrument', 'company']
+WEIGHT_COLUMNS = ['weight', '% to net assets', '% to nav', '% of net assets', 'percentage to nav']
+
+DISCLOSURE_EXTENSIONS = ('.csv', '.xlsx', '.xls')
+
+# Size of each market-cap bucket and how many stocks each sample category holds from it
+SAMPLE_SECURITY_UNIVERSE = {'LC': 100, 'MC': 150, 'SC': 250}
+SAMPLE_CATEGORY_HOLDINGS = {
+    'large_cap': {'LC': 40},
+    'mid_cap': {'LC': 8, 'MC': 42},
+    'small_cap': {'MC': 10, 'SC': 60},
+    'flexi_cap': {'LC': 25, 'MC': 15, 'SC': 10},
+    'multi_cap': {'LC': 20, 'MC': 20, 'SC': 20}
+}
+
+
+class HoldingsOverlap:
+    """Funds x securities holding weights and the pairwise overlap between funds.
+
+    Holdings are kept as a sparse matrix with one row per fund. Pairwise
+    overlap for the whole universe is two sparse matrix products computed
+    once per snapshot; overlap among any set of funds is then a submatrix
+    lookup.
+    """
+
+    def __init__(self, fund_ids: List[str], security_ids: List[str], weights: 'sparse.spmatrix'):
+        # scipy is slow to import; only load it once holdings are actually built
+        from scipy import sparse
+
+        self.fund_ids = list(fund_ids)
+        self.fund_index = {fund_id: i for i, fund_id in enumerate(self.fund_ids)}
+        self.security_ids = list(security_ids)
+
+        # Normalize each fund's disclosed holdings to sum to one
+        weights = sparse.csr_matrix(weights, dtype=float)
+        totals = np.asarray(weights.sum(axis=1)).ravel()
+        scale = np.divide(1.0, totals, out=np.zeros_like(totals), where=totals > 0)
+        self.weights = sparse.diags(scale) @ weights
+
+        # Number of securities held in common, and weight overlap measured as the
+        # Bhattacharyya coefficient sum(sqrt(w_i * w_j)): 1 for identical portfolios
+        held = (self.weights > 0).astype(float)
+        root_weights = self.weights.sqrt()
+        self.common_holdings = (held @ held.T).toarray().astype(int)
+        self.overlap_matrix = np.clip((root_weights @ root_weights.T).toarray(), 0.0, 1.0)
+
+    @classmethod
+    def from_records(cls, fund_ids: List[str], records: 'pd.DataFrame') -> 'HoldingsOverlap':
+        """Build from long-format records with fund_id, security_id and weight columns"""
+        return cls.from_tuples(fund_ids, zip(records['fund_id'], records['security_id'], records['weight']))
+
+    @classmethod
+    def from_tuples(cls, fund_ids: List[str], holdings: Iterable[Tuple[str, str, float]]) -> 'HoldingsOverlap':
+        """Build from (fund_id, security_id, weight) tuples; repeated pairs are summed"""
+        from scipy import sparse
+
+        fund_index = {fund_id: i for i, fund_id in enumerate(fund_ids)}
+        holdings = [(fund_id, security_id, weight) for fund_id, security_id, weight in holdings if fund_id in fund_index]
+
+        security_ids = sorted({security_id for _, security_id, _ in holdings})
+        security_index = {security_id: j for j, security_id in enumerate(security_ids)}
+        rows = np.array([fund_index[fund_id] for fund_id, _, _ in holdings], dtype=int)
+        cols = np.array([security_index[security_id] for _, security_id, _ in holdings], dtype=int)
+        weights = np.array([weight for _, _, weight in holdings], dtype=float)
+        # Converting to CSR (in __init__) sums duplicate entries
+        matrix = sparse.coo_matrix((weights, (rows, cols)), shape=(len(fund_ids), len(security_ids)))
+        return cls(fund_ids, security_ids, matrix)
+
+    @classmethod
+    def from_disclosure_files(cls, fund_ids: List[str], directory: str) -> 'HoldingsOverlap':
+        """Ingest monthly portfolio disclosure files (CSV/Excel) from a directory.
+
+        Files with a fund column may hold several schemes; otherwise the file
+        name (without extension) is taken as the fund id.
+        """
+        import pandas as pd
+
+        frames = []
+        for file_name in sorted(os.listdir(directory)):
+            if not file_name.lower().endswith(DISCLOSURE_EXTENSIONS):
+                continue
+            try:
+                frame = cls.read_disclosure(os.path.join(directory, file_name))
+                if 'fund_id' not in frame:
+                    frame['fund_id'] = os.path.splitext(file_name)[0]
+                frames.append(frame)
+            except Exception as e:
+                logger.warning(f"Skipping disclosure file {file_name}: {e}")
+
+        records = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=['fund_id', 'security_id', 'weight'])
+        logger.info(f"Loaded {len(records)} holdings from {len(frames)} disclosure files")
+        return cls.from_records(fund_ids, records)
+
+    @staticmethod
+    def read_disclosure(path: str) -> 'pd.DataFrame':
+        """Read one disclosure file into fund_id/security_id/weight columns"""
+        import pandas as pd
+
+        if path.lower().endswith('.csv'):
+            frame = pd.read_csv(path)
+        else:
+            frame = pd.read_excel(path)
+        frame.columns = [str(column).strip().lower() for column in frame.columns]
+
+        def find_column(aliases, required=True):
+            for alias in aliases:
+                if alias in frame.columns:
+                    return alias
+            if required:
+                raise ValueError(f"None of the columns {aliases} found")
+            return None
+
+        fund_column = find_column(FUND_COLUMNS, required=False)
+        security_column = find_column(SECURITY_COLUMNS)
+        weight_column = find_column(WEIGHT_COLUMNS)
+
+        # Weights are often published as strings such as '5.23%'
+        weights = pd.to_numeric(frame[weight_column].astype(str).str.rstrip('%').str.strip(), errors='coerce')
+        result = pd.DataFrame({
+            'security_id': frame[security_column].astype(str).str.strip(),
+            'weight': weights
+        })
+        if fund_column:
+            result['fund_id'] = frame[fund_column].astype(str).str.strip()
+        return result[(result['weight'] > 0) & (result['security_id'] != 'nan')]
+
+    @classmethod
+    def from_sample_data(cls, fund_ids: List[str], categories: List[str]) -> 'HoldingsOverlap':
+        """Synthetic holdings for the sample funds, with realistic overlap within categories"""
+        records = []
+        for fund_id, category in zip(fund_ids, categories):
+            rng = np.random.default_rng(zlib.crc32(fund_id.encode()))
+            for bucket, count in SAMPLE_CATEGORY_HOLDINGS.get(category, {}).items():
+                universe = SAMPLE_SECURITY_UNIVERSE[bucket]
+                # Popular (higher-ranked) stocks are picked by most funds in a bucket
+                popularity = 1.0 / np.arange(1, universe + 1) ** 0.8
+                picks = rng.choice(universe, size=count, replace=False, p=popularity / popularity.sum())
+                weights = rng.gamma(2.0, 1.0, size=count) * popularity[picks] ** 0.5
+                for pick, weight in zip(picks, weights):
+                    records.append((fund_id, f"{bucket}{pick + 1:03d}", weight))
+
+        return cls.from_tuples(fund_ids, records)
+
+    def has_holdings(self, fund_id: str) -> bool:
+        """Whether any holdings were disclosed for the fund"""
+        i = self.fund_index.get(fund_id)
+        return i is not None and self.weights.indptr[i + 1] > self.weights.indptr[i]
+
+    def overlap_for(self, fund_ids: List[str]) -> np.ndarray:
+        """Pairwise weight overlap among the given funds"""
+        idx = [self.fund_index[fund_id] for fund_id in fund_ids]
+        return self.overlap_matrix[np.ix_(idx, idx)]
+
+    def portfolio_overlap(self, fund_weights: Dict[str, float]) -> Dict[str, Any]:
+        """Overlap-based diversification metrics for a weighted set of funds"""
+        fund_ids = [fund_id for fund_id, w in fund_weights.items() if w > 0 and self.has_holdings(fund_id)]
+        if len(fund_ids) < 2:
+            return {}
+
+        w = np.array([fund_weights[fund_id] for fund_id in fund_ids], dtype=float)
+        w = w / w.sum()
+        idx = [self.fund_index[fund_id] for fund_id in fund_ids]
+        overlap = self.overlap_matrix[np.ix_(idx, idx)]
+        common = self.common_holdings[np.ix_(idx, idx)]
+
+        # Weight-averaged overlap across distinct pairs of funds
+        pair_weights = np.outer(w, w)
+        np.fill_diagonal(pair_weights, 0)
+        average_overlap = float((pair_weights * overlap).sum() / pair_weights.sum())
+
+        # Look-through security weights give the effective number of distinct holdings
+        security_weights = self.weights[idx].T @ w
+        effective_holdings = 1.0 / float(np.sum(security_weights ** 2))
+
+        upper = np.triu_indices(len(fund_ids), k=1)
+        worst = int(np.argmax(overlap[upper]))
+        i, j = upper[0][worst], upper[1][worst]
+
+        return {
+            'average_overlap': round(average_overlap * 100, 1),
+            'overlap_score': round((1 - average_overlap) * 100, 1),
+            'effective_holdings': round(effective_holdings, 1),
+            'distinct_holdings': int(np.count_nonzero(security_weights)),
+            'most_overlapping_pair': {
+                'funds': [fund_ids[i], fund_ids[j]],
+                'overlap': round(float(overlap[i, j]) * 100, 1),
+                'common_holdings': int(common[i, j])
+            }
+        }
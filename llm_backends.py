@@ -0,0 +1,230 @@
+import os
+import json
+import math
+import time
+import random
+import asyncio
+import hashlib
+import threading
+from typing import Dict, Any, Iterator
+
+MODEL_NAME = 'gemini-pro'
+MAX_OUTPUT_TOKENS = 1500
+TEMPERATURE = 0.7
+
+
+class LLMBackend:
+    """Text generation service behind LLMRecommender.
+
+    `generate` returns the whole response text and `stream` yields it in
+    pieces; both must give up (raising) once `timeout` seconds have passed.
+    Select the implementation with LLM_BACKEND: gemini (default), fake or http.
+    """
+
+    name = 'llm'
+
+    @classmethod
+    def from_env(cls) -> 'LLMBackend':
+        """Build the backend named by LLM_BACKEND"""
+        backends = {'gemini': GeminiBackend, 'fake': FakeBackend, 'http': HTTPBackend}
+        choice = os.getenv('LLM_BACKEND', 'gemini').lower()
+        if choice not in backends:
+            raise ValueError(f"Unknown LLM_BACKEND {choice!r}; expected one of {', '.join(backends)}")
+        return backends[choice].from_env()
+
+    def generate(self, prompt: str, timeout: float) -> str:
+        raise NotImplementedError
+
+    def stream(self, prompt: str, timeout: float) -> Iterator[str]:
+        yield self.generate(prompt, timeout)
+
+    async def agenerate(self, prompt: str, timeout: float) -> str:
+        """Awaitable `generate`; backends without a native async client use a thread"""
+        return await asyncio.to_thread(self.generate, prompt, timeout)
+
+    def cache_params(self) -> Dict[str, Any]:
+        """Parameters that affect the output, so responses from different backends never share a cache key"""
+        return {'model': self.name}
+
+
+class GeminiBackend(LLMBackend):
+    """Google Gemini through the google-generativeai SDK"""
+
+    def __init__(self, api_key: str = None, model_name: str = MODEL_NAME,
+                 max_output_tokens: int = MAX_OUTPUT_TOKENS, temperature: float = TEMPERATURE):
+        self.name = model_name
+        self.api_key = api_key
+        self.max_output_tokens = max_output_tokens
+        self.temperature = temperature
+        self._model = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> 'GeminiBackend':
+        return cls(api_key=os.getenv('GOOGLE_API_KEY'))
+
+    def _get_model(self):
+        # The SDK is slow to import, so only load it once a call is made
+        with self._lock:
+            if self._model is None:
+                import google.generativeai as genai
+                genai.configure(api_key=self.api_key)
+                self._model = genai.GenerativeModel(self.name)
+                self._generation_config = genai.types.GenerationConfig(
+                    max_output_tokens=self.max_output_tokens,
+                    temperature=self.temperature
+                )
+            return self._model
+
+    def _request(self, prompt: str, timeout: float, stream: bool):
+        model = self._get_model()
+        # No SDK-level retries: its retry loop would run far past our deadline
+        return model.generate_content(
+            prompt,
+            generation_config=self._generation_config,
+            stream=stream,
+            request_options={'timeout': timeout, 'retry': None}
+        )
+
+    def generate(self, prompt: str, timeout: float) -> str:
+        return self._request(prompt, timeout, stream=False).text
+
+    async def agenerate(self, prompt: str, timeout: float) -> str:
+        model = self._get_model()
+        response = await model.generate_content_async(
+            prompt,
+            generation_config=self._generation_config,
+            request_options={'timeout': timeout, 'retry': None}
+        )
+        return response.text
+
+    def stream(self, prompt: str, timeout: float) -> Iterator[str]:
+        for chunk in self._request(prompt, timeout, stream=True):
+            if chunk.text:
+                yield chunk.text
+
+    def cache_params(self) -> Dict[str, Any]:
+        return {'model': self.name, 'max_output_tokens': self.max_output_tokens, 'temperature': self.temperature}
+
+
+class FakeBackend(LLMBackend):
+    """Local stand-in for load tests and benchmarks; never touches the network.
+
+    Latency is lognormal around `latency_median` seconds with spread
+    `latency_sigma`, and a call fails with ConnectionError at `error_rate`.
+    With a `seed`, the sequence of latencies and failures is reproducible.
+    Responses are deterministic per prompt and use the headings the analysis
+    prompt asks for. Streams split the response into `chunks` pieces with
+    the latency spread evenly across them.
+    """
+
+    name = 'fake'
+
+    def __init__(self, latency_median: float = 0.5, latency_sigma: float = 0.5, error_rate: float = 0.0,
+                 seed: int = None, chunks: int = 8):
+        self.latency_median = latency_median
+        self.latency_sigma = latency_sigma
+        self.error_rate = error_rate
+        self.chunks = max(chunks, 1)
+        self.calls = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> 'FakeBackend':
+        seed = os.getenv('FAKE_LLM_SEED')
+        return cls(
+            latency_median=float(os.getenv('FAKE_LLM_LATENCY_MEDIAN', 0.5)),
+            latency_sigma=float(os.getenv('FAKE_LLM_LATENCY_SIGMA', 0.5)),
+            error_rate=float(os.getenv('FAKE_LLM_ERROR_RATE', 0)),
+            seed=int(seed) if seed else None,
+            chunks=int(os.getenv('FAKE_LLM_CHUNKS', 8))
+        )
+
+    def _draw(self):
+        """Latency and failure for the next call"""
+        with self._lock:
+            self.calls += 1
+            latency = 0.0
+            if self.latency_median > 0:
+                latency = self._random.lognormvariate(math.log(self.latency_median), self.latency_sigma)
+            return latency, self._random.random() < self.error_rate
+
+    @staticmethod
+    def _wait(seconds: float, timeout: float):
+        """Sleep like a slow upstream would, giving up at the timeout like the real client"""
+        if seconds > timeout:
+            time.sleep(max(timeout, 0))
+            raise TimeoutError("Fake LLM call exceeded its timeout")
+        time.sleep(seconds)
+
+    @staticmethod
+    def response_for(prompt: str) -> str:
+        """The fixed answer for a prompt"""
+        tag = hashlib.sha256(prompt.encode()).hexdigest()[:8]
+        return (
+            f"1. **Executive Summary**: A diversified equity portfolio built for long-term growth (ref {tag}).\n\n"
+            "2. **Risk Assessment**: Moderate risk overall, with small-cap exposure adding volatility.\n\n"
+            "3. **Portfolio Analysis**: Spread across market-cap categories with reasonable expense ratios.\n\n"
+            "4. **Investment Strategy**: We recommend investing through a monthly SIP and rebalancing yearly.\n\n"
+            "5. **Key Insights**: It is important to note that equity returns vary widely year to year.\n\n"
+            "6. **Risk Warnings**: Past performance does not guarantee future returns."
+        )
+
+    def generate(self, prompt: str, timeout: float) -> str:
+        latency, fail = self._draw()
+        self._wait(latency, timeout)
+        if fail:
+            raise ConnectionError("Fake LLM call failed")
+        return self.response_for(prompt)
+
+    async def agenerate(self, prompt: str, timeout: float) -> str:
+        latency, fail = self._draw()
+        if latency > timeout:
+            await asyncio.sleep(max(timeout, 0))
+            raise TimeoutError("Fake LLM call exceeded its timeout")
+        await asyncio.sleep(latency)
+        if fail:
+            raise ConnectionError("Fake LLM call failed")
+        return self.response_for(prompt)
+
+    def stream(self, prompt: str, timeout: float) -> Iterator[str]:
+        latency, fail = self._draw()
+        text = self.response_for(prompt)
+        size = math.ceil(len(text) / self.chunks)
+        started = time.monotonic()
+        for i in range(0, len(text), size):
+            self._wait(latency / self.chunks, timeout - (time.monotonic() - started))
+            if fail:
+                raise ConnectionError("Fake LLM call failed")
+            yield text[i:i + size]
+
+
+class HTTPBackend(LLMBackend):
+    """An LLM service behind a simple JSON API, such as llm_stub_server.py.
+
+    POSTs {"prompt": ..., "stream": ...}. A plain response is {"text": ...};
+    a streamed one is newline-delimited JSON objects of the same shape.
+    """
+
+    def __init__(self, url: str):
+        self.url = url
+        self.name = f'http:{url}'
+
+    @classmethod
+    def from_env(cls) -> 'HTTPBackend':
+        return cls(os.getenv('LLM_HTTP_URL', 'http://127.0.0.1:8081/generate'))
+
+    def generate(self, prompt: str, timeout: float) -> str:
+        import requests
+        response = requests.post(self.url, json={'prompt': prompt, 'stream': False, 'timeout': timeout}, timeout=timeout)
+        response.raise_for_status()
+        return response.json()['text']
+
+    def stream(self, prompt: str, timeout: float) -> Iterator[str]:
+        import requests
+        with requests.post(self.url, json={'prompt': prompt, 'stream': True, 'timeout': timeout}, timeout=timeout, stream=True) as response:
+            response.raise_for_status()
+            for line in response.iter_lines():
+                if line:
+                    yield json.loads(line)['text']
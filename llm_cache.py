@@ -0,0 +1,214 @@
+import os
+import re
+import json
+import time
+import atexit
+import hashlib
+import logging
+import tempfile
+import threading
+from typing import Dict, Any, Optional
+from metrics import CACHE_LOOKUPS
+from sqlite_store import ThreadLocalConnection
+
+logger = logging.getLogger(__name__)
+
+
+class LLMAnalysisCache:
+    """Persistent cache of LLM responses keyed by a hash of the canonical prompt.
+
+    Entries live in a SQLite database so every worker process on the host
+    shares them; SQLite's file locking (in WAL mode) keeps concurrent readers
+    and writers safe. Entries expire after a TTL and the table is bounded in
+    size by evicting the least recently used rows. Every entry records the fund
+    data version it was generated from and is only returned for that version,
+    so workers on different versions (e.g. during a rolling deploy) keep
+    separate rows for the same prompt, and stale rows simply age out.
+
+    Lookups only read. Hit/miss counts and LRU access times are buffered in
+    the process and written in one transaction every FLUSH_LOOKUPS lookups
+    or FLUSH_SECONDS, so cache hits don't contend for SQLite's write lock.
+    """
+
+    # Bumped when the table layout changes; older tables are dropped (it's only a cache)
+    SCHEMA_VERSION = 2
+    FLUSH_LOOKUPS = 100
+    FLUSH_SECONDS = 1.0
+
+    def __init__(self, path: str = None, ttl_seconds: int = 24 * 3600, max_entries: int = 5000):
+        self.path = path or os.path.join(tempfile.gettempdir(), 'mf_llm_cache.sqlite3')
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._connection = ThreadLocalConnection(self.path)
+        self._pending_lock = threading.Lock()
+        self._reset_pending()
+        self._init_schema()
+        # Forked workers inherit this, so each writes its own last lookups on exit
+        atexit.register(self.flush)
+
+    @classmethod
+    def from_env(cls) -> Optional['LLMAnalysisCache']:
+        """Build the cache from environment settings, or None when disabled"""
+        if os.getenv('LLM_CACHE_ENABLED', '1').lower() in ('0', 'false', 'no'):
+            return None
+        try:
+            return cls(
+                path=os.getenv('LLM_CACHE_PATH') or None,
+                ttl_seconds=int(os.getenv('LLM_CACHE_TTL', 24 * 3600)),
+                max_entries=int(os.getenv('LLM_CACHE_MAX_ENTRIES', 5000))
+            )
+        except Exception as e:
+            logger.warning(f"LLM cache disabled: {e}")
+            return None
+
+    def _init_schema(self):
+        connection = self._connection()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            if connection.execute('PRAGMA user_version').fetchone()[0] < self.SCHEMA_VERSION:
+                connection.execute('DROP TABLE IF EXISTS entries')
+                connection.execute(f'PRAGMA user_version = {self.SCHEMA_VERSION}')
+            connection.execute("""
+                CREATE TABLE IF NOT EXISTS entries (
+                    key TEXT NOT NULL,
+                    version TEXT NOT NULL,
+                    value TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    accessed_at REAL NOT NULL,
+                    PRIMARY KEY (key, version)
+                )
+            """)
+            connection.execute('COMMIT')
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+        connection.execute('CREATE INDEX IF NOT EXISTS entries_accessed_at ON entries (accessed_at)')
+        connection.execute('CREATE TABLE IF NOT EXISTS stats (name TEXT PRIMARY KEY, count INTEGER NOT NULL)')
+
+    @staticmethod
+    def canonicalize(prompt: str) -> str:
+        """Normalize whitespace so formatting-only differences map to the same key"""
+        lines = [re.sub(r'[ \t]+', ' ', line).strip() for line in prompt.strip().splitlines()]
+        return re.sub(r'\n{3,}', '\n\n', '\n'.join(lines))
+
+    @classmethod
+    def make_key(cls, prompt: str, **params: Any) -> str:
+        """Cache key for a prompt plus the model parameters that affect the output"""
+        payload = json.dumps({'prompt': cls.canonicalize(prompt), 'params': params}, sort_keys=True)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def get(self, key: str, version: str = '') -> Optional[Any]:
+        """Cached value for a key and data version, or None on a miss or expired entry"""
+        try:
+            now = time.time()
+            connection = self._connection()
+            row = connection.execute(
+                'SELECT value, created_at FROM entries WHERE key = ? AND version = ?', (key, version)
+            ).fetchone()
+
+            if row is None or now - row[1] > self.ttl_seconds:
+                # Expired rows are left for set() to evict
+                self._record('misses')
+                CACHE_LOOKUPS.inc('llm', 'miss')
+                return None
+
+            self._record('hits', (key, version, now))
+            CACHE_LOOKUPS.inc('llm', 'hit')
+            return json.loads(row[0])
+
+        except Exception as e:
+            logger.warning(f"LLM cache read failed: {e}")
+            return None
+
+    def set(self, key: str, value: Any, version: str = ''):
+        """Store a value for a data version, dropping least recently used entries"""
+        try:
+            now = time.time()
+            connection = self._connection()
+            connection.execute(
+                'INSERT OR REPLACE INTO entries (key, version, value, created_at, accessed_at) VALUES (?, ?, ?, ?, ?)',
+                (key, version, json.dumps(value), now, now)
+            )
+
+            connection.execute('DELETE FROM entries WHERE created_at < ?', (now - self.ttl_seconds,))
+            connection.execute("""
+                DELETE FROM entries WHERE rowid IN (
+                    SELECT rowid FROM entries ORDER BY accessed_at DESC LIMIT -1 OFFSET ?
+                )
+            """, (self.max_entries,))
+
+        except Exception as e:
+            logger.warning(f"LLM cache write failed: {e}")
+
+    def invalidate(self, version: str = None):
+        """Drop all entries, or only those not written for the given version"""
+        connection = self._connection()
+        if version is None:
+            connection.execute('DELETE FROM entries')
+        else:
+            connection.execute('DELETE FROM entries WHERE version != ?', (version,))
+
+    def _reset_pending(self):
+        self._pending_counts = {'hits': 0, 'misses': 0}
+        self._pending_access = {}
+        self._pending_pid = os.getpid()
+        self._flushed_at = time.monotonic()
+
+    def _record(self, name: str, access: tuple = None):
+        """Buffer a lookup's count (and a hit's access time), flushing when enough have built up"""
+        with self._pending_lock:
+            if self._pending_pid != os.getpid():
+                # Forked: the parent's buffered lookups are the parent's to write
+                self._reset_pending()
+            self._pending_counts[name] += 1
+            if access is not None:
+                key, version, accessed_at = access
+                self._pending_access[(key, version)] = accessed_at
+            due = (sum(self._pending_counts.values()) >= self.FLUSH_LOOKUPS
+                   or time.monotonic() - self._flushed_at >= self.FLUSH_SECONDS)
+        if due:
+            self.flush()
+
+    def flush(self):
+        """Write buffered hit/miss counts and access times in one transaction"""
+        with self._pending_lock:
+            if self._pending_pid != os.getpid():
+                return
+            counts, accesses = self._pending_counts, self._pending_access
+            self._reset_pending()
+        if not any(counts.values()):
+            return
+        try:
+            connection = self._connection()
+            connection.execute('BEGIN IMMEDIATE')
+            try:
+                connection.executemany(
+                    'UPDATE entries SET accessed_at = MAX(accessed_at, ?) WHERE key = ? AND version = ?',
+                    [(accessed_at, key, version) for (key, version), accessed_at in accesses.items()]
+                )
+                connection.executemany(
+                    'INSERT INTO stats (name, count) VALUES (?, ?) ON CONFLICT(name) DO UPDATE SET count = count + excluded.count',
+                    [(name, count) for name, count in counts.items() if count]
+                )
+                connection.execute('COMMIT')
+            except BaseException:
+                connection.execute('ROLLBACK')
+                raise
+        except Exception as e:
+            logger.warning(f"LLM cache stats write failed: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss counts shared by every process using the cache file"""
+        self.flush()
+        connection = self._connection()
+        counts = dict(connection.execute('SELECT name, count FROM stats').fetchall())
+        entries = connection.execute('SELECT COUNT(*) FROM entries').fetchone()[0]
+        hits, misses = counts.get('hits', 0), counts.get('misses', 0)
+        return {
+            'hits': hits,
+            'misses': misses,
+            'hit_ratio': round(hits / (hits + misses), 4) if hits + misses else 0.0,
+            'entries': entries,
+            'max_entries': self.max_entries,
+            'ttl_seconds': self.ttl_seconds
+        }
@@ -1,151 +1,190 @@
-import google.generativeai as genai
 import os
-from typing import Dict, List, Any
+import re
+import time
+import asyncio
+import hashlib
+import functools
+import logging
+import threading
+from typing import Dict, List, Any, Mapping, Iterator, Tuple
 import json
+from llm_cache import LLMAnalysisCache
+from llm_backends import LLMBackend
+from prompt_builder import PromptBuilder, format_table
+from llm_resilience import CircuitBreaker, LatencyHistogram, LLMConcurrencyLimiter, LLMUnavailableError
+from single_flight import SingleFlight
+from timing import stage, note
+import metrics
+
+logger = logging.getLogger(__name__)
+
+LLM_ANALYSES = metrics.counter('mf_llm_analyses_total', "LLM analyses requested (inline, background or streamed)")
+LLM_OUTCOMES = metrics.counter(
+    'mf_llm_outcomes_total',
+    "LLM call outcomes: success, error, timeout, short_circuited, and fallback for analyses served without the LLM",
+    ('outcome',)
+)
+LLM_CALL_SECONDS = metrics.histogram('mf_llm_call_seconds', "Upstream LLM call latency", ('result',))
+
+# Section key for every heading the model may use (the prompt's headings and the older ones)
+SECTION_HEADINGS = {
+    'EXECUTIVE SUMMARY': 'executive_summary',
+    'RISK ASSESSMENT': 'risk_assessment',
+    'PORTFOLIO ANALYSIS': 'portfolio_analysis',
+    'PORTFOLIO ALLOCATION': 'portfolio_allocation',
+    'FUND SELECTION ANALYSIS': 'fund_analysis',
+    'FUND ANALYSIS': 'fund_analysis',
+    'INVESTMENT STRATEGY': 'investment_strategy',
+    'KEY INSIGHTS': 'key_insights',
+    'RISK WARNINGS': 'risk_warnings',
+    'NEXT STEPS': 'next_steps'
+}
+
+# A heading line: "RISK ASSESSMENT:", "## Risk Assessment", "1. **Risk Assessment**:",
+# "**Risk Assessment:** text". Without a colon the heading must end the line, so
+# prose that merely starts with the words does not split a section. The leading
+# newline (rather than a MULTILINE '^') lets the regex engine skip ahead to line starts.
+SECTION_HEADING_RE = re.compile(
+    r'\n[ \t]*(?:#{1,6}[ \t]*)?(?:\d+[.)][ \t]*)?(?:\*\*|__)?[ \t]*'
+    r'(?P<heading>' + '|'.join(name.replace(' ', r'[ \t]+') for name in sorted(SECTION_HEADINGS, key=len, reverse=True)) + r')'
+    r'[ \t]*(?:\*\*|__)?[ \t]*(?::[ \t]*(?:\*\*|__)?|(?=[ \t]*(?:\r?\n|\Z)))',
+    re.IGNORECASE
+)
+
+# Per-user values a shared narrative refers to; filled in locally after generation
+NARRATIVE_PLACEHOLDER_RE = re.compile(r'\{(name|age|annual_income|investment_amount|monthly_sip|investment_horizon)\}')
+NARRATIVE_PLACEHOLDER_MAX_LEN = len('{investment_horizon}')
+
+# Matched against lowercased lines: much faster than an IGNORECASE alternation
+INSIGHT_RE = re.compile(r'important to note|key consideration|recommend|suggest|consider|highlight|crucial|essential')
 
 class LLMRecommender:
-    def __init__(self):
-        genai.configure(api_key=os.getenv('GOOGLE_API_KEY'))
-        self.model = genai.GenerativeModel('gemini-pro')
+    def __init__(self, cache: LLMAnalysisCache = None, breaker: CircuitBreaker = None, deadline_seconds: float = None,
+                 single_flight: SingleFlight = None, limiter: LLMConcurrencyLimiter = None,
+                 prompt_token_budget: int = None, backend: LLMBackend = None, narrative_templates: bool = None):
+        # Gemini by default; LLM_BACKEND=fake or http for offline load tests
+        self.backend = backend or LLMBackend.from_env()
+        
+        # Identical prompts are answered from the shared on-disk cache
+        self.cache = cache if cache is not None else LLMAnalysisCache.from_env()
+        
+        # Concurrent requests for the same prompt share one upstream call
+        self.single_flight = single_flight or SingleFlight.from_env()
+        
+        # Every request gets a time budget for the LLM call; repeated failures
+        # trip the breaker so the fallback is served without waiting on Gemini
+        self.deadline_seconds = deadline_seconds if deadline_seconds is not None else float(os.getenv('LLM_DEADLINE_SECONDS', 10))
+        self.breaker = breaker or CircuitBreaker.from_env()
         
-    def generate_recommendations(self, user_info: Dict[str, Any], fund_data: Dict[str, Any]) -> Dict[str, Any]:
-        """Generate personalized investment recommendations using LLM"""
+        # Caps concurrent upstream calls; excess requests queue briefly or get the fallback
+        self.limiter = limiter or LLMConcurrencyLimiter.from_env()
         
-        # Create a comprehensive prompt for the LLM
-        prompt = self._create_analysis_prompt(user_info, fund_data)
+        # Optional prompt sections are dropped to keep prompts under this estimate (0 disables)
+        self.prompt_token_budget = prompt_token_budget if prompt_token_budget is not None else int(os.getenv('LLM_PROMPT_TOKEN_BUDGET', 2000))
+        self.tokens = {'requests': 0, 'prompt_tokens': 0, 'response_tokens': 0, 'trimmed_prompts': 0}
+        
+        # Narrative templates: the prompt leaves out personal details, so users with the
+        # same portfolio share one cached analysis with their own values filled in
+        if narrative_templates is None:
+            narrative_templates = os.getenv('LLM_NARRATIVE_TEMPLATES', '0').lower() in ('1', 'true', 'yes')
+        self.narrative_templates = narrative_templates
+        self.latency = LatencyHistogram()
+        self._async_flights = {}
+        self.outcomes = {'success': 0, 'error': 0, 'timeout': 0, 'short_circuited': 0, 'fallback': 0}
+        self._outcomes_lock = threading.Lock()
+        
+    def generate_recommendations(self, user_info: Mapping[str, Any], fund_data: Dict[str, Any], deadline: float = None) -> Dict[str, Any]:
+        """Generate personalized investment recommendations using LLM.
+        
+        `deadline` is a time.monotonic() timestamp by which the analysis must be
+        ready; it defaults to LLM_DEADLINE_SECONDS from now.
+        """
+        if deadline is None:
+            deadline = time.monotonic() + self.deadline_seconds
+        LLM_ANALYSES.inc()
         
         try:
-            # Create system prompt and user prompt
-            system_prompt = """You are an expert financial advisor specializing in mutual fund investments in India. 
-            You provide personalized, well-reasoned investment advice based on user profiles and fund data. 
-            Always consider risk tolerance, investment horizon, and financial goals. 
-            Be conservative and emphasize the importance of diversification."""
+            with stage('prompt'):
+                full_prompt, usage = self._create_full_prompt(user_info, fund_data)
             
-            full_prompt = f"{system_prompt}\n\n{prompt}"
+            analysis = self._generate_analysis(full_prompt, fund_data.get('data_version', ''), deadline)
+            with stage('llm_parse'):
+                return self._structure_analysis(analysis, usage, user_info, fund_data)
             
-            response = self.model.generate_content(
-                full_prompt,
-                generation_config=genai.types.GenerationConfig(
-                    max_output_tokens=1500,
-                    temperature=0.7
-                )
-            )
-            
-            analysis = response.text
-            
-            # Parse the analysis into structured format
-            structured_analysis = self._parse_llm_response(analysis, user_info, fund_data)
+        except Exception as e:
+            # Fallback to rule-based recommendations if LLM fails
+            logger.warning(f"Serving fallback analysis: {e}")
+            note('llm_fallback')
+            return self._generate_fallback_recommendations(user_info, fund_data)
+    
+    async def agenerate_recommendations(self, user_info: Mapping[str, Any], fund_data: Dict[str, Any], deadline: float = None) -> Dict[str, Any]:
+        """Async generate_recommendations: the LLM call is awaited instead of blocking a thread"""
+        if deadline is None:
+            deadline = time.monotonic() + self.deadline_seconds
+        LLM_ANALYSES.inc()
+        
+        try:
+            with stage('prompt'):
+                full_prompt, usage = self._create_full_prompt(user_info, fund_data)
             
-            return structured_analysis
+            analysis = await self._agenerate_analysis(full_prompt, fund_data.get('data_version', ''), deadline)
+            with stage('llm_parse'):
+                return self._structure_analysis(analysis, usage, user_info, fund_data)
             
         except Exception as e:
-            # Fallback to rule-based recommendations if LLM fails
+            logger.warning(f"Serving fallback analysis: {e}")
+            note('llm_fallback')
             return self._generate_fallback_recommendations(user_info, fund_data)
     
-    def _create_analysis_prompt(self, user_info: Dict[str, Any], fund_data: Dict[str, Any]) -> str:
-        """Create a comprehensive prompt for LLM analysis"""
-        
-        # Enhanced user profile information
-        user_profile = f"""
-User Profile:
-- Name: {user_info.get('name', 'User')}
-- Age: {user_info.get('age', 0)} years
-- Annual Income: ₹{user_info.get('annual_income', 0):,.0f}
-- Investment Amount: ₹{user_info.get('investment_amount', 0):,.0f}
-- Risk Appetite: {user_info.get('risk_tolerance', 'moderate').title()}
-- Investment Goal: {user_info.get('investment_goal', 'wealth_creation').replace('_', ' ').title()}
-- Investment Horizon: {user_info.get('investment_horizon', '5-10')} years
-- Monthly SIP Budget: ₹{user_info.get('monthly_sip', 0):,.0f}
-- Existing Investments: ₹{user_info.get('existing_investments', 0):,.0f}
-- Tax Bracket: {user_info.get('tax_bracket', 20)}%
-- Emergency Fund: {user_info.get('emergency_fund', 'yes').title()}
-- Fund Type Preference: {user_info.get('fund_type_preference', 'direct').title()}
-- ESG Preference: {user_info.get('esg_preference', 'no_preference').replace('_', ' ').title()}
-- Dividend vs Growth: {user_info.get('dividend_preference', 'growth').title()}
-"""
-
-        # Enhanced fund recommendations
-        fund_recommendations = "Recommended Funds:\n"
-        for category, funds in fund_data.get('recommendations', {}).items():
-            fund_recommendations += f"\n{category.replace('_', ' ').title()}:\n"
-            for i, fund in enumerate(funds, 1):
-                fund_recommendations += f"""
-{i}. {fund['name']}
-   - Fund Manager: {fund['fund_manager']}
-   - AUM: ₹{fund['aum_cr']:,.1f} Cr
-   - Expense Ratio: {fund['expense_ratio']}%
-   - 5Y SIP Return: {fund['sip_5yr_return']}%
-   - 10Y SIP Return: {fund['sip_10yr_return']}%
-   - Alpha: {fund['alpha']}
-   - Beta: {fund['beta']}
-   - Sharpe Ratio: {fund['sharpe_ratio']}
-   - Sortino Ratio: {fund['sortino_ratio']}
-   - ESG Score: {fund.get('esg_score', 'N/A')}/10
-   - Volatility: {fund.get('volatility_rank', 'moderate').title()}
-   - Peer Rank: {fund.get('peer_rank', 'N/A')}
-   - Risk-Adjusted Return: {fund.get('risk_adjusted_return', 'N/A')}%
-   - Diversification Score: {fund.get('diversification_score', 'N/A')}/100
-"""
-
-        # Advanced analysis data
-        advanced_analysis = fund_data.get('advanced_analysis', {})
-        advanced_info = ""
+    def _structure_analysis(self, analysis: str, usage: Dict[str, Any], user_info: Dict[str, Any], fund_data: Dict[str, Any]) -> Dict[str, Any]:
+        """Fill in this user's details and parse the analysis into its structured format"""
+        if self.narrative_templates:
+            analysis = self._fill_placeholders(analysis, user_info)
         
-        if advanced_analysis.get('projections'):
-            proj = advanced_analysis['projections']
-            advanced_info += f"""
-Investment Projections:
-- Monthly SIP: ₹{proj.get('monthly_sip', 0):,.0f}
-- Total Investment: ₹{proj.get('total_investment', 0):,.0f}
-- Projected Value: ₹{proj.get('projected_value', 0):,.0f}
-- Expected Return: {proj.get('expected_return', 0)}%
-- Time Period: {proj.get('time_period', 0)} years
-"""
-
-        if advanced_analysis.get('diversification_score'):
-            div = advanced_analysis['diversification_score']
-            advanced_info += f"""
-Portfolio Diversification:
-- Score: {div.get('score', 0)}/150
-- Categories: {div.get('categories', 0)}
-- Total Funds: {div.get('total_funds', 0)}
-- Assessment: {div.get('assessment', 'N/A')}
-"""
-
-        if advanced_analysis.get('expense_impact'):
-            exp = advanced_analysis['expense_impact']
-            advanced_info += f"""
-Expense Impact Analysis:
-- Average Expense Ratio: {exp.get('average_expense_ratio', 0)}%
-- Total Expense Over Period: ₹{exp.get('total_expense_over_period', 0):,.0f}
-- Potential Savings: ₹{exp.get('potential_savings', 0):,.0f}
-- Assessment: {exp.get('impact_assessment', 'N/A')}
-"""
-
-        if advanced_analysis.get('volatility_analysis'):
-            vol = advanced_analysis['volatility_analysis']
-            advanced_info += f"""
-Volatility Analysis:
-- Volatility Breakdown: Low: {vol.get('volatility_breakdown', {}).get('low', 0)}, Moderate: {vol.get('volatility_breakdown', {}).get('moderate', 0)}, High: {vol.get('volatility_breakdown', {}).get('high', 0)}
-- High Volatility Percentage: {vol.get('high_volatility_percentage', 0):.1f}%
-- Risk Assessment: {vol.get('risk_assessment', 'N/A')}
-"""
-
-        if advanced_analysis.get('risk_warnings'):
-            warnings = advanced_analysis['risk_warnings']
-            advanced_info += f"""
-Risk Warnings:
-{chr(10).join(f"- {warning}" for warning in warnings)}
-"""
-
-        prompt = f"""
-{user_profile}
-
-{fund_recommendations}
-
-{advanced_info}
-
-Please provide a comprehensive analysis including:
+        structured_analysis = self._parse_llm_response(analysis, user_info, fund_data)
+        structured_analysis['usage'] = self._record_usage(usage, analysis)
+        return structured_analysis
+    
+    def stream_recommendations(self, user_info: Mapping[str, Any], fund_data: Dict[str, Any], deadline: float = None) -> Iterator[Dict[str, Any]]:
+        """Yield the LLM analysis as it is generated.
+        
+        Emits {'event': 'chunk', 'data': {'text': ...}} for every piece of text
+        from the model, then a final {'event': 'analysis', 'data': ...} with the
+        same structured result generate_recommendations returns.
+        """
+        if deadline is None:
+            deadline = time.monotonic() + self.deadline_seconds
+        
+        chunks = []
+        LLM_ANALYSES.inc()
+        try:
+            with stage('prompt'):
+                full_prompt, usage = self._create_full_prompt(user_info, fund_data)
+            texts = self._stream_analysis(full_prompt, fund_data.get('data_version', ''), deadline)
+            if self.narrative_templates:
+                texts = self._fill_placeholder_stream(texts, user_info)
+            for text in texts:
+                chunks.append(text)
+                yield {'event': 'chunk', 'data': {'text': text}}
+            
+            analysis = ''.join(chunks)
+            structured_analysis = self._parse_llm_response(analysis, user_info, fund_data)
+            structured_analysis['usage'] = self._record_usage(usage, analysis)
+            yield {'event': 'analysis', 'data': structured_analysis}
+            
+        except Exception as e:
+            logger.error(f"Streaming LLM analysis failed: {e}")
+            note('llm_fallback')
+            yield {'event': 'analysis', 'data': self._generate_fallback_recommendations(user_info, fund_data)}
+    
+    SYSTEM_PROMPT = (
+        "You are an expert financial advisor specializing in mutual fund investments in India. "
+        "You provide personalized, well-reasoned investment advice based on user profiles and fund data. "
+        "Always consider risk tolerance, investment horizon, and financial goals. "
+        "Be conservative and emphasize the importance of diversification."
+    )
+    
+    ANALYSIS_INSTRUCTIONS = """Please provide a comprehensive analysis including:
 
 1. **Executive Summary**: Brief overview of the investment strategy
 2. **Risk Assessment**: Detailed risk analysis considering user's profile and selected funds
@@ -161,24 +200,395 @@ Consider the user's:
 - ESG and dividend preferences
 - Advanced metrics like ESG scores, volatility rankings, and peer comparisons
 
-Provide actionable, personalized advice that helps the user make informed investment decisions.
-"""
-
-        return prompt
+Provide actionable, personalized advice that helps the user make informed investment decisions."""
+    
+    def _create_full_prompt(self, user_info: Dict[str, Any], fund_data: Dict[str, Any]) -> Tuple[str, Dict[str, Any]]:
+        """System instructions followed by the user-specific analysis prompt, with its token usage"""
+        builder = PromptBuilder(self.prompt_token_budget)
+        builder.add('system', self.SYSTEM_PROMPT, required=True)
+        self._add_analysis_sections(builder, user_info, fund_data)
+        return builder.build()
+    
+    @staticmethod
+    def _horizon_bucket(horizon: Any) -> str:
+        """Coarse horizon band used in narrative templates ('5-10 years' -> medium)"""
+        match = re.search(r'\d+', str(horizon))
+        years = int(match.group()) if match else 5
+        if years < 3:
+            return 'short (under 3 years)'
+        if years < 10:
+            return 'medium (3-10 years)'
+        return 'long (10+ years)'
+    
+    def _fill_placeholders(self, text: str, user_info: Dict[str, Any]) -> str:
+        """Replace the narrative placeholders with this user's values; other braces are left alone"""
+        values = {
+            'name': str(user_info.get('name') or 'Investor'),
+            'age': str(user_info.get('age', '')),
+            'annual_income': f"₹{user_info.get('annual_income', 0):,.0f}",
+            'investment_amount': f"₹{user_info.get('investment_amount', 0):,.0f}",
+            'monthly_sip': f"₹{user_info.get('monthly_sip', 0):,.0f}",
+            'investment_horizon': str(user_info.get('investment_horizon', '5-10 years'))
+        }
+        return NARRATIVE_PLACEHOLDER_RE.sub(lambda match: values[match.group(1)], text)
+    
+    def _fill_placeholder_stream(self, texts: Iterator[str], user_info: Dict[str, Any]) -> Iterator[str]:
+        """Fill placeholders in streamed text, holding back a placeholder split across chunks"""
+        pending = ''
+        for text in texts:
+            text = pending + text
+            cut = text.rfind('{')
+            if cut != -1 and '}' not in text[cut:] and len(text) - cut < NARRATIVE_PLACEHOLDER_MAX_LEN:
+                text, pending = text[:cut], text[cut:]
+            else:
+                pending = ''
+            if text:
+                yield self._fill_placeholders(text, user_info)
+        if pending:
+            yield self._fill_placeholders(pending, user_info)
+    
+    def _cache_key(self, full_prompt: str) -> str:
+        return LLMAnalysisCache.make_key(full_prompt, **self.backend.cache_params())
+    
+    def _stream_analysis(self, full_prompt: str, data_version: str = '', deadline: float = None) -> Iterator[str]:
+        """Yield analysis text chunks, replaying a cached analysis as a single chunk"""
+        cache_key = None
+        if self.cache:
+            cache_key = self._cache_key(full_prompt)
+            cached = self.cache.get(cache_key, data_version)
+            if cached is not None:
+                note('llm_cache', 'hit')
+                yield cached
+                return
+        note('llm_cache', 'miss' if self.cache else 'disabled')
+        
+        chunks = []
+        # The slot is held until the stream is drained
+        with self.limiter.slot(deadline):
+            started = time.monotonic()
+            try:
+                for text in self._call_model(full_prompt, deadline, stream=True):
+                    if text:
+                        chunks.append(text)
+                        yield text
+            except LLMUnavailableError:
+                raise
+            except (GeneratorExit, asyncio.CancelledError):
+                # The caller went away before the call finished; free a half-open probe
+                self.breaker.record_abandoned()
+                raise
+            except Exception:
+                self._record_call(started, deadline, failed=True)
+                raise
+            self._record_call(started, deadline)
+        
+        if self.cache:
+            self.cache.set(cache_key, ''.join(chunks), data_version)
+    
+    def _generate_analysis(self, full_prompt: str, data_version: str = '', deadline: float = None) -> str:
+        """Get the LLM analysis text, from the cache when the same prompt was seen before.
+        
+        Concurrent misses for the same prompt (in this process or, through a
+        lock file, in other workers) wait for a single upstream call.
+        """
+        cache_key = self._cache_key(full_prompt)
+        if self.cache:
+            cached = self.cache.get(cache_key, data_version)
+            if cached is not None:
+                note('llm_cache', 'hit')
+                return cached
+        note('llm_cache', 'miss' if self.cache else 'disabled')
+        
+        def generate():
+            with self.limiter.slot(deadline):
+                started = time.monotonic()
+                try:
+                    analysis = self._call_model(full_prompt, deadline)
+                except LLMUnavailableError:
+                    raise
+                except Exception:
+                    self._record_call(started, deadline, failed=True)
+                    raise
+                self._record_call(started, deadline)
+            
+            if self.cache:
+                self.cache.set(cache_key, analysis, data_version)
+            return analysis
+        
+        def recheck():
+            # Another worker may have generated it while we waited for its lock
+            return self.cache.get(cache_key, data_version) if self.cache else None
+        
+        flight_key = hashlib.sha256(f"{cache_key}:{data_version}".encode()).hexdigest()
+        timeout = max(deadline - time.monotonic(), 0) if deadline is not None else None
+        # Includes any wait for a coalesced call or a limiter slot
+        with stage('llm'):
+            return self.single_flight.do(flight_key, generate, recheck, timeout)
+    
+    async def _agenerate_analysis(self, full_prompt: str, data_version: str = '', deadline: float = None) -> str:
+        """Async _generate_analysis; concurrent misses for the same prompt in this process await one call"""
+        if deadline is None:
+            deadline = time.monotonic() + self.deadline_seconds
+        
+        cache_key = self._cache_key(full_prompt)
+        if self.cache:
+            cached = self.cache.get(cache_key, data_version)
+            if cached is not None:
+                note('llm_cache', 'hit')
+                return cached
+        note('llm_cache', 'miss' if self.cache else 'disabled')
+        
+        flight_key = f"{cache_key}:{data_version}"
+        flight = self._async_flights.get(flight_key)
+        if flight is None:
+            flight = asyncio.ensure_future(self._agenerate_uncached(full_prompt, cache_key, data_version, deadline))
+            self._async_flights[flight_key] = flight
+            flight.add_done_callback(functools.partial(self._end_flight, flight_key))
+        
+        # Shielded so a caller giving up at its own deadline does not cancel the shared call
+        with stage('llm'):
+            return await asyncio.wait_for(asyncio.shield(flight), max(deadline - time.monotonic(), 0))
+    
+    def _end_flight(self, flight_key: str, flight: asyncio.Future):
+        self._async_flights.pop(flight_key, None)
+        # Retrieve the outcome so a call every waiter gave up on is not reported as unhandled
+        if not flight.cancelled():
+            flight.exception()
+    
+    async def _agenerate_uncached(self, full_prompt: str, cache_key: str, data_version: str, deadline: float) -> str:
+        async with self.limiter.aslot(deadline):
+            started = time.monotonic()
+            try:
+                remaining = self._admit_call(deadline)
+                analysis = await asyncio.wait_for(self.backend.agenerate(full_prompt, remaining), remaining)
+            except LLMUnavailableError:
+                raise
+            except (GeneratorExit, asyncio.CancelledError):
+                # The caller went away before the call finished; free a half-open probe
+                self.breaker.record_abandoned()
+                raise
+            except Exception:
+                self._record_call(started, deadline, failed=True)
+                raise
+            self._record_call(started, deadline)
+        
+        if self.cache:
+            self.cache.set(cache_key, analysis, data_version)
+        return analysis
+    
+    def _admit_call(self, deadline: float) -> float:
+        """Seconds left for an upstream call, refusing it when the deadline passed or the breaker is open"""
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            self._count('timeout')
+            raise LLMUnavailableError("Request deadline passed before the LLM call")
+        if not self.breaker.allow_request():
+            self._count('short_circuited')
+            raise LLMUnavailableError("LLM circuit breaker is open")
+        return remaining
+    
+    def _call_model(self, full_prompt: str, deadline: float = None, stream: bool = False):
+        """Call the backend through the circuit breaker with whatever is left of the deadline.
+        
+        Returns the response text, or an iterator of text chunks when streaming.
+        """
+        if deadline is None:
+            deadline = time.monotonic() + self.deadline_seconds
+        
+        remaining = self._admit_call(deadline)
+        if stream:
+            return self.backend.stream(full_prompt, remaining)
+        return self.backend.generate(full_prompt, remaining)
+    
+    def _record_call(self, started: float, deadline: float = None, failed: bool = False):
+        """Feed the outcome of an upstream call into the latency histogram and the breaker"""
+        finished = time.monotonic()
+        self.latency.observe(finished - started)
+        
+        timed_out = deadline is not None and finished >= deadline
+        LLM_CALL_SECONDS.observe(finished - started, 'error' if failed or timed_out else 'success')
+        if failed or timed_out:
+            # A call that only succeeded after the deadline still counts against the breaker
+            self.breaker.record_failure()
+            self._count('timeout' if timed_out else 'error')
+        else:
+            self.breaker.record_success()
+            self._count('success')
+    
+    def _record_usage(self, usage: Dict[str, Any], analysis: str) -> Dict[str, Any]:
+        """Add the estimated response size to the prompt usage and to the running totals"""
+        usage = dict(usage, response_tokens=PromptBuilder.estimate_tokens(analysis))
+        with self._outcomes_lock:
+            self.tokens['requests'] += 1
+            self.tokens['prompt_tokens'] += usage['prompt_tokens']
+            self.tokens['response_tokens'] += usage['response_tokens']
+            self.tokens['trimmed_prompts'] += bool(usage['dropped_sections'])
+        return usage
+    
+    def _count(self, outcome: str):
+        with self._outcomes_lock:
+            self.outcomes[outcome] += 1
+        LLM_OUTCOMES.inc(outcome)
+    
+    def stats(self) -> Dict[str, Any]:
+        """Breaker state, upstream latency histogram, call outcome counts and token usage"""
+        with self._outcomes_lock:
+            outcomes = dict(self.outcomes)
+            tokens = dict(self.tokens)
+        tokens['prompt_token_budget'] = self.prompt_token_budget
+        return {
+            'backend': self.backend.name,
+            'deadline_seconds': self.deadline_seconds,
+            'single_flight': self.single_flight.stats(),
+            'concurrency': self.limiter.stats(),
+            'breaker': self.breaker.stats(),
+            'latency': self.latency.stats(),
+            'outcomes': outcomes,
+            'tokens': tokens
+        }
+    
+    def generate_preliminary_analysis(self, user_info: Mapping[str, Any], fund_data: Dict[str, Any]) -> Dict[str, Any]:
+        """Parts of the analysis that need no LLM call, available while the LLM job runs"""
+        return {
+            'sections': {},
+            'suggested_allocations': self._calculate_suggested_allocations(user_info, fund_data),
+            'summary': self._generate_summary(user_info, fund_data),
+            'key_insights': [],
+            'pending': True
+        }
+    
+    def generate_fallback_analysis(self, user_info: Mapping[str, Any], fund_data: Dict[str, Any]) -> Dict[str, Any]:
+        """Rule-based analysis for a request the LLM can't take on, e.g. when the job queue is full"""
+        note('llm_fallback')
+        return self._generate_fallback_recommendations(user_info, fund_data)
+    
+    def cache_stats(self) -> Dict[str, Any]:
+        """Hit/miss statistics of the LLM analysis cache"""
+        return self.cache.stats() if self.cache else {'enabled': False}
+    
+    def _add_analysis_sections(self, builder: PromptBuilder, user_info: Dict[str, Any], fund_data: Dict[str, Any]):
+        """Add the user profile, fund table, analysis data and instructions to the prompt.
+        
+        Priorities decide what goes first when the prompt is over budget: the
+        derived analysis blocks before the fund table and the risk warnings.
+        In narrative-template mode the profile is replaced by the investor
+        cohort and amount-based blocks are left out, so the prompt depends only
+        on the risk profile, allocation, funds, goal and horizon band.
+        """
+        if self.narrative_templates:
+            allocation = ', '.join(
+                f"{category} {percentage}%" for category, percentage in fund_data.get('allocation', {}).items() if percentage > 0
+            )
+            builder.add('cohort', "\n".join([
+                "Investor Cohort (the analysis is shared by every investor in it):",
+                f"- Risk Profile: {fund_data.get('risk_profile', 'moderate').title()}",
+                f"- Investment Goal: {user_info.get('investment_goal', 'wealth_creation').replace('_', ' ').title()}",
+                f"- Investment Horizon: {self._horizon_bucket(user_info.get('investment_horizon', '5-10'))}",
+                f"- Allocation: {allocation}"
+            ]), required=True)
+        else:
+            self._add_profile_section(builder, user_info)
+        self._add_fund_sections(builder, fund_data)
+        
+        if self.narrative_templates:
+            builder.add('placeholders', (
+                "Do not invent personal details. To refer to the investor or their figures, write these "
+                "placeholders exactly and they will be filled in: {name}, {age}, {annual_income}, "
+                "{investment_amount}, {monthly_sip}, {investment_horizon}."
+            ), required=True)
+        builder.add('instructions', self.ANALYSIS_INSTRUCTIONS, required=True)
+    
+    def _add_profile_section(self, builder: PromptBuilder, user_info: Dict[str, Any]):
+        """The user's personal details"""
+        builder.add('user_profile', "\n".join([
+            "User Profile:",
+            f"- Name: {user_info.get('name', 'User')}",
+            f"- Age: {user_info.get('age', 0)} years",
+            f"- Annual Income: ₹{user_info.get('annual_income', 0):,.0f}",
+            f"- Investment Amount: ₹{user_info.get('investment_amount', 0):,.0f}",
+            f"- Risk Appetite: {user_info.get('risk_tolerance', 'moderate').title()}",
+            f"- Investment Goal: {user_info.get('investment_goal', 'wealth_creation').replace('_', ' ').title()}",
+            f"- Investment Horizon: {user_info.get('investment_horizon', '5-10')} years",
+            f"- Monthly SIP Budget: ₹{user_info.get('monthly_sip', 0):,.0f}",
+            f"- Existing Investments: ₹{user_info.get('existing_investments', 0):,.0f}",
+            f"- Tax Bracket: {user_info.get('tax_bracket', 20)}%",
+            f"- Emergency Fund: {user_info.get('emergency_fund', 'yes').title()}",
+            f"- Fund Type Preference: {user_info.get('fund_type_preference', 'direct').title()}",
+            f"- ESG Preference: {user_info.get('esg_preference', 'no_preference').replace('_', ' ').title()}",
+            f"- Dividend vs Growth: {user_info.get('dividend_preference', 'growth').title()}"
+        ]), required=True)
+    
+    def _add_fund_sections(self, builder: PromptBuilder, fund_data: Dict[str, Any]):
+        """The recommended funds and the portfolio-level analysis blocks"""
+        # One dense row per fund instead of a bulleted block per field
+        rows = [
+            [
+                category, fund['id'], fund['name'], fund['fund_manager'], f"{fund['aum_cr']:.0f}", fund['expense_ratio'],
+                fund['sip_5yr_return'], fund['sip_10yr_return'], fund['alpha'], fund['beta'],
+                fund['sharpe_ratio'], fund['sortino_ratio'], fund.get('esg_score', 'N/A'),
+                fund.get('volatility_rank', 'moderate'), fund.get('peer_rank', 'N/A'),
+                fund.get('risk_adjusted_return', 'N/A'), fund.get('diversification_score', 'N/A')
+            ]
+            for category, funds in fund_data.get('recommendations', {}).items()
+            for fund in funds
+        ]
+        if rows:
+            builder.add('funds', "Recommended Funds (AUM in ₹ Cr; returns, expense and risk-adjusted return in %; ESG /10; diversification /100):\n" + format_table(
+                ['category', 'id', 'name', 'manager', 'aum', 'expense', 'sip_5y', 'sip_10y', 'alpha', 'beta',
+                 'sharpe', 'sortino', 'esg', 'volatility', 'peer_rank', 'risk_adj_return', 'diversification'],
+                rows
+            ), priority=3)
+        
+        advanced_analysis = fund_data.get('advanced_analysis', {})
+        
+        # A shared narrative leaves out warnings quoting rupee amounts and the amount-based blocks
+        shared = self.narrative_templates
+        warnings = [w for w in advanced_analysis.get('risk_warnings', []) if not (shared and '₹' in w)]
+        if warnings:
+            builder.add('risk_warnings', "Risk Warnings:\n" + "\n".join(f"- {warning}" for warning in warnings), priority=2)
+        
+        if advanced_analysis.get('projections') and not shared:
+            proj = advanced_analysis['projections']
+            builder.add('projections', (
+                f"Investment Projections: monthly SIP ₹{proj.get('monthly_sip', 0):,.0f}; "
+                f"total investment ₹{proj.get('total_investment', 0):,.0f}; "
+                f"projected value ₹{proj.get('projected_value', 0):,.0f}; "
+                f"expected return {proj.get('expected_return', 0)}%; "
+                f"period {proj.get('time_period', 0)} years"
+            ), priority=1)
+        
+        if advanced_analysis.get('diversification_score'):
+            div = advanced_analysis['diversification_score']
+            builder.add('diversification', (
+                f"Portfolio Diversification: score {div.get('score', 0)}/150; "
+                f"{div.get('categories', 0)} categories; {div.get('total_funds', 0)} funds; "
+                f"{div.get('assessment', 'N/A')}"
+            ), priority=1)
+        
+        if advanced_analysis.get('expense_impact') and not shared:
+            exp = advanced_analysis['expense_impact']
+            builder.add('expense_impact', (
+                f"Expense Impact: average expense ratio {exp.get('average_expense_ratio', 0)}%; "
+                f"total expense over period ₹{exp.get('total_expense_over_period', 0):,.0f}; "
+                f"potential savings ₹{exp.get('potential_savings', 0):,.0f}; "
+                f"{exp.get('impact_assessment', 'N/A')}"
+            ), priority=0)
+        
+        if advanced_analysis.get('volatility_analysis'):
+            vol = advanced_analysis['volatility_analysis']
+            breakdown = vol.get('volatility_breakdown', {})
+            builder.add('volatility', (
+                f"Volatility: low {breakdown.get('low', 0)}, moderate {breakdown.get('moderate', 0)}, "
+                f"high {breakdown.get('high', 0)} funds; "
+                f"high volatility {vol.get('high_volatility_percentage', 0):.1f}%; "
+                f"{vol.get('risk_assessment', 'N/A')}"
+            ), priority=0)
     
     def _parse_llm_response(self, analysis: str, user_info: Dict, fund_data: Dict) -> Dict[str, Any]:
         """Parse LLM response into structured format"""
         
-        # Extract key sections from the analysis
-        sections = {
-            'risk_assessment': self._extract_section(analysis, 'RISK ASSESSMENT'),
-            'portfolio_allocation': self._extract_section(analysis, 'PORTFOLIO ALLOCATION'),
-            'fund_analysis': self._extract_section(analysis, 'FUND SELECTION ANALYSIS'),
-            'investment_strategy': self._extract_section(analysis, 'INVESTMENT STRATEGY'),
-            'risk_warnings': self._extract_section(analysis, 'RISK WARNINGS'),
-            'next_steps': self._extract_section(analysis, 'NEXT STEPS'),
-            'full_analysis': analysis
-        }
+        sections = self._split_sections(analysis)
+        sections['full_analysis'] = analysis
         
         # Calculate suggested allocations based on fund data
         suggested_allocations = self._calculate_suggested_allocations(user_info, fund_data)
@@ -190,30 +600,28 @@ Provide actionable, personalized advice that helps the user make informed invest
             'key_insights': self._extract_key_insights(analysis)
         }
     
-    def _extract_section(self, text: str, section_name: str) -> str:
-        """Extract a specific section from the LLM response"""
-        try:
-            start_marker = f"{section_name}:"
-            end_markers = ["RISK ASSESSMENT:", "PORTFOLIO ALLOCATION:", "FUND SELECTION ANALYSIS:", 
-                          "INVESTMENT STRATEGY:", "RISK WARNINGS:", "NEXT STEPS:"]
-            
-            start_idx = text.find(start_marker)
-            if start_idx == -1:
-                return ""
-            
-            start_idx += len(start_marker)
-            
-            # Find the next section marker
-            end_idx = len(text)
-            for marker in end_markers:
-                if marker != start_marker:
-                    marker_idx = text.find(marker, start_idx)
-                    if marker_idx != -1 and marker_idx < end_idx:
-                        end_idx = marker_idx
-            
-            return text[start_idx:end_idx].strip()
-        except:
-            return ""
+    def _split_sections(self, text: str) -> Dict[str, str]:
+        """Split the LLM response into its sections in one pass over the headings.
+        
+        Every known section key is present; a section runs from its heading to
+        the next one, and the first non-empty occurrence of a repeated heading wins.
+        """
+        sections = dict.fromkeys(SECTION_HEADINGS.values(), '')
+        missing = set(sections)
+        text = '\n' + text
+        open_key, body_start = None, 0
+        for heading in SECTION_HEADING_RE.finditer(text):
+            if open_key:
+                sections[open_key] = text[body_start:heading.start()].strip()
+                if sections[open_key]:
+                    missing.discard(open_key)
+                    if not missing:
+                        return sections
+            key = SECTION_HEADINGS[' '.join(heading.group('heading').upper().split())]
+            open_key, body_start = (key if key in missing else None), heading.end()
+        if open_key:
+            sections[open_key] = text[body_start:].strip()
+        return sections
     
     def _calculate_suggested_allocations(self, user_info: Dict, fund_data: Dict) -> Dict[str, Any]:
         """Calculate suggested investment allocations"""
@@ -257,32 +665,19 @@ Provide actionable, personalized advice that helps the user make informed invest
         return summary.strip()
     
     def _extract_key_insights(self, analysis: str) -> List[str]:
-        """Extract key insights from the LLM analysis"""
-        
+        """Extract key insights from the LLM analysis: the first five lines with an advisory phrase"""
         insights = []
-        
-        # Look for key phrases that indicate important insights
-        key_phrases = [
-            "important to note",
-            "key consideration",
-            "recommend",
-            "suggest",
-            "consider",
-            "highlight",
-            "crucial",
-            "essential"
-        ]
-        
-        lines = analysis.split('\n')
-        for line in lines:
+        for line in analysis.splitlines():
             line = line.strip()
-            if any(phrase in line.lower() for phrase in key_phrases) and len(line) > 20:
+            if len(line) > 20 and INSIGHT_RE.search(line.lower()):
                 insights.append(line)
-        
-        return insights[:5]  # Return top 5 insights
+                if len(insights) == 5:
+                    break
+        return insights
     
     def _generate_fallback_recommendations(self, user_info: Dict, fund_data: Dict) -> Dict[str, Any]:
         """Generate fallback recommendations if LLM fails"""
+        self._count('fallback')
         
         return {
             'sections': {
@@ -302,5 +697,6 @@ Provide actionable, personalized advice that helps the user make informed invest
                 "Regular monitoring and rebalancing is important",
                 "Start with SIP for better risk management",
                 "Consult a financial advisor for personalized advice"
-            ]
+            ],
+            'fallback': True
         }
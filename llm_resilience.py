@@ -0,0 +1,308 @@
+import os
+import time
+import bisect
+import asyncio
+import threading
+from collections import deque
+from contextlib import contextmanager, asynccontextmanager
+from typing import Dict, Any
+
+
+class LLMUnavailableError(Exception):
+    """Raised instead of calling the LLM when it cannot answer in time"""
+
+
+class LLMOverloadedError(LLMUnavailableError):
+    """Raised when too many LLM calls are already queued"""
+
+
+class CircuitBreaker:
+    """Stops calling a failing upstream for a cooldown window.
+
+    Closed: calls go through; `failure_threshold` consecutive failures or
+    timeouts open the breaker. Open: calls are refused immediately until the
+    cooldown has passed. Half-open: a single probe call is let through; its
+    success closes the breaker, its failure opens it for another cooldown.
+    A probe that is abandoned (the caller went away) or never reports back
+    within a cooldown frees the slot for another probe.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failure_threshold: int = 5, cooldown_seconds: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.cooldown_seconds = cooldown_seconds
+        self.consecutive_failures = 0
+        self.times_opened = 0
+        self._state = self.CLOSED
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self._probe_started = 0.0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> 'CircuitBreaker':
+        """Build the breaker from environment settings"""
+        return cls(
+            failure_threshold=int(os.getenv('LLM_BREAKER_FAILURES', 5)),
+            cooldown_seconds=float(os.getenv('LLM_BREAKER_COOLDOWN', 30))
+        )
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._current_state()
+
+    def _current_state(self) -> str:
+        if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.cooldown_seconds:
+            self._state = self.HALF_OPEN
+            self._probe_in_flight = False
+        elif (self._state == self.HALF_OPEN and self._probe_in_flight
+              and time.monotonic() - self._probe_started >= self.cooldown_seconds):
+            # The probe's outcome was lost; let another call try
+            self._probe_in_flight = False
+        return self._state
+
+    def allow_request(self) -> bool:
+        """Whether a call may go upstream now"""
+        with self._lock:
+            state = self._current_state()
+            if state == self.CLOSED:
+                return True
+            if state == self.HALF_OPEN and not self._probe_in_flight:
+                self._probe_in_flight = True
+                self._probe_started = time.monotonic()
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.consecutive_failures = 0
+            self._state = self.CLOSED
+            self._probe_in_flight = False
+
+    def record_abandoned(self):
+        """A call was given up by its caller before it finished, telling nothing about the upstream"""
+        with self._lock:
+            self._probe_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.consecutive_failures += 1
+            state = self._current_state()
+            if state == self.HALF_OPEN or (state == self.CLOSED and self.consecutive_failures >= self.failure_threshold):
+                self._state = self.OPEN
+                self._opened_at = time.monotonic()
+                self._probe_in_flight = False
+                self.times_opened += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            state = self._current_state()
+            retry_in = max(self.cooldown_seconds - (time.monotonic() - self._opened_at), 0) if state == self.OPEN else 0
+            return {
+                'state': state,
+                'consecutive_failures': self.consecutive_failures,
+                'failure_threshold': self.failure_threshold,
+                'cooldown_seconds': self.cooldown_seconds,
+                'retry_in_seconds': round(retry_in, 2),
+                'times_opened': self.times_opened
+            }
+
+
+class LatencyHistogram:
+    """Fixed-bucket latency histogram (seconds), cheap enough for every call"""
+
+    BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+    def __init__(self, buckets: tuple = BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.total = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, seconds: float):
+        i = bisect.bisect_left(self.buckets, seconds)
+        with self._lock:
+            self.counts[i] += 1
+            self.count += 1
+            self.total += seconds
+
+    def quantile(self, q: float) -> float:
+        """Upper bound of the bucket holding the q-th quantile (inf past the last bucket)"""
+        with self._lock:
+            counts, count = list(self.counts), self.count
+        if not count:
+            return 0.0
+        rank, seen = q * count, 0
+        for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+            seen += bucket_count
+            if seen >= rank:
+                return bound
+        return float('inf')
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            counts, count, total = list(self.counts), self.count, self.total
+        cumulative, buckets = 0, {}
+        for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+            cumulative += bucket_count
+            buckets['+Inf' if bound == float('inf') else str(bound)] = cumulative
+        p50, p95 = self.quantile(0.5), self.quantile(0.95)
+        return {
+            'count': count,
+            'sum_seconds': round(total, 4),
+            'mean_seconds': round(total / count, 4) if count else 0.0,
+            # None when the quantile is past the last bucket (JSON has no infinity)
+            'p50_le': p50 if p50 != float('inf') else None,
+            'p95_le': p95 if p95 != float('inf') else None,
+            'buckets': buckets
+        }
+
+
+class LLMConcurrencyLimiter:
+    """Bounds concurrent LLM calls across all threads of a worker, with a bounded queue.
+
+    At most `max_concurrency` calls hold a slot at once. Callers beyond that
+    wait in a queue of at most `max_queue`; when the queue is full they are
+    rejected immediately, and a queued caller whose deadline passes before a
+    slot frees up gives up. Either way the caller serves the fallback instead
+    of piling more load onto the upstream quota.
+
+    Threads wait with `slot()` and event-loop coroutines with `aslot()`;
+    both draw on the same slots and queue.
+    """
+
+    WAIT_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+    def __init__(self, max_concurrency: int = 4, max_queue: int = 16):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.active = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.expired = 0
+        self.wait_time = LatencyHistogram(self.WAIT_BUCKETS)
+        self._cond = threading.Condition()
+        self._async_waiters = deque()
+
+    @classmethod
+    def from_env(cls) -> 'LLMConcurrencyLimiter':
+        """Build the limiter from environment settings"""
+        return cls(
+            max_concurrency=int(os.getenv('LLM_MAX_CONCURRENCY', 4)),
+            max_queue=int(os.getenv('LLM_MAX_QUEUE', 16))
+        )
+
+    @contextmanager
+    def slot(self, deadline: float = None):
+        """Hold one of the concurrency slots, waiting for it until `deadline` (time.monotonic())"""
+        enqueued = time.monotonic()
+        with self._cond:
+            if self.active >= self.max_concurrency:
+                if self.waiting >= self.max_queue:
+                    self.rejected += 1
+                    raise LLMOverloadedError("LLM queue is full")
+                self.waiting += 1
+                try:
+                    while self.active >= self.max_concurrency:
+                        remaining = None if deadline is None else deadline - time.monotonic()
+                        if remaining is not None and remaining <= 0:
+                            self.expired += 1
+                            raise LLMUnavailableError("No LLM slot became free before the deadline")
+                        self._cond.wait(remaining)
+                finally:
+                    self.waiting -= 1
+            self.active += 1
+            self.admitted += 1
+
+        self.wait_time.observe(time.monotonic() - enqueued)
+        try:
+            yield
+        finally:
+            self._release()
+
+    @asynccontextmanager
+    async def aslot(self, deadline: float = None):
+        """Async `slot()`: a queued coroutine waits on its event loop instead of blocking a thread"""
+        loop = asyncio.get_running_loop()
+        enqueued = time.monotonic()
+        with self._cond:
+            queued = self.active >= self.max_concurrency
+            if queued:
+                if self.waiting >= self.max_queue:
+                    self.rejected += 1
+                    raise LLMOverloadedError("LLM queue is full")
+                self.waiting += 1
+            else:
+                self.active += 1
+                self.admitted += 1
+
+        if queued:
+            try:
+                while True:
+                    waiter = loop.create_future()
+                    with self._cond:
+                        if self.active < self.max_concurrency:
+                            self.active += 1
+                            self.admitted += 1
+                            break
+                        self._async_waiters.append((loop, waiter))
+                    remaining = None if deadline is None else deadline - time.monotonic()
+                    try:
+                        if remaining is not None and remaining <= 0:
+                            raise asyncio.TimeoutError
+                        await asyncio.wait_for(waiter, remaining)
+                    except asyncio.TimeoutError:
+                        with self._cond:
+                            self.expired += 1
+                            # A release may have picked this waiter just as it gave up
+                            if self.active < self.max_concurrency:
+                                self._wake_async_waiter()
+                        raise LLMUnavailableError("No LLM slot became free before the deadline")
+            finally:
+                with self._cond:
+                    self.waiting -= 1
+
+        self.wait_time.observe(time.monotonic() - enqueued)
+        try:
+            yield
+        finally:
+            self._release()
+
+    def _release(self):
+        with self._cond:
+            self.active -= 1
+            self._cond.notify()
+            self._wake_async_waiter()
+
+    def _wake_async_waiter(self):
+        """Wake the oldest coroutine still waiting; called with the lock held"""
+        while self._async_waiters:
+            loop, waiter = self._async_waiters.popleft()
+            if not waiter.done():
+                loop.call_soon_threadsafe(_set_if_pending, waiter)
+                return
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            counts = {
+                'active': self.active,
+                'queue_depth': self.waiting,
+                'max_concurrency': self.max_concurrency,
+                'max_queue': self.max_queue,
+                'admitted': self.admitted,
+                'rejected': self.rejected,
+                'expired': self.expired
+            }
+        counts['wait_time'] = self.wait_time.stats()
+        return counts
+
+
+def _set_if_pending(future: asyncio.Future):
+    if not future.done():
+        future.set_result(None)
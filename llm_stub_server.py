@@ -0,0 +1,72 @@
+"""Local HTTP stand-in for the LLM API, serving FakeBackend responses.
+
+Run it with `python llm_stub_server.py [port]` and point the app at it with
+LLM_BACKEND=http and LLM_HTTP_URL=http://127.0.0.1:<port>/generate. The fake's
+latency, error rate and seed come from the FAKE_LLM_* settings.
+"""
+
+import sys
+import json
+import itertools
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from llm_backends import FakeBackend
+
+
+def make_server(backend: FakeBackend, host: str = '127.0.0.1', port: int = 8081) -> ThreadingHTTPServer:
+    """An HTTP server answering POST /generate with `backend` (port 0 picks a free port)"""
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def do_POST(self):
+            if self.path != '/generate':
+                self.send_error(404)
+                return
+            body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+            prompt, timeout = body.get('prompt', ''), float(body.get('timeout', 60))
+            try:
+                if body.get('stream'):
+                    chunks = backend.stream(prompt, timeout)
+                    # Fail with a status while we still can, before the headers go out
+                    first = next(chunks, None)
+                    self._send_stream(chunks, first)
+                else:
+                    self._send(200, {'text': backend.generate(prompt, timeout)})
+            except (ConnectionError, TimeoutError) as e:
+                self._send(503, {'error': str(e)})
+
+        def _send(self, status, payload):
+            data = json.dumps(payload).encode()
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def _send_stream(self, chunks, first):
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/x-ndjson')
+            self.send_header('Transfer-Encoding', 'chunked')
+            self.end_headers()
+            try:
+                for text in itertools.chain([first] if first is not None else [], chunks):
+                    line = json.dumps({'text': text}).encode() + b'\n'
+                    self.wfile.write(b'%x\r\n%s\r\n' % (len(line), line))
+                    self.wfile.flush()
+            except (ConnectionError, TimeoutError):
+                # Too late for an error status: cut the stream short
+                self.close_connection = True
+                return
+            self.wfile.write(b'0\r\n\r\n')
+
+        def log_message(self, format, *args):
+            pass
+
+    return ThreadingHTTPServer((host, port), Handler)
+
+
+if __name__ == "__main__":
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else 8081
+    server = make_server(FakeBackend.from_env(), port=port)
+    print(f"Fake LLM listening on http://127.0.0.1:{server.server_address[1]}/generate")
+    server.serve_forever()
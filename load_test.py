@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+Closed-loop HTTP load generator for comparing serving setups.
+
+Each of `--concurrency` threads keeps one keep-alive connection open and
+sends requests back to back for `--duration` seconds. /analyze bodies vary
+the investor profile so neither the LLM cache nor request coalescing turns
+the run into a cache benchmark. Run the server with LLM_BACKEND=fake to get
+a repeatable upstream latency, e.g.
+
+    LLM_BACKEND=fake LLM_CACHE_ENABLED=0 gunicorn -c gunicorn.conf.py wsgi:app
+    python load_test.py --url http://127.0.0.1:5000 --path /analyze --concurrency 64
+"""
+
+import json
+import time
+import random
+import argparse
+import threading
+import http.client
+from urllib.parse import urlsplit
+from typing import Dict, Any
+
+def analyze_body(rng: random.Random) -> Dict[str, Any]:
+    return {
+        'name': 'Load Test',
+        'age': rng.randint(22, 60),
+        'annual_income': rng.randrange(300000, 5000000, 10000),
+        'investment_amount': rng.randrange(10000, 2000000, 1000),
+        'monthly_sip': rng.randrange(1000, 50000, 500),
+        'risk_tolerance': rng.choice(['low', 'moderate', 'high']),
+        'investment_horizon': rng.choice(['1-3 years', '3-5 years', '5-10 years', '10+ years']),
+        'wait_for_analysis': True
+    }
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(int(fraction * len(sorted_values)), len(sorted_values) - 1)]
+
+def run(url: str, path: str, concurrency: int, duration: float, method: str = 'POST') -> Dict[str, Any]:
+    """Drive `path` for `duration` seconds and summarise throughput and latency"""
+    target = urlsplit(url)
+    deadline = time.monotonic() + duration
+    latencies, errors, lock = [], [0], threading.Lock()
+
+    def client(seed: int):
+        rng = random.Random(seed)
+        connection = http.client.HTTPConnection(target.hostname, target.port or 80, timeout=60)
+        own_latencies, own_errors = [], 0
+        while time.monotonic() < deadline:
+            body = json.dumps(analyze_body(rng) if path == '/analyze' else {'category': 'large_cap'})
+            started = time.monotonic()
+            try:
+                connection.request(method, path, body=body if method == 'POST' else None,
+                                   headers={'Content-Type': 'application/json'})
+                response = connection.getresponse()
+                response.read()
+                if response.status >= 400:
+                    own_errors += 1
+                else:
+                    own_latencies.append(time.monotonic() - started)
+            except (OSError, http.client.HTTPException):
+                own_errors += 1
+                connection.close()
+                connection = http.client.HTTPConnection(target.hostname, target.port or 80, timeout=60)
+        connection.close()
+        with lock:
+            latencies.extend(own_latencies)
+            errors[0] += own_errors
+
+    started = time.monotonic()
+    threads = [threading.Thread(target=client, args=(seed,)) for seed in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.monotonic() - started
+
+    latencies.sort()
+    return {
+        'requests': len(latencies),
+        'errors': errors[0],
+        'throughput_rps': round(len(latencies) / elapsed, 1),
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 1),
+        'p95_ms': round(percentile(latencies, 0.95) * 1000, 1),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 1)
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--url', default='http://127.0.0.1:5000')
+    parser.add_argument('--path', default='/analyze')
+    parser.add_argument('--method', default='POST')
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--duration', type=float, default=20)
+    args = parser.parse_args()
+    print(json.dumps(run(args.url, args.path, args.concurrency, args.duration, args.method), indent=2))
@@ -0,0 +1,403 @@
+"""
+In-process metrics with a Prometheus text exposition endpoint.
+
+Recording is lock-free: each thread increments counters and histogram buckets
+in its own shard (a plain dict only that thread writes), and shards are summed
+when metrics are scraped. Only the first record on a new thread takes the
+registry lock, to register its shard.
+
+Under gunicorn every worker has its own registry. When METRICS_DIR is set
+(gunicorn.conf.py sets it), each worker writes its totals to a file in that
+directory every METRICS_FLUSH_INTERVAL seconds and when it exits. A scrape
+then merges every worker's file, so /metrics reports the same totals
+whichever worker serves it. A scrape folds the files of exited workers into
+one aggregate file and deletes them, so counters don't go backwards when a
+worker is replaced and the directory doesn't grow with restarts. Gauges are
+read at scrape time in the serving worker only.
+"""
+
+import os
+import json
+import time
+import atexit
+import bisect
+import logging
+import threading
+from typing import Dict, List, Any, Callable, Optional, Sequence, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows: exited workers' files are kept instead of folded
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# Totals of exited workers, folded in by _compact()
+AGGREGATE_FILE = 'aggregate.json'
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+class Counter:
+    """Monotonic count, optionally split by label values"""
+
+    kind = 'counter'
+
+    def __init__(self, registry: 'MetricsRegistry', name: str, help: str, labelnames: Sequence[str] = ()):
+        self.registry = registry
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+
+    def inc(self, *labelvalues: str, amount: float = 1.0):
+        shard = self.registry._shard()
+        key = (self.name, labelvalues)
+        shard[key] = shard.get(key, 0.0) + amount
+
+
+class Histogram:
+    """Distribution of observed values (e.g. seconds) over fixed buckets, optionally split by label values"""
+
+    kind = 'histogram'
+
+    def __init__(self, registry: 'MetricsRegistry', name: str, help: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.registry = registry
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value: float, *labelvalues: str):
+        shard = self.registry._shard()
+        key = (self.name, labelvalues)
+        # Per-bucket (not cumulative) counts, then the sum and the count
+        values = shard.get(key)
+        if values is None:
+            values = shard[key] = [0] * (len(self.buckets) + 1) + [0.0, 0]
+        values[bisect.bisect_left(self.buckets, value)] += 1
+        values[-2] += value
+        values[-1] += 1
+
+    def time(self, *labelvalues: str) -> '_Timer':
+        """Context manager observing the seconds spent in its block"""
+        return _Timer(self, labelvalues)
+
+
+class _Timer:
+    __slots__ = ('histogram', 'labelvalues', 'started')
+
+    def __init__(self, histogram: Histogram, labelvalues: Tuple[str, ...]):
+        self.histogram = histogram
+        self.labelvalues = labelvalues
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram.observe(time.perf_counter() - self.started, *self.labelvalues)
+        return False
+
+
+class Gauge:
+    """Value read from a callback when metrics are scraped"""
+
+    kind = 'gauge'
+
+    def __init__(self, registry: 'MetricsRegistry', name: str, help: str, read: Callable[[], float]):
+        self.registry = registry
+        self.name = name
+        self.help = help
+        self.labelnames = ()
+        self.read = read
+
+
+class MetricsRegistry:
+    """The metrics of one process, merged with other workers' totals at scrape time"""
+
+    def __init__(self, directory: str = None, flush_interval: float = None):
+        self._directory = directory
+        self._flush_interval = flush_interval
+        self.metrics: Dict[str, Any] = {}
+        self._shards: List[Dict] = []
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._flusher_pid = None
+        self._file = None
+        os.register_at_fork(after_in_child=self._after_fork)
+
+    def _after_fork(self):
+        # A forked worker starts from zero; anything the master recorded is not its own
+        self._shards = []
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._flusher_pid = None
+        self._file = None
+
+    @property
+    def directory(self) -> Optional[str]:
+        # Read lazily so settings loaded from .env after import still apply
+        return self._directory if self._directory is not None else os.getenv('METRICS_DIR') or None
+
+    @property
+    def flush_interval(self) -> float:
+        if self._flush_interval is not None:
+            return self._flush_interval
+        return float(os.getenv('METRICS_FLUSH_INTERVAL', 5))
+
+    def _register(self, metric):
+        with self._lock:
+            existing = self.metrics.get(metric.name)
+            if existing is not None:
+                if existing.kind != metric.kind or existing.labelnames != metric.labelnames:
+                    raise ValueError(f"Metric {metric.name} is already registered with a different type or labels")
+                if metric.kind != 'gauge':
+                    return existing
+            self.metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name: str, help: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(self, name, help, labelnames))
+
+    def histogram(self, name: str, help: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(self, name, help, labelnames, buckets))
+
+    def gauge(self, name: str, help: str, read: Callable[[], float]) -> Gauge:
+        return self._register(Gauge(self, name, help, read))
+
+    def _shard(self) -> Dict:
+        try:
+            return self._local.shard
+        except AttributeError:
+            shard = self._local.shard = {}
+            with self._lock:
+                self._shards.append(shard)
+            return shard
+
+    def totals(self) -> Dict[Tuple[str, Tuple[str, ...]], Any]:
+        """This process's counter and histogram values, summed over every thread's shard"""
+        with self._lock:
+            shards = list(self._shards)
+        merged = {}
+        for shard in shards:
+            # dict.copy() is atomic under the GIL, so the owning thread can keep recording
+            for key, value in shard.copy().items():
+                _accumulate(merged, key, list(value) if isinstance(value, list) else value)
+        return merged
+
+    def start_flusher(self):
+        """Start this process's background flush to METRICS_DIR, if configured; cheap to call on every request"""
+        if self._flusher_pid is not None or not self.directory:
+            return
+        with self._lock:
+            if self._flusher_pid is not None:
+                return
+            self._flusher_pid = os.getpid()
+        threading.Thread(target=self._flush_loop, name='metrics-flush', daemon=True).start()
+        atexit.register(self.flush)
+
+    def _flush_loop(self):
+        pid = os.getpid()
+        while self._flusher_pid == pid:
+            time.sleep(self.flush_interval)
+            self.flush()
+
+    def flush(self):
+        """Write this process's totals to its file in METRICS_DIR"""
+        directory = self.directory
+        if not directory:
+            return
+        try:
+            os.makedirs(directory, exist_ok=True)
+            with self._flush_lock:
+                if self._file is None:
+                    # The start time keeps a reused pid from overwriting an exited worker's totals
+                    self._file = f"{os.getpid()}-{time.time_ns()}.json"
+                entries = [[name, list(labels), value] for (name, labels), value in self.totals().items()]
+                _write_json(os.path.join(directory, self._file), entries)
+        except OSError as e:
+            logger.warning(f"Could not write metrics to {directory}: {e}")
+
+    def collect(self) -> Dict[Tuple[str, Tuple[str, ...]], Any]:
+        """Counter and histogram totals over every worker (or just this process without METRICS_DIR)"""
+        directory = self.directory
+        if not directory:
+            return self.totals()
+
+        # Write ours first so the merge sees this worker's latest values
+        self.flush()
+        if not os.path.isdir(directory):
+            return {}
+        # Exclusive, so no scrape reads a file while another folds it into the aggregate
+        with _DirectoryLock(directory):
+            self._compact(directory)
+            merged = {}
+            for file_name in sorted(os.listdir(directory)):
+                if not file_name.endswith('.json'):
+                    continue
+                entries = _read_entries(directory, file_name)
+                if file_name == AGGREGATE_FILE:
+                    entries = entries['entries'] if entries else None
+                for name, labels, value in entries or []:
+                    _accumulate(merged, (name, tuple(labels)), value)
+            return merged
+
+    def _compact(self, directory: str):
+        """Fold the files of exited workers into the aggregate file and delete them"""
+        if fcntl is None:
+            return
+        aggregate = _read_entries(directory, AGGREGATE_FILE) or {'entries': [], 'folded': []}
+        folded = set(aggregate['folded'])
+        stale = [file_name for file_name in os.listdir(directory)
+                 if file_name.endswith('.json') and file_name != AGGREGATE_FILE and not _pid_alive(file_name)]
+        new = [file_name for file_name in stale if file_name not in folded]
+        if new:
+            totals = {}
+            for name, labels, value in aggregate['entries']:
+                _accumulate(totals, (name, tuple(labels)), value)
+            for file_name in new:
+                for name, labels, value in _read_entries(directory, file_name) or []:
+                    _accumulate(totals, (name, tuple(labels)), value)
+            # Recording which files were folded makes a crash before their deletion harmless
+            aggregate = {
+                'entries': [[name, list(labels), value] for (name, labels), value in totals.items()],
+                'folded': stale
+            }
+            _write_json(os.path.join(directory, AGGREGATE_FILE), aggregate)
+        for file_name in stale:
+            try:
+                os.remove(os.path.join(directory, file_name))
+            except OSError:
+                pass
+
+    def render(self) -> str:
+        """Prometheus text exposition (format 0.0.4) of every metric"""
+        values = self.collect()
+        by_name: Dict[str, List] = {}
+        for (name, labels), value in values.items():
+            by_name.setdefault(name, []).append((labels, value))
+
+        lines = []
+        for name, metric in sorted(self.metrics.items()):
+            lines.append(f"# HELP {name} {_escape_help(metric.help)}")
+            lines.append(f"# TYPE {name} {metric.kind}")
+            if metric.kind == 'gauge':
+                try:
+                    lines.append(f"{name} {_format(metric.read())}")
+                except Exception as e:
+                    logger.warning(f"Could not read gauge {name}: {e}")
+                continue
+            for labels, value in sorted(by_name.get(name, [])):
+                pairs = list(zip(metric.labelnames, labels))
+                if metric.kind == 'counter':
+                    lines.append(f"{name}{_labels(pairs)} {_format(value)}")
+                    continue
+                cumulative = 0
+                for bound, count in zip(metric.buckets + (float('inf'),), value):
+                    cumulative += count
+                    lines.append(f"{name}_bucket{_labels(pairs + [('le', _format(bound))])} {cumulative}")
+                lines.append(f"{name}_sum{_labels(pairs)} {_format(value[-2])}")
+                lines.append(f"{name}_count{_labels(pairs)} {value[-1]}")
+        return '\n'.join(lines) + '\n'
+
+    def reset(self):
+        """Drop every recorded value in this process (used by tests)"""
+        with self._lock:
+            for shard in self._shards:
+                shard.clear()
+
+
+class _DirectoryLock:
+    """Exclusive lock on a metrics directory, shared by every worker (a no-op without fcntl)"""
+
+    def __init__(self, directory: str):
+        self.path = os.path.join(directory, '.lock')
+
+    def __enter__(self):
+        self.fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        if fcntl is not None:
+            fcntl.flock(self.fd, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc_info):
+        os.close(self.fd)
+        return False
+
+
+def _pid_alive(file_name: str) -> bool:
+    """Whether the worker that wrote `{pid}-{started}.json` is still running"""
+    try:
+        os.kill(int(file_name.split('-', 1)[0]), 0)
+    except ValueError:
+        # Not a worker file; leave it alone
+        return True
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _read_entries(directory: str, file_name: str):
+    try:
+        with open(os.path.join(directory, file_name)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as e:
+        logger.warning(f"Skipping unreadable metrics file {file_name}: {e}")
+        return None
+
+
+def _write_json(path: str, data):
+    """Replace `path` atomically, so readers never see a partial file"""
+    with open(path + '.tmp', 'w') as f:
+        json.dump(data, f)
+    os.replace(path + '.tmp', path)
+
+
+def _accumulate(merged: Dict, key, value):
+    current = merged.get(key)
+    if current is None:
+        merged[key] = value
+    elif isinstance(value, list):
+        merged[key] = [a + b for a, b in zip(current, value)]
+    else:
+        merged[key] = current + value
+
+
+def _format(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _escape_help(text: str) -> str:
+    return text.replace('\\', '\\\\').replace('\n', '\\n')
+
+
+def _labels(pairs: List[Tuple[str, str]]) -> str:
+    if not pairs:
+        return ''
+    escaped = (
+        f'{name}="' + str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') + '"'
+        for name, value in pairs
+    )
+    return '{' + ','.join(escaped) + '}'
+
+
+# Shared by every module in the process
+REGISTRY = MetricsRegistry()
+
+counter = REGISTRY.counter
+histogram = REGISTRY.histogram
+gauge = REGISTRY.gauge
+
+# Shared by the caches; hit ratio = hits / all lookups per cache
+CACHE_LOOKUPS = counter('mf_cache_lookups_total', "Cache lookups by cache and result (hit or miss)", ('cache', 'result'))
@@ -1,21 +1,110 @@
-import requests
-import pandas as pd
 import numpy as np
-from bs4 import BeautifulSoup
+import os
 import time
 import json
-from typing import Dict, List, Any
-import yfinance as yf
+import hashlib
+import logging
+import threading
+from typing import Dict, List, Any, Mapping
+from fund_snapshot import FundSnapshot
+from portfolio_optimizer import PortfolioOptimizer
+from backtester import PortfolioBacktester
+from risk_engine import PortfolioRiskEngine
+from holdings_overlap import HoldingsOverlap
+from timing import stage
+import metrics
+
+logger = logging.getLogger(__name__)
+
+ANALYZER_SECONDS = metrics.histogram('mf_analyzer_compute_seconds', "Time to compute one user's recommendations")
 
 class MutualFundAnalyzer:
     def __init__(self):
-        self.session = requests.Session()
-        self.session.headers.update({
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-        })
+        # Heavy dependencies (requests, scipy) load on first use, keeping cold starts fast
+        self._session = None
+        self._holdings = None
+        self._lazy_lock = threading.Lock()
+        
+        # Fund universe, NAV history and precomputed scores, memory-mapped from a
+        # prebuilt snapshot file when FUND_SNAPSHOT_PATH is set
+        self.snapshot = self._load_snapshot()
+        self.fund_data = self.snapshot.records_by_category()
+        self.optimizer = PortfolioOptimizer()
+        self.backtester = PortfolioBacktester(self.snapshot)
+        self.risk_engine = PortfolioRiskEngine(self.snapshot)
+        
+        # Changes whenever fund attributes or NAV history change; downstream caches key on it
+        self.data_version = self.snapshot.metadata['data_version']
+        # Snapshots written before build times were recorded count from when they were loaded
+        self.snapshot_built_at = self.snapshot.metadata.get('built_at', time.time())
+    
+    def _load_snapshot(self) -> FundSnapshot:
+        """Load the snapshot file, building (and saving) a fresh one when it is missing or unreadable"""
+        path = os.getenv('FUND_SNAPSHOT_PATH')
+        if path and os.path.exists(path):
+            try:
+                return FundSnapshot.load(path)
+            except (OSError, ValueError, KeyError) as e:
+                logger.warning(f"Rebuilding fund snapshot, {path} is unusable: {e}")
         
+        snapshot = self.build_snapshot()
+        if path:
+            try:
+                snapshot.save(path)
+            except OSError as e:
+                logger.error(f"Error saving fund snapshot to {path}: {e}")
+        return snapshot
+    
+    def build_snapshot(self) -> FundSnapshot:
+        """Build the snapshot from the source fund data, scoring and ranking every fund"""
         # Sample mutual fund data (in real implementation, this would be fetched from APIs)
-        self.fund_data = self._load_sample_data()
+        fund_data = self._load_sample_data()
+        funds = [fund for category_funds in fund_data.values() for fund in category_funds]
+        scores = {
+            'fund_score': [self._calculate_fund_score(fund, None) for fund in funds],
+            'composite_score': [self._calculate_composite_score(fund) for fund in funds]
+        }
+        snapshot = FundSnapshot.from_sample_data(fund_data, scores=scores)
+        snapshot.metadata['data_version'] = self._compute_data_version(fund_data, snapshot)
+        snapshot.metadata['built_at'] = time.time()
+        return snapshot
+    
+    def _compute_data_version(self, fund_data: Dict[str, List[Dict]], snapshot: FundSnapshot) -> str:
+        """Hash of the fund data and snapshot used to invalidate derived caches"""
+        digest = hashlib.sha1(json.dumps(fund_data, sort_keys=True).encode())
+        digest.update(snapshot.snapshot_id.encode())
+        return digest.hexdigest()[:16]
+    
+    @property
+    def session(self):
+        """HTTP session for fetching live fund data, created on first use"""
+        with self._lazy_lock:
+            if self._session is None:
+                import requests
+                self._session = requests.Session()
+                self._session.headers.update({
+                    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
+                })
+            return self._session
+    
+    @property
+    def holdings(self) -> HoldingsOverlap:
+        """Fund holdings and their overlap, built on first use"""
+        with self._lazy_lock:
+            if self._holdings is None:
+                self._holdings = self._load_holdings()
+            return self._holdings
+    
+    def _load_holdings(self) -> HoldingsOverlap:
+        """Load fund holdings from portfolio disclosures, falling back to sample holdings"""
+        disclosure_dir = os.getenv('PORTFOLIO_DISCLOSURE_DIR')
+        if disclosure_dir and os.path.isdir(disclosure_dir):
+            try:
+                return HoldingsOverlap.from_disclosure_files(self.snapshot.fund_ids, disclosure_dir)
+            except Exception as e:
+                logger.error(f"Error loading portfolio disclosures: {e}")
+        
+        return HoldingsOverlap.from_sample_data(self.snapshot.fund_ids, self.snapshot.categories)
     
     def _load_sample_data(self) -> Dict[str, List[Dict]]:
         """Load sample mutual fund data for demonstration"""
@@ -582,38 +671,55 @@ class MutualFundAnalyzer:
             ]
         }
     
-    def get_recommendations(self, user_info: Dict[str, Any]) -> Dict[str, Any]:
+    def get_recommendations(self, user_info: Mapping[str, Any]) -> Dict[str, Any]:
         """Get personalized mutual fund recommendations"""
-        # Calculate risk profile
-        risk_profile = self._calculate_risk_profile(user_info)
+        started = time.perf_counter()
+        with stage('ranking'):
+            # Calculate risk profile
+            risk_profile = self._calculate_risk_profile(user_info)
+            
+            # Get allocation suggestions
+            allocation = self._suggest_allocation(user_info, risk_profile)
+            
+            # Get recommendations for each category
+            recommendations = {}
+            for category, percentage in allocation.items():
+                if percentage > 0:
+                    filtered_funds = self._filter_and_rank_funds(category, user_info, risk_profile)
+                    recommendations[category] = filtered_funds[:2]  # Top 2 funds per category
         
-        # Get allocation suggestions
-        allocation = self._suggest_allocation(user_info, risk_profile)
+        with stage('optimization'):
+            # Replace the fixed category table with the optimized allocation for the picked funds
+            optimization = self._optimize_allocation(recommendations, allocation, risk_profile)
+            if optimization:
+                allocation = optimization['allocation']
+            fund_weights = self._get_fund_weights(recommendations, allocation, optimization)
         
-        # Get recommendations for each category
-        recommendations = {}
-        for category, percentage in allocation.items():
-            if percentage > 0:
-                funds = self.fund_data.get(category, [])
-                filtered_funds = self._filter_and_rank_funds(funds, user_info, risk_profile)
-                recommendations[category] = filtered_funds[:2]  # Top 2 funds per category
+        with stage('advanced_analysis'):
+            advanced_analysis = self._generate_advanced_analysis(user_info, recommendations, allocation, fund_weights)
+        ANALYZER_SECONDS.observe(time.perf_counter() - started)
         
         return {
+            'data_version': self.data_version,
             'risk_profile': risk_profile,
             'allocation': allocation,
+            'optimization': optimization,
             'recommendations': recommendations,
-            'advanced_analysis': self._generate_advanced_analysis(user_info, recommendations, allocation)
+            'advanced_analysis': advanced_analysis
         }
     
-    def _generate_advanced_analysis(self, user_info: Dict, recommendations: Dict, allocation: Dict) -> Dict:
+    def _generate_advanced_analysis(self, user_info: Dict, recommendations: Dict, allocation: Dict, fund_weights: Dict = None) -> Dict:
         """Generate advanced analysis including projections, diversification, etc."""
+        risk_metrics = self._calculate_risk_metrics(user_info, fund_weights or {})
         return {
+            'backtest': self._backtest_allocation(user_info, fund_weights or {}),
+            'risk_metrics': risk_metrics,
             'projections': self._calculate_projections(user_info),
-            'diversification_score': self._calculate_diversification_score(recommendations),
+            'diversification_score': self._calculate_diversification_score(recommendations, fund_weights),
             'expense_impact': self._calculate_expense_impact(recommendations, user_info),
             'volatility_analysis': self._analyze_volatility(recommendations),
             'peer_comparison': self._generate_peer_comparison(recommendations),
-            'risk_warnings': self._generate_risk_warnings(recommendations, user_info)
+            'risk_warnings': self._generate_risk_warnings(recommendations, user_info, risk_metrics)
         }
     
     def _calculate_projections(self, user_info: Dict) -> Dict:
@@ -645,7 +751,7 @@ class MutualFundAnalyzer:
         elif '15+' in horizon: return 20
         return 7  # default
     
-    def _calculate_diversification_score(self, recommendations: Dict) -> Dict:
+    def _calculate_diversification_score(self, recommendations: Dict, fund_weights: Dict = None) -> Dict:
         """Calculate portfolio diversification score"""
         total_funds = sum(len(funds) for funds in recommendations.values())
         categories = len(recommendations)
@@ -656,12 +762,28 @@ class MutualFundAnalyzer:
         
         total_score = category_score + fund_score
         
-        return {
+        result = {
             'score': total_score,
             'categories': categories,
             'total_funds': total_funds,
             'assessment': self._get_diversification_assessment(total_score)
         }
+        
+        # Holdings-based view: funds sharing the same stocks do not diversify each other
+        if not fund_weights:
+            fund_weights = {fund['id']: 1.0 for funds in recommendations.values() for fund in funds}
+        overlap = self.holdings.portfolio_overlap(fund_weights)
+        if overlap:
+            overlap['assessment'] = self._get_overlap_assessment(overlap['overlap_score'])
+            result['holdings_overlap'] = overlap
+        
+        return result
+    
+    def _get_overlap_assessment(self, score: float) -> str:
+        if score >= 80: return "Excellent - Funds hold largely different stocks"
+        elif score >= 65: return "Good - Limited overlap between funds"
+        elif score >= 50: return "Moderate - Noticeable overlap in holdings"
+        else: return "High overlap - Funds hold many of the same stocks"
     
     def _get_diversification_assessment(self, score: float) -> str:
         if score >= 120: return "Excellent - Well diversified across categories"
@@ -720,11 +842,23 @@ class MutualFundAnalyzer:
         total_funds = len(all_funds)
         high_volatility_pct = (volatility_counts['high'] / total_funds) * 100
         
-        return {
+        # Drawdown metrics are precomputed for the whole universe in the snapshot
+        drawdowns = {fund['id']: self.snapshot.drawdown_for(fund['id']) for fund in all_funds}
+        drawdowns = {fund_id: metrics for fund_id, metrics in drawdowns.items() if metrics}
+        
+        analysis = {
             'volatility_breakdown': volatility_counts,
             'high_volatility_percentage': high_volatility_pct,
             'risk_assessment': self._get_volatility_assessment(high_volatility_pct)
         }
+        
+        if drawdowns:
+            worst_fund_id = min(drawdowns, key=lambda fund_id: drawdowns[fund_id]['max_drawdown'])
+            analysis['drawdowns'] = drawdowns
+            analysis['worst_drawdown'] = {'fund_id': worst_fund_id, **drawdowns[worst_fund_id]}
+            analysis['average_max_drawdown'] = sum(m['max_drawdown'] for m in drawdowns.values()) / len(drawdowns)
+        
+        return analysis
     
     def _get_volatility_assessment(self, high_vol_pct: float) -> str:
         if high_vol_pct == 0: return "Low volatility portfolio - Stable returns expected"
@@ -771,10 +905,37 @@ class MutualFundAnalyzer:
         
         return "; ".join(reasons) if reasons else "Balanced performance across key metrics"
     
-    def _generate_risk_warnings(self, recommendations: Dict, user_info: Dict) -> List[str]:
+    def _calculate_risk_metrics(self, user_info: Dict, fund_weights: Dict[str, float]) -> Dict:
+        """Portfolio VaR/CVaR and stress-scenario losses for the suggested allocation"""
+        try:
+            fund_weights = {fund_id: w for fund_id, w in fund_weights.items() if w > 0}
+            if not fund_weights:
+                return {}
+            
+            return self.risk_engine.portfolio_risk(fund_weights, user_info.get('investment_amount', 0))
+            
+        except Exception as e:
+            logger.error(f"Error calculating risk metrics: {e}")
+            return {}
+    
+    def _generate_risk_warnings(self, recommendations: Dict, user_info: Dict, risk_metrics: Dict = None) -> List[str]:
         """Generate risk warnings for high-risk funds"""
         warnings = []
         
+        # Portfolio-level warnings from the risk engine
+        if risk_metrics:
+            warnings.append(
+                f"⚠️ In a bad month (1 in {round(1 / (1 - risk_metrics['confidence']))}), this portfolio could lose "
+                f"{risk_metrics['historical_var']:.1f}% (₹{risk_metrics['historical_var_amount']:,.0f}) or more; "
+                f"the average loss in such months is {risk_metrics['historical_cvar']:.1f}%."
+            )
+            for stress in risk_metrics['stress_tests']:
+                if stress['portfolio_return'] < -20:
+                    warnings.append(
+                        f"⚠️ In a repeat of the {stress['scenario']}, this portfolio would fall "
+                        f"{abs(stress['portfolio_return']):.0f}% (₹{stress['loss_amount']:,.0f})."
+                    )
+        
         for category, funds in recommendations.items():
             for fund in funds:
                 if fund.get('volatility_rank') == 'high':
@@ -783,9 +944,24 @@ class MutualFundAnalyzer:
                 if fund.get('std_dev', 0) > 20:
                     warnings.append(f"⚠️ {fund['name']} has high standard deviation ({fund['std_dev']}%). Higher risk of losses.")
                 
+                drawdown = self.snapshot.drawdown_for(fund['id'])
+                if drawdown and drawdown['max_drawdown'] < -40:
+                    if drawdown['recovery_days'] is None:
+                        warnings.append(f"⚠️ {fund['name']} fell {abs(drawdown['max_drawdown']):.0f}% from its peak and has not yet recovered.")
+                    else:
+                        warnings.append(f"⚠️ {fund['name']} fell {abs(drawdown['max_drawdown']):.0f}% from its peak and took {drawdown['recovery_days'] / 365.25:.1f} years to recover.")
+                
                 if category == 'small_cap' and user_info.get('risk_tolerance') == 'low':
                     warnings.append(f"⚠️ {fund['name']} is a small-cap fund, which may not suit conservative investors.")
         
+        # Pairs of recommended funds that largely hold the same stocks
+        all_funds = [fund for funds in recommendations.values() for fund in funds if self.holdings.has_holdings(fund['id'])]
+        if len(all_funds) > 1:
+            overlap = self.holdings.overlap_for([fund['id'] for fund in all_funds])
+            for i, j in zip(*np.triu_indices(len(all_funds), k=1)):
+                if overlap[i, j] > 0.6:
+                    warnings.append(f"⚠️ {all_funds[i]['name']} and {all_funds[j]['name']} have {overlap[i, j] * 100:.0f}% portfolio overlap, so holding both adds little diversification.")
+        
         return warnings
     
     def _calculate_risk_profile(self, user_info: Dict[str, Any]) -> str:
@@ -845,18 +1021,16 @@ class MutualFundAnalyzer:
         
         return final_risk
     
-    def _filter_and_rank_funds(self, funds: List[Dict], user_info: Dict, risk_profile: str) -> List[Dict]:
+    def _filter_and_rank_funds(self, category: str, user_info: Dict, risk_profile: str) -> List[Dict]:
         """Filter and rank funds based on user profile and risk tolerance"""
+        # Scores and the ranking (higher is better) are precomputed in the snapshot
+        scores = self.snapshot.scores['fund_score']
         filtered_funds = []
         
-        for fund in funds:
-            # Calculate composite score
-            score = self._calculate_fund_score(fund, risk_profile)
-            fund['score'] = score
-            filtered_funds.append(fund)
-        
-        # Sort by score (higher is better)
-        filtered_funds.sort(key=lambda x: x['score'], reverse=True)
+        for i in self.snapshot.ranked('fund_score', category):
+            # Copied, so annotating a request's funds (score here, grow_url in app.py) never
+            # leaks into other requests or dirties snapshot pages shared between workers
+            filtered_funds.append({**self.snapshot.fund_records[i], 'score': float(scores[i])})
         
         return filtered_funds
     
@@ -922,6 +1096,86 @@ class MutualFundAnalyzer:
                 'multi_cap': 15
             }
     
+    def _optimize_allocation(self, recommendations: Dict, allocation: Dict, risk_profile: str) -> Dict:
+        """Mean-variance allocation across the recommended funds"""
+        try:
+            fund_ids = [fund['id'] for funds in recommendations.values() for fund in funds]
+            if len(fund_ids) < 2:
+                return {}
+            
+            result = self.optimizer.optimize(self.snapshot, fund_ids, risk_profile)
+            
+            # Aggregate fund weights into category percentages
+            optimized = {category: 0.0 for category in allocation}
+            for category, funds in recommendations.items():
+                for fund in funds:
+                    optimized[category] += result['fund_weights'][fund['id']] * 100
+            optimized = {category: round(pct, 1) for category, pct in optimized.items()}
+            
+            # Absorb rounding drift in the largest category so the table sums to 100
+            largest = max(optimized, key=optimized.get)
+            optimized[largest] = round(optimized[largest] + 100 - sum(optimized.values()), 1)
+            
+            result['allocation'] = optimized
+            result['fund_weights'] = {fund_id: round(w * 100, 2) for fund_id, w in result['fund_weights'].items()}
+            return result
+            
+        except Exception as e:
+            logger.error(f"Error optimizing allocation: {e}")
+            return {}
+    
+    def _get_fund_weights(self, recommendations: Dict, allocation: Dict, optimization: Dict) -> Dict[str, float]:
+        """Per-fund percentage weights for the suggested allocation"""
+        if optimization:
+            return optimization['fund_weights']
+        
+        # Without an optimized portfolio, split each category's share equally across its funds
+        fund_weights = {}
+        for category, funds in recommendations.items():
+            for fund in funds:
+                fund_weights[fund['id']] = allocation.get(category, 0) / len(funds)
+        return fund_weights
+    
+    def _backtest_allocation(self, user_info: Dict, fund_weights: Dict[str, float]) -> Dict:
+        """Replay the suggested allocation over historical NAVs"""
+        try:
+            fund_weights = {fund_id: w for fund_id, w in fund_weights.items() if w > 0}
+            lumpsum = user_info.get('lumpsum_investment') or user_info.get('investment_amount', 0)
+            monthly_sip = user_info.get('monthly_sip', 0)
+            if not fund_weights or (lumpsum <= 0 and monthly_sip <= 0):
+                return {}
+            
+            years = self._parse_horizon(user_info.get('investment_horizon', '5-10'))
+            return self.backtester.backtest(fund_weights, lumpsum, monthly_sip, years)
+            
+        except Exception as e:
+            logger.error(f"Error backtesting allocation: {e}")
+            return {}
+    
+    def backtest_allocations(self, fund_ids: List[str], allocations: Dict[str, Dict[str, float]] = None,
+                             lumpsum: float = 0, monthly_sip: float = 0, years: float = None,
+                             rebalance: str = 'annual', include_series: bool = False) -> Dict[str, Dict]:
+        """Backtest several named allocations over the same funds in one pass"""
+        unknown = [fund_id for fund_id in fund_ids if fund_id not in self.snapshot.fund_index]
+        if not fund_ids or unknown:
+            raise ValueError(f"Unknown fund ids: {', '.join(unknown)}" if unknown else "fund_ids must not be empty")
+        
+        if not allocations:
+            # Compare the optimized portfolios for every risk profile by default
+            allocations = {
+                profile: self.optimizer.optimize(self.snapshot, fund_ids, profile)['fund_weights']
+                for profile in self.optimizer.RISK_PROFILE_TARGETS
+            }
+        
+        names = list(allocations)
+        for name in names:
+            extra = set(allocations[name]) - set(fund_ids)
+            if extra:
+                raise ValueError(f"Allocation '{name}' uses funds not in fund_ids: {', '.join(sorted(extra))}")
+        weights = np.array([[allocations[name].get(fund_id, 0) for fund_id in fund_ids] for name in names], dtype=float)
+        results = self.backtester.backtest_many(fund_ids, weights, lumpsum, monthly_sip, years, rebalance, include_series)
+        return dict(zip(names, results))
+    
     def get_fund_details(self, fund_id: str) -> Dict[str, Any]:
         """Get detailed information about a specific fund"""
         for category in self.fund_data.values():
@@ -953,52 +1207,29 @@ class MutualFundAnalyzer:
         
         return f"https://groww.in/mutual-funds/{fund_name_clean}"
 
+    def resolve_category(self, category: str) -> str:
+        """The category get_top_funds serves for `category`; unknown ones fall back to large cap"""
+        return category if category in self.snapshot.category_slices else 'large_cap'
+
     def get_top_funds(self, category: str) -> List[Dict[str, Any]]:
         """Get top 5 funds for a specific category based on performance metrics"""
         try:
-            # Get all funds for the category
-            all_funds = self._get_funds_by_category(category)
-            
-            if not all_funds:
-                return []
-            
-            # Calculate composite score for each fund
-            for fund in all_funds:
-                fund['score'] = self._calculate_composite_score(fund)
-            
-            # Sort by score in descending order and return top 5
-            top_funds = sorted(all_funds, key=lambda x: x['score'], reverse=True)[:5]
+            category = self.resolve_category(category)
             
-            # Add GROW URLs
-            for fund in top_funds:
+            # Composite scores and the per-category ranking are precomputed in the snapshot
+            scores = self.snapshot.scores['composite_score']
+            top_funds = []
+            for i in self.snapshot.ranked('composite_score', category)[:5]:
+                fund = dict(self.snapshot.fund_records[i])
+                fund['score'] = float(scores[i])
+                # Add GROW URLs
                 fund['grow_url'] = self.get_grow_url(fund['name'])
+                top_funds.append(fund)
             
             return top_funds
             
         except Exception as e:
-            print(f"Error getting top funds for {category}: {e}")
-            return []
-
-    def _get_funds_by_category(self, category: str) -> List[Dict[str, Any]]:
-        """Get all funds for a specific category"""
-        try:
-            # Load sample data
-            sample_data = self._load_sample_data()
-            
-            # Map category names to sample data keys
-            category_mapping = {
-                'large_cap': 'large_cap',
-                'mid_cap': 'mid_cap', 
-                'flexi_cap': 'flexi_cap',
-                'small_cap': 'small_cap',
-                'multi_cap': 'multi_cap'
-            }
-            
-            mapped_category = category_mapping.get(category, 'large_cap')
-            return sample_data.get(mapped_category, [])
-            
-        except Exception as e:
-            print(f"Error getting funds by category {category}: {e}")
+            logger.error(f"Error getting top funds for {category}: {e}")
             return []
 
     def _calculate_composite_score(self, fund: Dict[str, Any]) -> float:
@@ -1037,7 +1268,7 @@ class MutualFundAnalyzer:
             return round(composite_score, 2)
             
         except Exception as e:
-            print(f"Error calculating composite score: {e}")
+            logger.error(f"Error calculating composite score: {e}")
             return 0.0
     
     def fetch_live_data(self):
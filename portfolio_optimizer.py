@@ -0,0 +1,184 @@
+import threading
+import numpy as np
+from collections import OrderedDict
+from typing import Dict, List, Any
+
+from fund_snapshot import FundSnapshot, TRADING_DAYS
+from metrics import CACHE_LOOKUPS
+
+
+class PortfolioOptimizer:
+    """Long-only mean-variance optimizer for the funds picked for a user.
+
+    Efficient frontiers are cached per (snapshot, fund set), so repeated
+    requests for the same picks only pay for a frontier lookup.
+    """
+
+    # Position along the efficient frontier: 0 = minimum variance, 1 = maximum return
+    RISK_PROFILE_TARGETS = {
+        'low': 0.15,
+        'moderate': 0.5,
+        'high': 0.85
+    }
+
+    def __init__(self, max_fund_weight: float = 0.35, lookback_days: int = 5 * TRADING_DAYS,
+                 frontier_points: int = 25, cache_size: int = 256):
+        self.max_fund_weight = max_fund_weight
+        self.lookback_days = lookback_days
+        self.frontier_points = frontier_points
+        self.cache_size = cache_size
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self._frontier_cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    def optimize(self, snapshot: FundSnapshot, fund_ids: List[str], risk_profile: str) -> Dict[str, Any]:
+        """Return the frontier portfolio matching the given risk profile"""
+        frontier = self.get_frontier(snapshot, fund_ids)
+        target = self.RISK_PROFILE_TARGETS.get(risk_profile, self.RISK_PROFILE_TARGETS['moderate'])
+
+        returns = frontier['returns']
+        target_return = returns[0] + target * (returns[-1] - returns[0])
+        point = int(np.argmin(np.abs(returns - target_return)))
+        weights = frontier['weights'][point]
+        spread = returns[-1] - returns[0]
+
+        return {
+            'fund_weights': {fund_id: float(w) for fund_id, w in zip(frontier['fund_ids'], weights)},
+            'expected_return': round(float(returns[point]) * 100, 2),
+            'volatility': round(float(frontier['volatilities'][point]) * 100, 2),
+            'frontier_position': round(float((returns[point] - returns[0]) / spread), 2) if spread > 0 else 0.0,
+            'shrinkage': round(frontier['shrinkage'], 3)
+        }
+
+    def get_frontier(self, snapshot: FundSnapshot, fund_ids: List[str]) -> Dict[str, Any]:
+        """Get the cached efficient frontier for a fund set, solving it on a miss"""
+        key = (snapshot.snapshot_id, tuple(sorted(fund_ids)))
+
+        with self._lock:
+            frontier = self._frontier_cache.get(key)
+            if frontier is not None:
+                self._frontier_cache.move_to_end(key)
+                self.cache_hits += 1
+                CACHE_LOOKUPS.inc('frontier', 'hit')
+                return frontier
+            self.cache_misses += 1
+        CACHE_LOOKUPS.inc('frontier', 'miss')
+
+        frontier = self._solve_frontier(snapshot, list(key[1]))
+
+        with self._lock:
+            self._frontier_cache[key] = frontier
+            while len(self._frontier_cache) > self.cache_size:
+                self._frontier_cache.popitem(last=False)
+
+        return frontier
+
+    def cache_stats(self) -> Dict[str, Any]:
+        """Hit/miss counters for the frontier cache"""
+        return {
+            'hits': self.cache_hits,
+            'misses': self.cache_misses,
+            'size': len(self._frontier_cache)
+        }
+
+    def _solve_frontier(self, snapshot: FundSnapshot, fund_ids: List[str]) -> Dict[str, Any]:
+        """Trace the long-only efficient frontier for a set of funds"""
+        # Expected returns from the full history, covariance from the recent window
+        mu = snapshot.log_returns_for(fund_ids).mean(axis=0) * TRADING_DAYS
+        cov, shrinkage = self._estimate_covariance(snapshot.log_returns_for(fund_ids, self.lookback_days))
+        cap = max(self.max_fund_weight, 1.0 / len(fund_ids))
+
+        # Endpoints: minimum variance and maximum return portfolios
+        min_var = self._solve_qp(np.zeros_like(mu), cov, 1.0, cap)
+        max_ret = self._max_return_weights(mu, cap)
+
+        # Sweep risk aversion between the two endpoints, warm-starting each solve
+        points = [min_var]
+        weights = min_var
+        for risk_aversion in np.geomspace(200.0, 0.5, self.frontier_points - 2):
+            weights = self._solve_qp(mu, cov, risk_aversion, cap, weights)
+            points.append(weights)
+        points.append(max_ret)
+
+        weights = np.array(points)
+        returns = weights @ mu
+        volatilities = np.sqrt(np.einsum('ij,jk,ik->i', weights, cov, weights))
+
+        # Keep the frontier ordered by return so profile targets are monotone
+        order = np.argsort(returns, kind='stable')
+        return {
+            'fund_ids': fund_ids,
+            'weights': weights[order],
+            'returns': returns[order],
+            'volatilities': volatilities[order],
+            'shrinkage': shrinkage
+        }
+
+    def _estimate_covariance(self, log_returns: np.ndarray):
+        """Annualized Ledoit-Wolf shrunk covariance and the shrinkage intensity used"""
+        n = log_returns.shape[0]
+
+        # Shrink the sample covariance towards a scaled identity (Ledoit & Wolf, 2004)
+        centered = log_returns - log_returns.mean(axis=0)
+        sample_cov = centered.T @ centered / n
+        target = np.trace(sample_cov) / sample_cov.shape[0] * np.eye(sample_cov.shape[0])
+
+        d2 = np.sum((sample_cov - target) ** 2)
+        row_norms = np.sum(centered ** 2, axis=1)
+        b2 = (np.sum(row_norms ** 2) / n - np.sum(sample_cov ** 2)) / n
+        shrinkage = float(min(b2, d2) / d2) if d2 > 0 else 1.0
+
+        cov = (shrinkage * target + (1 - shrinkage) * sample_cov) * TRADING_DAYS
+        return cov, shrinkage
+
+    def _solve_qp(self, mu: np.ndarray, cov: np.ndarray, risk_aversion: float, cap: float,
+                  start: np.ndarray = None, max_iter: int = 500, tol: float = 1e-7) -> np.ndarray:
+        """Maximize mu'w - (risk_aversion / 2) w'Cw over the capped simplex"""
+        step = 1.0 / (risk_aversion * np.linalg.eigvalsh(cov)[-1])
+        weights = np.full(len(mu), 1.0 / len(mu)) if start is None else start.copy()
+        momentum = weights.copy()
+        t = 1.0
+
+        # Accelerated projected gradient (FISTA) with adaptive restart
+        for _ in range(max_iter):
+            gradient = risk_aversion * (cov @ momentum) - mu
+            updated = self._project_capped_simplex(momentum - step * gradient, cap)
+            if gradient @ (updated - weights) > 0:
+                t = 1.0
+            t_next = (1 + np.sqrt(1 + 4 * t * t)) / 2
+            momentum = updated + ((t - 1) / t_next) * (updated - weights)
+            converged = np.max(np.abs(updated - weights)) < tol
+            weights, t = updated, t_next
+            if converged:
+                break
+
+        return weights
+
+    def _max_return_weights(self, mu: np.ndarray, cap: float) -> np.ndarray:
+        """Fill the highest-return funds up to the weight cap"""
+        weights = np.zeros_like(mu)
+        remaining = 1.0
+        for i in np.argsort(-mu):
+            weights[i] = min(cap, remaining)
+            remaining -= weights[i]
+            if remaining <= 0:
+                break
+        return weights
+
+    @staticmethod
+    def _project_capped_simplex(v: np.ndarray, cap: float) -> np.ndarray:
+        """Euclidean projection onto {w : sum(w) = 1, 0 <= w <= cap}"""
+        # sum(clip(v - tau, 0, cap)) is piecewise linear in tau with kinks at
+        # v and v - cap, so evaluate it at every kink and interpolate exactly
+        kinks = np.sort(np.concatenate([v, v - cap]))
+        totals = np.clip(v[None, :] - kinks[:, None], 0, cap).sum(axis=1)
+        i = int(np.searchsorted(-totals, -1.0))
+        if i == 0:
+            tau = kinks[0]
+        else:
+            # totals is non-increasing; interpolate between kinks i-1 and i
+            span = totals[i - 1] - totals[i]
+            frac = (totals[i - 1] - 1.0) / span if span > 0 else 0.0
+            tau = kinks[i - 1] + frac * (kinks[i] - kinks[i - 1])
+        return np.clip(v - tau, 0, cap)
@@ -0,0 +1,79 @@
+import gzip
+import hashlib
+import threading
+from typing import Dict, Any, Callable, Hashable, Optional
+from fast_json import dumps_bytes
+from metrics import CACHE_LOOKUPS
+
+try:
+    import brotli
+except ImportError:
+    # Clients that accept br are served gzip instead
+    brotli = None
+
+
+class PrerenderedResponse:
+    """A JSON body encoded once and stored alongside its compressed variants.
+
+    Each variant gets its own strong ETag (a hash of the uncompressed body
+    plus the content coding), since the bytes on the wire differ.
+    """
+
+    def __init__(self, payload: Any):
+        self.body = dumps_bytes(payload)
+        digest = hashlib.sha256(self.body).hexdigest()[:32]
+        self.bodies = {'identity': self.body}
+        # mtime=0 keeps the gzip bytes, and so the ETag, stable across workers
+        self.bodies['gzip'] = gzip.compress(self.body, compresslevel=9, mtime=0)
+        if brotli is not None:
+            self.bodies['br'] = brotli.compress(self.body, quality=11)
+        self.etags = {
+            coding: f'"{digest}"' if coding == 'identity' else f'"{digest}-{coding}"'
+            for coding in self.bodies
+        }
+
+    def select(self, accept_encodings) -> str:
+        """Content coding to send for a werkzeug Accept-Encoding header"""
+        # Prefer the smallest variant the client accepts
+        codings = sorted(self.bodies, key=lambda coding: len(self.bodies[coding]))
+        return accept_encodings.best_match(codings, default='identity') or 'identity'
+
+    def matches(self, if_none_match) -> bool:
+        """Whether an If-None-Match header names any variant of this body"""
+        # werkzeug's parsed ETags hold the tags without their quotes
+        return any(if_none_match.contains_weak(etag.strip('"')) for etag in self.etags.values())
+
+
+class PrerenderedCache:
+    """Rendered responses keyed by e.g. (route argument, data version).
+
+    Entries for other data versions are dropped when a new version is
+    rendered, so the cache only ever holds the current generation. `name`
+    labels the cache's hit/miss metrics.
+    """
+
+    def __init__(self, name: str = 'prerendered'):
+        self.name = name
+        self._entries: Dict[Hashable, PrerenderedResponse] = {}
+        self._version: Optional[str] = None
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, version: str, render: Callable[[], Any]) -> PrerenderedResponse:
+        """The response for `key` at `version`, rendering the payload on first use"""
+        entry = self._entries.get((key, version))
+        if entry is not None:
+            CACHE_LOOKUPS.inc(self.name, 'hit')
+            return entry
+
+        CACHE_LOOKUPS.inc(self.name, 'miss')
+        entry = PrerenderedResponse(render())
+        with self._lock:
+            if version != self._version:
+                self._entries.clear()
+                self._version = version
+            return self._entries.setdefault((key, version), entry)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._version = None
@@ -0,0 +1,65 @@
+import math
+from typing import Dict, List, Any, Tuple
+
+
+class PromptBuilder:
+    """Assembles an LLM prompt from prioritized sections within a token budget.
+
+    Sections are kept in the order they were added. When the estimated size
+    exceeds `token_budget`, the lowest-priority optional sections are dropped
+    (later ones first on ties) until it fits; required sections are always
+    kept. The prompt is joined once at the end.
+    """
+
+    CHARS_PER_TOKEN = 4
+    SEPARATOR = "\n\n"
+
+    def __init__(self, token_budget: int = 0):
+        # 0 means no budget
+        self.token_budget = token_budget
+        self._sections = []
+
+    @classmethod
+    def estimate_tokens(cls, text: str) -> int:
+        """Rough token count (about four characters per token for English text)"""
+        return math.ceil(len(text) / cls.CHARS_PER_TOKEN)
+
+    def add(self, name: str, text: str, priority: int = 0, required: bool = False) -> 'PromptBuilder':
+        """Add a section; empty sections are skipped"""
+        text = text.strip()
+        if text:
+            self._sections.append({'name': name, 'text': text, 'priority': priority, 'required': required})
+        return self
+
+    def build(self) -> Tuple[str, Dict[str, Any]]:
+        """Render the prompt and report its estimated size and the sections left out"""
+        sections = self._sections
+        separator_tokens = self.estimate_tokens(self.SEPARATOR)
+        tokens = sum(self.estimate_tokens(s['text']) for s in sections) + separator_tokens * max(len(sections) - 1, 0)
+
+        dropped = set()
+        if self.token_budget:
+            optional = sorted(
+                (i for i, s in enumerate(sections) if not s['required']),
+                key=lambda i: (sections[i]['priority'], -i)
+            )
+            for i in optional:
+                if tokens <= self.token_budget:
+                    break
+                tokens -= self.estimate_tokens(sections[i]['text']) + separator_tokens
+                dropped.add(i)
+
+        kept = [s for i, s in enumerate(sections) if i not in dropped]
+        prompt = self.SEPARATOR.join(s['text'] for s in kept)
+        return prompt, {
+            'prompt_tokens': self.estimate_tokens(prompt),
+            'token_budget': self.token_budget,
+            'dropped_sections': [sections[i]['name'] for i in sorted(dropped)]
+        }
+
+
+def format_table(columns: List[str], rows: List[List[Any]]) -> str:
+    """Pipe-delimited table: one header line, then one line per row"""
+    lines = ['|'.join(columns)]
+    lines.extend('|'.join('' if value is None else str(value).replace('|', '/') for value in row) for row in rows)
+    return '\n'.join(lines)
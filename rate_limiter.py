@@ -0,0 +1,132 @@
+import os
+import time
+import sqlite3
+import hashlib
+import logging
+import tempfile
+from typing import Dict, Any, Optional, Tuple
+from sqlite_store import ThreadLocalConnection
+
+logger = logging.getLogger(__name__)
+
+
+class RateLimiter:
+    """Per-client token buckets, shared by every worker process on the host.
+
+    Each client (an API key, or else its IP address) has one bucket per route
+    class: `analyze` for the LLM-backed routes and `default` for everything
+    else. A bucket holds up to `burst` tokens and refills at `per_minute`;
+    every request takes a token and is refused with a Retry-After once the
+    bucket is empty. Bucket state lives in a SQLite database (in WAL mode, like
+    the LLM cache) so a client can't multiply its allowance by landing on
+    different gunicorn workers.
+
+    Separately, /analyze requests are shed with a 503 while the worker
+    already has `shed_queue_depth` analyses queued or running (by default, as
+    many as it can hold), before any recommendation work is done for them.
+    """
+
+    def __init__(self, path: str = None, buckets: Dict[str, Tuple[float, float]] = None,
+                 shed_queue_depth: int = None, shed_retry_after: float = 5.0, trusted_proxies: int = 0):
+        self.path = path or os.path.join(tempfile.gettempdir(), 'mf_rate_limits.sqlite3')
+        # bucket name -> (tokens per minute, burst)
+        self.buckets = buckets or {'analyze': (10.0, 5.0), 'default': (300.0, 60.0)}
+        self.shed_queue_depth = shed_queue_depth
+        self.shed_retry_after = shed_retry_after
+        # Reverse proxies in front of the app that append to X-Forwarded-For
+        self.trusted_proxies = trusted_proxies
+        # A bucket idle this long is full again, so its row can be dropped
+        self.idle_seconds = max(burst / per_minute * 60 for per_minute, burst in self.buckets.values())
+        self._acquires = 0
+        # A short timeout: a check stuck behind another worker fails open rather than stalling the request
+        self._connection = ThreadLocalConnection(self.path, timeout=1.0)
+        self._init_schema()
+
+    @classmethod
+    def from_env(cls) -> Optional['RateLimiter']:
+        """Build the limiter from environment settings, or None when disabled (the default outside gunicorn)"""
+        if os.getenv('RATE_LIMIT_ENABLED', '0').lower() in ('0', 'false', 'no'):
+            return None
+        try:
+            return cls(
+                path=os.getenv('RATE_LIMIT_PATH') or None,
+                buckets={
+                    'analyze': (float(os.getenv('RATE_LIMIT_ANALYZE_PER_MINUTE', 10)), float(os.getenv('RATE_LIMIT_ANALYZE_BURST', 5))),
+                    'default': (float(os.getenv('RATE_LIMIT_DEFAULT_PER_MINUTE', 300)), float(os.getenv('RATE_LIMIT_DEFAULT_BURST', 60)))
+                },
+                shed_queue_depth=int(os.getenv('LOAD_SHED_QUEUE_DEPTH')) if os.getenv('LOAD_SHED_QUEUE_DEPTH') else None,
+                shed_retry_after=float(os.getenv('LOAD_SHED_RETRY_AFTER', 5)),
+                trusted_proxies=int(os.getenv('RATE_LIMIT_TRUSTED_PROXIES', 0))
+            )
+        except Exception as e:
+            logger.warning(f"Rate limiting disabled: {e}")
+            return None
+
+    def _init_schema(self):
+        self._connection().execute("""
+            CREATE TABLE IF NOT EXISTS buckets (
+                key TEXT PRIMARY KEY,
+                tokens REAL NOT NULL,
+                updated_at REAL NOT NULL
+            )
+        """)
+
+    def client_id(self, api_key: Optional[str], remote_addr: Optional[str], forwarded_for: Optional[str] = None) -> str:
+        """Who a request is counted against: its API key (hashed, never stored) or its IP address"""
+        if api_key:
+            return 'key:' + hashlib.sha256(api_key.encode()).hexdigest()[:16]
+        if self.trusted_proxies and forwarded_for:
+            # Each trusted proxy appends the address it saw, so the client is the
+            # Nth entry from the right; anything further left is the client's own
+            # claim (like werkzeug's ProxyFix x_for)
+            addresses = [address.strip() for address in forwarded_for.split(',')]
+            if len(addresses) >= self.trusted_proxies:
+                return 'ip:' + addresses[-self.trusted_proxies]
+        return 'ip:' + (remote_addr or 'unknown')
+
+    def acquire(self, bucket: str, client: str) -> Tuple[bool, float]:
+        """Take a token from the client's bucket; returns (allowed, seconds until a token is available)"""
+        per_minute, burst = self.buckets[bucket]
+        rate = per_minute / 60
+        key = f"{bucket}:{client}"
+        now = time.time()
+        connection = self._connection()
+        try:
+            # IMMEDIATE takes the write lock up front, so concurrent workers can't both spend the last token
+            connection.execute('BEGIN IMMEDIATE')
+            try:
+                row = connection.execute('SELECT tokens, updated_at FROM buckets WHERE key = ?', (key,)).fetchone()
+                tokens = burst if row is None else min(burst, row[0] + max(now - row[1], 0) * rate)
+                allowed = tokens >= 1
+                if allowed:
+                    tokens -= 1
+                connection.execute(
+                    'INSERT INTO buckets (key, tokens, updated_at) VALUES (?, ?, ?) '
+                    'ON CONFLICT(key) DO UPDATE SET tokens = excluded.tokens, updated_at = excluded.updated_at',
+                    (key, tokens, now)
+                )
+                self._acquires += 1
+                if self._acquires % 1000 == 0:
+                    connection.execute('DELETE FROM buckets WHERE updated_at < ?', (now - self.idle_seconds,))
+                connection.execute('COMMIT')
+            except BaseException:
+                connection.execute('ROLLBACK')
+                raise
+        except sqlite3.Error as e:
+            # Fail open: an unavailable store must not take the whole site down
+            logger.warning(f"Rate limit check failed, allowing the request: {e}")
+            return True, 0.0
+
+        return allowed, 0.0 if allowed else (1 - tokens) / rate
+
+    def should_shed(self, backlog: int, capacity: int) -> bool:
+        """Whether an /analyze request should be turned away because `backlog` analyses are already pending"""
+        threshold = capacity if self.shed_queue_depth is None else self.shed_queue_depth
+        return threshold > 0 and backlog >= threshold
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'buckets': {name: {'per_minute': per_minute, 'burst': burst} for name, (per_minute, burst) in self.buckets.items()},
+            'shed_queue_depth': self.shed_queue_depth,
+            'tracked_clients': self._connection().execute('SELECT COUNT(*) FROM buckets').fetchone()[0]
+        }
@@ -0,0 +1,212 @@
+"""
+Declarative schema for the investor profile sent to /analyze.
+
+Each field is declared once in USER_PROFILE_FIELDS; at import time every
+declaration is compiled into a converter that coerces and checks the value,
+so a request is checked in one pass over the schema rather than by ad hoc
+casts. Bad input raises ValidationError listing every offending field, which
+the routes turn into a 400.
+"""
+
+import json
+import math
+from dataclasses import dataclass, fields
+from collections.abc import Mapping
+from typing import Dict, List, Any, Callable, Optional, Tuple
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+class ValidationError(ValueError):
+    """Request body that doesn't match the schema; `errors` lists each problem as {field, message}"""
+
+    def __init__(self, errors: List[Dict[str, str]]):
+        self.errors = errors
+        super().__init__('; '.join(f"{error['field']}: {error['message']}" for error in errors))
+
+
+@dataclass(frozen=True)
+class Field:
+    """One request field: its type, whether it is required, its default and its constraints"""
+    kind: type
+    required: bool = False
+    default: Any = None
+    minimum: Optional[float] = None
+    maximum: Optional[float] = None
+    choices: Optional[Tuple] = None
+    max_length: int = 100
+
+
+MAX_AMOUNT = 1e12
+
+USER_PROFILE_FIELDS: Dict[str, Field] = {
+    'name': Field(str, max_length=200),
+    'age': Field(int, required=True, minimum=18, maximum=100),
+    'annual_income': Field(float, required=True, minimum=0, maximum=MAX_AMOUNT),
+    'investment_amount': Field(float, required=True, minimum=0, maximum=MAX_AMOUNT),
+    'risk_tolerance': Field(str, default='moderate', choices=('low', 'moderate', 'high')),
+    'investment_goal': Field(str, default='wealth_creation', choices=(
+        'retirement', 'child_education', 'wealth_creation', 'short_term', 'tax_saving', 'emergency_fund'
+    )),
+    # Clients send both '5-10' and '5-10 years'
+    'investment_horizon': Field(str, default='5-10 years'),
+    'monthly_sip': Field(float, default=0.0, minimum=0, maximum=MAX_AMOUNT),
+    'existing_investments': Field(float, default=0.0, minimum=0, maximum=MAX_AMOUNT),
+    'tax_bracket': Field(int, default=20, minimum=0, maximum=100),
+    'emergency_fund': Field(str, default='yes', choices=('yes', 'no', 'partial')),
+    'fund_type_preference': Field(str, default='direct', choices=('direct', 'regular')),
+    'esg_preference': Field(str, default='no_preference', choices=('no_preference', 'esg_focused', 'esg_aware')),
+    'dividend_preference': Field(str, default='growth', choices=('growth', 'dividend', 'both')),
+    'lumpsum_investment': Field(float, default=0.0, minimum=0, maximum=MAX_AMOUNT),
+    'sip_investment': Field(float, default=0.0, minimum=0, maximum=MAX_AMOUNT)
+}
+
+
+def _to_int(value: Any) -> int:
+    # bool is an int subclass, but true/false is never a valid count
+    if isinstance(value, bool):
+        raise TypeError
+    if isinstance(value, int):
+        return value
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    if isinstance(value, str):
+        return int(value.strip())
+    raise TypeError
+
+
+def _to_float(value: Any) -> float:
+    if isinstance(value, bool):
+        raise TypeError
+    if isinstance(value, (int, float, str)):
+        number = float(value)
+        if math.isfinite(number):
+            return number
+        raise ValueError
+    raise TypeError
+
+
+def _to_str(value: Any) -> str:
+    if isinstance(value, str):
+        return value
+    raise TypeError
+
+
+_CONVERTERS = {int: (_to_int, 'an integer'), float: (_to_float, 'a number'), str: (_to_str, 'a string')}
+
+
+def _compile(field: Field) -> Callable[[Any], Any]:
+    """Converter for one field: returns the typed value or raises ValueError with the message to report"""
+    convert, expected = _CONVERTERS[field.kind]
+    checks = []
+    if field.kind is str:
+        checks.append((lambda v: len(v) > field.max_length, f"must be at most {field.max_length} characters"))
+    if field.minimum is not None:
+        checks.append((lambda v: v < field.minimum, f"must be at least {field.minimum:g}"))
+    if field.maximum is not None:
+        checks.append((lambda v: v > field.maximum, f"must be at most {field.maximum:g}"))
+    if field.choices is not None:
+        choices = frozenset(field.choices)
+        checks.append((lambda v: v not in choices, f"must be one of {', '.join(map(str, field.choices))}"))
+
+    def converter(value):
+        try:
+            value = convert(value)
+        except (TypeError, ValueError, OverflowError):
+            raise ValueError(f"must be {expected}")
+        for failed, message in checks:
+            if failed(value):
+                raise ValueError(message)
+        return value
+
+    return converter
+
+
+@dataclass(frozen=True, eq=False)
+class UserProfile(Mapping):
+    """Validated investor profile.
+
+    Also a read-only mapping, so the analyzer and recommender keep reading it
+    with user_info['age'] / user_info.get('risk_tolerance'), and it compares
+    equal to (and serializes like) the equivalent dict.
+    """
+    name: Optional[str]
+    age: int
+    annual_income: float
+    investment_amount: float
+    risk_tolerance: str
+    investment_goal: str
+    investment_horizon: str
+    monthly_sip: float
+    existing_investments: float
+    tax_bracket: int
+    emergency_fund: str
+    fund_type_preference: str
+    esg_preference: str
+    dividend_preference: str
+    lumpsum_investment: float
+    sip_investment: float
+
+    def __getitem__(self, key: str) -> Any:
+        if key not in _FIELD_NAMES:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __iter__(self):
+        return iter(_FIELD_NAMES)
+
+    def __len__(self) -> int:
+        return len(_FIELD_NAMES)
+
+    @classmethod
+    def decode(cls, data: Any) -> 'UserProfile':
+        """Validate a parsed request body; raises ValidationError listing every bad field"""
+        if not isinstance(data, dict):
+            raise ValidationError([{'field': 'body', 'message': 'must be a JSON object'}])
+        return _decode(cls, data)
+
+
+_FIELD_NAMES = tuple(field.name for field in fields(UserProfile))
+assert _FIELD_NAMES == tuple(USER_PROFILE_FIELDS), "UserProfile attributes must match USER_PROFILE_FIELDS"
+
+
+_FIELD_CONVERTERS = {name: _compile(field) for name, field in USER_PROFILE_FIELDS.items()}
+
+
+def _decode(cls, data: Dict[str, Any]) -> UserProfile:
+    """Convert every field in turn, collecting errors instead of stopping at the first"""
+    errors = []
+    values = {}
+    for name, field in USER_PROFILE_FIELDS.items():
+        value = data.get(name)
+        # Explicit nulls count as missing
+        if value is None:
+            if field.required:
+                errors.append({'field': name, 'message': 'is required'})
+            values[name] = field.default
+            continue
+        try:
+            values[name] = _FIELD_CONVERTERS[name](value)
+        except ValueError as e:
+            errors.append({'field': name, 'message': str(e)})
+
+    if errors:
+        raise ValidationError(errors)
+    profile = object.__new__(cls)
+    # Frozen dataclasses set attributes one object.__setattr__ call at a time; fill __dict__ directly
+    profile.__dict__.update(values)
+    return profile
+
+
+def loads(body: bytes) -> Dict[str, Any]:
+    """Parse a JSON request body that must be an object; raises ValidationError otherwise"""
+    try:
+        data = orjson.loads(body) if orjson is not None else json.loads(body)
+    except (ValueError, UnicodeDecodeError):
+        raise ValidationError([{'field': 'body', 'message': 'is not valid JSON'}])
+    if not isinstance(data, dict):
+        raise ValidationError([{'field': 'body', 'message': 'must be a JSON object'}])
+    return data
@@ -0,0 +1,109 @@
+import numpy as np
+from statistics import NormalDist
+from typing import Dict, List, Any
+
+from fund_snapshot import FundSnapshot, TRADING_DAYS
+
+# Named stress scenarios: historical windows replay actual fund moves over the
+# window, category shocks apply a fixed return to every fund in a category
+STRESS_SCENARIOS = [
+    {'name': '2008 Global Financial Crisis', 'start': '2008-01-14', 'end': '2009-03-09'},
+    {'name': '2020 COVID-19 Crash', 'start': '2020-02-20', 'end': '2020-03-23'},
+    {'name': 'Small & Mid Cap Sell-off', 'shocks': {
+        'large_cap': -0.08, 'mid_cap': -0.20, 'flexi_cap': -0.14, 'small_cap': -0.30, 'multi_cap': -0.16
+    }},
+    {'name': 'Broad Market Correction', 'shocks': {
+        'large_cap': -0.15, 'mid_cap': -0.20, 'flexi_cap': -0.17, 'small_cap': -0.25, 'multi_cap': -0.18
+    }},
+]
+
+
+class PortfolioRiskEngine:
+    """Portfolio VaR/CVaR and stress testing over the snapshot NAV history.
+
+    Daily returns and the (scenarios x funds) stress matrix are computed once
+    per snapshot, so evaluating a portfolio is a column selection plus a
+    couple of matrix-vector products.
+    """
+
+    def __init__(self, snapshot: FundSnapshot, scenarios: List[Dict[str, Any]] = None,
+                 lookback_days: int = 5 * TRADING_DAYS):
+        self.snapshot = snapshot
+        self.scenarios = scenarios if scenarios is not None else STRESS_SCENARIOS
+        self.lookback_days = lookback_days
+        self.scenario_names, self.scenario_matrix = self._build_scenario_matrix()
+
+    def _build_scenario_matrix(self):
+        """Fund returns under every stress scenario (scenarios x funds)"""
+        navs = self.snapshot.nav_matrix
+        dates = self.snapshot.nav_dates
+        categories = np.array(self.snapshot.categories)
+
+        names, rows = [], []
+        for scenario in self.scenarios:
+            if 'shocks' in scenario:
+                row = np.array([scenario['shocks'].get(category, 0.0) for category in categories])
+            else:
+                start = np.searchsorted(dates, np.datetime64(scenario['start']))
+                end = np.searchsorted(dates, np.datetime64(scenario['end']), side='right') - 1
+                if start >= len(dates) or end <= start:
+                    continue  # Window not covered by the available history
+                row = navs[end] / navs[start] - 1
+            names.append(scenario['name'])
+            rows.append(row)
+
+        matrix = np.vstack(rows) if rows else np.empty((0, navs.shape[1]))
+        return names, matrix
+
+    def portfolio_risk(self, fund_weights: Dict[str, float], portfolio_value: float = 0,
+                       confidence: float = 0.95, horizon_days: int = 21) -> Dict[str, Any]:
+        """Historical and parametric VaR/CVaR plus stress losses for a portfolio"""
+        fund_ids = [fund_id for fund_id, w in fund_weights.items() if w > 0]
+        weights = np.array([fund_weights[fund_id] for fund_id in fund_ids], dtype=float)
+        weights = weights / weights.sum()
+
+        # Overlapping horizon returns of a buy-and-hold portfolio
+        navs = self.snapshot.nav_for(fund_ids, self.lookback_days + horizon_days)
+        returns = (navs[horizon_days:] / navs[:-horizon_days] - 1) @ weights
+
+        historical_var, historical_cvar = self._historical_var(returns, confidence)
+        parametric_var, parametric_cvar = self._parametric_var(returns, confidence)
+
+        losses = self.scenario_matrix[:, self.snapshot.columns_for(fund_ids)] @ weights
+        stress_tests = [
+            {
+                'scenario': name,
+                'portfolio_return': round(float(loss) * 100, 2),
+                'loss_amount': round(float(-loss) * portfolio_value, 2)
+            }
+            for name, loss in zip(self.scenario_names, losses)
+        ]
+
+        return {
+            'confidence': confidence,
+            'horizon_days': horizon_days,
+            'historical_var': round(historical_var * 100, 2),
+            'historical_cvar': round(historical_cvar * 100, 2),
+            'parametric_var': round(parametric_var * 100, 2),
+            'parametric_cvar': round(parametric_cvar * 100, 2),
+            'historical_var_amount': round(historical_var * portfolio_value, 2),
+            'historical_cvar_amount': round(historical_cvar * portfolio_value, 2),
+            'stress_tests': stress_tests
+        }
+
+    @staticmethod
+    def _historical_var(returns: np.ndarray, confidence: float):
+        """Loss quantile and mean tail loss of the empirical return distribution"""
+        cutoff = np.quantile(returns, 1 - confidence)
+        tail = returns[returns <= cutoff]
+        return float(-cutoff), float(-tail.mean())
+
+    @staticmethod
+    def _parametric_var(returns: np.ndarray, confidence: float):
+        """Gaussian VaR/CVaR from the mean and volatility of the returns"""
+        normal = NormalDist()
+        mean, sigma = float(returns.mean()), float(returns.std())
+        z = normal.inv_cdf(1 - confidence)
+        var = -(mean + z * sigma)
+        cvar = -(mean - sigma * normal.pdf(z) / (1 - confidence))
+        return var, cvar
@@ -0,0 +1,148 @@
+import os
+import time
+import logging
+import tempfile
+import threading
+from typing import Dict, Any, Callable, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows: coalesce within a process only
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Collapses concurrent calls for the same key into one execution.
+
+    Within a process, callers that arrive while a call for their key is in
+    flight wait for it and share its result (or its exception). Across worker
+    processes, the leading caller also holds an exclusive lock file for the
+    key; a leader in another process waits for that lock and then runs
+    `recheck` (typically a shared-cache lookup) before doing the work itself.
+    """
+
+    def __init__(self, lock_dir: str = None):
+        self.lock_dir = lock_dir if fcntl else None
+        if self.lock_dir:
+            os.makedirs(self.lock_dir, exist_ok=True)
+        self.leaders = 0
+        self.coalesced = 0
+        self.cross_process_waits = 0
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> 'SingleFlight':
+        """Build with the lock directory from LLM_SINGLE_FLIGHT_DIR"""
+        lock_dir = os.getenv('LLM_SINGLE_FLIGHT_DIR') or os.path.join(tempfile.gettempdir(), 'mf_llm_locks')
+        try:
+            return cls(lock_dir)
+        except OSError as e:
+            logger.warning(f"Cross-process request coalescing disabled: {e}")
+            return cls()
+
+    def do(self, key: str, fn: Callable[[], Any], recheck: Callable[[], Optional[Any]] = None,
+           timeout: float = None) -> Any:
+        """Run fn() once for all concurrent callers of `key` and return its result.
+
+        `key` must be safe to use as a file name (e.g. a hex digest).
+        Raises TimeoutError if the in-flight call does not finish within `timeout`.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self.leaders += 1
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            if not call.done.wait(timeout):
+                raise TimeoutError("Timed out waiting for an identical in-flight request")
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = self._run_exclusive(key, fn, recheck, timeout)
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    def _run_exclusive(self, key: str, fn: Callable[[], Any], recheck: Callable[[], Optional[Any]],
+                       timeout: float = None) -> Any:
+        """Run fn() while holding the key's lock file, unless another process already did the work"""
+        if not self.lock_dir:
+            return fn()
+
+        path = os.path.join(self.lock_dir, f'{key}.lock')
+        fd, waited = self._acquire(path, timeout)
+        try:
+            if waited and recheck is not None:
+                result = recheck()
+                if result is not None:
+                    return result
+            return fn()
+        finally:
+            # Unlink while still holding the lock so the directory does not fill
+            # up; waiters notice the unlinked inode and retry on a fresh file
+            try:
+                os.unlink(path)
+            except OSError:
+                pass
+            fcntl.flock(fd, fcntl.LOCK_UN)
+            os.close(fd)
+
+    def _acquire(self, path: str, timeout: float = None):
+        """Exclusively lock the file at path; returns (fd, whether another process held it)"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        waited = False
+        while True:
+            fd = os.open(path, os.O_CREAT | os.O_RDWR, 0o600)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                if not waited:
+                    waited = True
+                    with self._lock:
+                        self.cross_process_waits += 1
+                os.close(fd)
+                if deadline is not None and time.monotonic() >= deadline:
+                    raise TimeoutError("Timed out waiting for an identical request in another worker")
+                time.sleep(0.05)
+                continue
+
+            # The holder may have unlinked the file between our open and lock
+            try:
+                if os.stat(path).st_ino == os.fstat(fd).st_ino:
+                    return fd, waited
+            except FileNotFoundError:
+                pass
+            waited = True
+            fcntl.flock(fd, fcntl.LOCK_UN)
+            os.close(fd)
+
+    def stats(self) -> Dict[str, Any]:
+        """How many calls ran and how many were coalesced into them"""
+        with self._lock:
+            return {
+                'leaders': self.leaders,
+                'coalesced': self.coalesced,
+                'cross_process_waits': self.cross_process_waits,
+                'in_flight': len(self._calls)
+            }
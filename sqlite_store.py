@@ -0,0 +1,34 @@
+"""
+SQLite connections for the small stores every worker process on the host
+shares (the LLM cache, analysis jobs, rate limits).
+"""
+
+import os
+import sqlite3
+import threading
+
+
+class ThreadLocalConnection:
+    """Per-thread SQLite connection in WAL mode; call it to get this thread's connection.
+
+    SQLite connections must not be shared across threads, and a connection
+    inherited through fork (e.g. opened by a preloading gunicorn master) is
+    never reused, since SQLite handles must not cross process boundaries.
+    Connections run in autocommit mode; callers needing a transaction issue
+    BEGIN themselves.
+    """
+
+    def __init__(self, path: str, timeout: float = 5.0):
+        self.path = path
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def __call__(self) -> sqlite3.Connection:
+        connection = getattr(self._local, 'connection', None)
+        if connection is None or self._local.pid != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return connection
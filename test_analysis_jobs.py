@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+"""
+Tests for background LLM analysis jobs and the /analysis endpoint
+"""
+
+import os
+import time
+import tempfile
+import threading
+from analysis_jobs import AnalysisJobManager, AnalysisJobStore, AnalysisQueueFullError
+from llm_backends import LLMBackend
+
+class BlockingBackend(LLMBackend):
+    """LLM backend that answers only once released"""
+
+    def __init__(self):
+        self.release = threading.Event()
+        self.calls = 0
+
+    def generate(self, prompt, timeout):
+        self.calls += 1
+        self.release.wait(5)
+        return 'We recommend a diversified SIP portfolio for the long term.'
+
+USER_PROFILE = {
+    'name': 'Test User',
+    'age': 30,
+    'annual_income': 1000000,
+    'investment_amount': 100000,
+    'monthly_sip': 5000
+}
+
+def slow_add(a, b):
+    time.sleep(0.2)
+    return a + b
+
+def failing_job():
+    raise RuntimeError("upstream failed")
+
+def test_job_lifecycle():
+    """Jobs report pending, then done with their result"""
+    manager = AnalysisJobManager(max_workers=2)
+    job_id = manager.submit(slow_add, 2, 3)
+
+    assert manager.get(job_id)['status'] == 'pending'
+    assert manager.get(job_id, wait=2)['result'] == 5
+    assert manager.get('missing') is None
+
+def test_failed_job_reports_error():
+    """Exceptions in the job are captured in its record"""
+    manager = AnalysisJobManager(max_workers=1)
+    job = manager.get(manager.submit(failing_job), wait=2)
+
+    assert job['status'] == 'error'
+    assert 'upstream failed' in job['error']
+
+def test_jobs_visible_to_other_workers():
+    """A job started in one worker can be polled from another through the shared store"""
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'jobs.sqlite3')
+        owner = AnalysisJobManager(store=AnalysisJobStore(path))
+        other = AnalysisJobManager(store=AnalysisJobStore(path))
+
+        job_id = owner.submit(slow_add, 1, 1)
+        assert other.get(job_id)['status'] == 'pending'
+        assert other.get(job_id, wait=3)['result'] == 2
+
+def test_store_expires_jobs_only_by_age():
+    """Pending jobs stay visible however many others are stored; old ones expire"""
+    with tempfile.TemporaryDirectory() as directory:
+        store = AnalysisJobStore(os.path.join(directory, 'jobs.sqlite3'), retention_seconds=60)
+        store.put('first', {'status': 'pending'})
+        for i in range(50):
+            store.put(f'job{i}', {'status': 'done', 'result': i})
+
+        assert store.get('first') == {'status': 'pending'}
+        store.retention_seconds = -1
+        assert store.get('first') is None
+
+def test_analyze_returns_before_llm_finishes(app_module):
+    """/analyze responds with a job id while the LLM call is still running"""
+    recommender = app_module.llm_recommender
+    original_backend, original_cache = recommender.backend, recommender.cache
+    backend = BlockingBackend()
+    recommender.backend, recommender.cache = backend, None
+    try:
+        client = app_module.app.test_client()
+        data = client.post('/analyze', json=USER_PROFILE).get_json()
+
+        assert data['success'] and data['llm_analysis']['pending']
+        poll_url = data['analysis_job']['poll_url']
+        assert client.get(poll_url).status_code == 202
+
+        backend.release.set()
+        poll = client.get(f"{poll_url}?wait=5")
+        assert poll.status_code == 200
+        assert poll.get_json()['llm_analysis']['key_insights']
+    finally:
+        backend.release.set()
+        recommender.backend, recommender.cache = original_backend, original_cache
+
+def test_job_queue_is_bounded():
+    """Once every thread is busy and `max_queue` jobs wait, further jobs are refused"""
+    release = threading.Event()
+    manager = AnalysisJobManager(max_workers=1, max_queue=1)
+    first = manager.submit(release.wait, 5)
+    second = manager.submit(release.wait, 5)
+    try:
+        manager.submit(release.wait, 5)
+        assert False, "a third job should not fit"
+    except AnalysisQueueFullError:
+        pass
+    assert manager.backlog == 2 and manager.stats()['rejected'] == 1
+
+    release.set()
+    assert manager.get(first, wait=2)['status'] == manager.get(second, wait=2)['status'] == 'done'
+    assert manager.backlog == 0
+
+def test_queued_jobs_past_their_deadline_get_the_fallback(app_module):
+    """The deadline starts at /analyze: jobs that wait it out never call the LLM, and a full queue falls back inline"""
+    recommender = app_module.llm_recommender
+    saved = recommender.backend, recommender.cache, recommender.deadline_seconds, app_module.analysis_jobs
+    backend = BlockingBackend()
+    recommender.backend, recommender.cache, recommender.deadline_seconds = backend, None, 0.2
+    app_module.analysis_jobs = AnalysisJobManager(max_workers=1, max_queue=2)
+    try:
+        client = app_module.app.test_client()
+        responses = [client.post('/analyze', json={**USER_PROFILE, 'age': 30 + i}).get_json() for i in range(4)]
+        assert [('analysis_job' in data) for data in responses] == [True, True, True, False]
+        assert responses[3]['llm_analysis']['fallback']
+
+        time.sleep(0.3)
+        backend.release.set()
+        polls = [client.get(f"{data['analysis_job']['poll_url']}?wait=5").get_json() for data in responses[:3]]
+        # Only the job that started in time reached the backend
+        assert backend.calls == 1
+        assert polls[1]['llm_analysis']['fallback'] and polls[2]['llm_analysis']['fallback']
+    finally:
+        backend.release.set()
+        recommender.backend, recommender.cache, recommender.deadline_seconds, app_module.analysis_jobs = saved
+
+def test_analysis_wait_must_be_finite(app_module):
+    """Non-numeric, infinite and NaN waits are rejected instead of pinning a worker"""
+    client = app_module.app.test_client()
+
+    for wait in ('inf', 'nan', '-1', 'soon'):
+        assert client.get(f'/analysis/unknown?wait={wait}').status_code == 400
+    assert client.get('/analysis/unknown').status_code == 404
+
+if __name__ == "__main__":
+    from conftest import load_app
+    test_job_lifecycle()
+    test_failed_job_reports_error()
+    test_jobs_visible_to_other_workers()
+    test_store_expires_jobs_only_by_age()
+    test_analyze_returns_before_llm_finishes(load_app())
+    test_job_queue_is_bounded()
+    test_queued_jobs_past_their_deadline_get_the_fallback(load_app())
+    test_analysis_wait_must_be_finite(load_app())
+    print("✅ Analysis job tests passed")
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+Tests for the ASGI entry point and the async /analyze path
+"""
+
+import json
+import time
+import asyncio
+from llm_backends import FakeBackend
+from llm_resilience import LLMConcurrencyLimiter
+
+class ConcurrencyTrackingBackend(FakeBackend):
+    """Fake LLM that records how many async calls were in flight at once"""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.in_flight = 0
+        self.peak = 0
+
+    async def agenerate(self, prompt, timeout):
+        self.in_flight += 1
+        self.peak = max(self.peak, self.in_flight)
+        try:
+            return await super().agenerate(prompt, timeout)
+        finally:
+            self.in_flight -= 1
+
+def profile(i):
+    return {
+        'name': f'User {i}',
+        'age': 25 + i % 30,
+        'annual_income': 1000000,
+        'investment_amount': 100000 + 1000 * i,
+        'monthly_sip': 5000,
+        'wait_for_analysis': True
+    }
+
+async def request(app, method, path, body=None):
+    """Run one request through the ASGI app; returns (status, parsed JSON body)"""
+    scope = {'type': 'http', 'http_version': '1.1', 'method': method, 'path': path, 'raw_path': path.encode(),
+             'query_string': b'', 'root_path': '', 'scheme': 'http', 'server': ('testserver', 80),
+             'client': ('127.0.0.1', 1234), 'headers': [(b'host', b'testserver'), (b'content-type', b'application/json')]}
+    sent = False
+    messages = []
+
+    async def receive():
+        nonlocal sent
+        if not sent:
+            sent = True
+            return {'type': 'http.request', 'body': json.dumps(body).encode() if body is not None else b'', 'more_body': False}
+        await asyncio.sleep(3600)
+
+    async def send(message):
+        messages.append(message)
+
+    await app(scope, receive, send)
+    status = next(m['status'] for m in messages if m['type'] == 'http.response.start')
+    payload = b''.join(m.get('body', b'') for m in messages if m['type'] == 'http.response.body')
+    return status, json.loads(payload)
+
+def with_recommender(asgi, backend, limiter, test):
+    """Run `test` with the shared recommender using the given backend and limiter, and no cache"""
+    recommender = asgi.flask_app.llm_recommender
+    saved = recommender.backend, recommender.limiter, recommender.cache
+    recommender.backend, recommender.limiter, recommender.cache = backend, limiter, None
+    try:
+        return test(recommender)
+    finally:
+        recommender.backend, recommender.limiter, recommender.cache = saved
+
+def test_hundreds_of_concurrent_analyses_in_one_process(asgi_module):
+    """LLM calls are awaited, so every request waits on the LLM at the same time"""
+    backend = ConcurrencyTrackingBackend(latency_median=2.0, latency_sigma=0.0)
+
+    def test(recommender):
+        async def burst():
+            return await asyncio.gather(*(request(asgi_module.app, 'POST', '/analyze', profile(i)) for i in range(200)))
+
+        started = time.monotonic()
+        responses = asyncio.run(burst())
+        elapsed = time.monotonic() - started
+
+        assert all(status == 200 for status, _ in responses)
+        assert not any(body['llm_analysis'].get('fallback') for _, body in responses)
+        assert backend.calls == 200 and backend.peak >= 100
+        # Serially, 200 two-second calls would take over six minutes
+        assert elapsed < 30, f"took {elapsed:.1f}s"
+
+    with_recommender(asgi_module, backend, LLMConcurrencyLimiter(max_concurrency=500, max_queue=0), test)
+
+def test_identical_requests_share_one_call_and_overflow_gets_fallback(asgi_module):
+    """Concurrent identical prompts await one call; requests beyond the limiter's queue are served the fallback"""
+
+    def coalesce(recommender):
+        async def burst():
+            return await asyncio.gather(*(request(asgi_module.app, 'POST', '/analyze', profile(0)) for _ in range(20)))
+
+        responses = asyncio.run(burst())
+        assert recommender.backend.calls == 1
+        assert len({body['llm_analysis']['sections']['full_analysis'] for _, body in responses}) == 1
+
+    with_recommender(asgi_module, FakeBackend(latency_median=0.3, latency_sigma=0.0), LLMConcurrencyLimiter(4, 16), coalesce)
+
+    def overflow(recommender):
+        async def burst():
+            return await asyncio.gather(*(request(asgi_module.app, 'POST', '/analyze', profile(i)) for i in range(10)))
+
+        responses = asyncio.run(burst())
+        fallbacks = sum(bool(body['llm_analysis'].get('fallback')) for _, body in responses)
+        assert all(status == 200 for status, _ in responses)
+        assert fallbacks == 10 - 2 - 3
+        assert recommender.limiter.stats()['rejected'] == fallbacks and recommender.backend.calls == 5
+
+    with_recommender(asgi_module, FakeBackend(latency_median=1.0, latency_sigma=0.0), LLMConcurrencyLimiter(2, 3), overflow)
+
+def test_other_routes_are_served_by_flask(asgi_module):
+    """Non-/analyze routes and errors go through the WSGI app or match its responses"""
+    status, body = asyncio.run(request(asgi_module.app, 'GET', '/llm-stats'))
+    assert status == 200 and body['success'] and 'concurrency' in body['llm']
+
+    status, body = asyncio.run(request(asgi_module.app, 'POST', '/analyze', {'name': 'No age'}))
+    assert status == 400 and not body['success']
+    assert body['errors'] == [{'field': 'age', 'message': 'is required'}, {'field': 'annual_income', 'message': 'is required'},
+                              {'field': 'investment_amount', 'message': 'is required'}]
+
+if __name__ == "__main__":
+    from conftest import load_asgi
+    test_hundreds_of_concurrent_analyses_in_one_process(load_asgi())
+    test_identical_requests_share_one_call_and_overflow_gets_fallback(load_asgi())
+    test_other_routes_are_served_by_flask(load_asgi())
+    print("✅ ASGI tests passed")
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+Tests for the historical allocation backtester
+"""
+
+import numpy as np
+from mutual_fund_analyzer import MutualFundAnalyzer
+from backtester import PortfolioBacktester
+
+FUND_IDS = ['LARGE_001', 'MID_001', 'FLEXI_001', 'SMALL_001']
+
+def simulate_day_by_day(dates, navs, weights, lumpsum, monthly_sip, interval):
+    """Reference simulation that walks the dates one at a time"""
+    months = dates.astype('datetime64[M]')
+    sip_days = set(np.flatnonzero(np.r_[True, months[1:] != months[:-1]]))
+    rebalance_days = set(sorted(sip_days)[::interval]) if interval else {0}
+
+    units = np.zeros(len(weights))
+    values = []
+    for t in range(len(dates)):
+        cash = (lumpsum if t == 0 else 0) + (monthly_sip if t in sip_days else 0)
+        if t in rebalance_days:
+            units = (units @ navs[t] + cash) * weights / navs[t]
+        else:
+            units += cash * weights / navs[t]
+        values.append(units @ navs[t])
+    return np.array(values)
+
+def test_matches_day_by_day_simulation():
+    """Vectorized values match a naive loop for every rebalancing frequency"""
+    analyzer = MutualFundAnalyzer()
+    backtester = PortfolioBacktester(analyzer.snapshot)
+    weights = np.random.default_rng(3).dirichlet(np.ones(len(FUND_IDS)), size=3)
+
+    for rebalance, interval in backtester.REBALANCE_FREQUENCIES.items():
+        dates, navs = backtester._window(FUND_IDS, 5)
+        values, _ = backtester._simulate(dates, navs, weights.T, 100000, 5000, rebalance)
+        for i, w in enumerate(weights):
+            expected = simulate_day_by_day(dates, navs, w, 100000, 5000, interval)
+            assert np.allclose(values[:, i], expected, rtol=1e-9), rebalance
+
+def test_backtest_many_reports_metrics_per_allocation():
+    """Each allocation gets its own CAGR, volatility and drawdown"""
+    analyzer = MutualFundAnalyzer()
+    results = analyzer.backtest_allocations(FUND_IDS, lumpsum=100000, monthly_sip=5000, years=10, include_series=True)
+
+    assert set(results) == {'low', 'moderate', 'high'}
+    for result in results.values():
+        assert result['total_invested'] > 100000
+        assert result['max_drawdown'] <= 0
+        assert result['volatility'] > 0
+        assert len(result['series']['values']) == len(result['series']['dates'])
+
+def test_recommendations_include_backtest():
+    """get_recommendations replays the suggested allocation"""
+    analyzer = MutualFundAnalyzer()
+    user_info = {
+        'age': 35,
+        'annual_income': 800000,
+        'investment_amount': 100000,
+        'monthly_sip': 5000,
+        'risk_tolerance': 'moderate',
+        'investment_horizon': '5-10 years'
+    }
+
+    backtest = analyzer.get_recommendations(user_info)['advanced_analysis']['backtest']
+
+    assert backtest['final_value'] > 0
+    assert backtest['rebalance'] == 'annual'
+
+def test_backtest_endpoint_rejects_bad_input(app_module):
+    """Bad fund ids or weights get a readable 400 instead of a 500 or NaN values"""
+    client = app_module.app.test_client()
+
+    bad_requests = [
+        {'monthly_sip': 5000},
+        {'fund_ids': ['LARGE_001', 'bogus'], 'monthly_sip': 5000},
+        {'fund_ids': FUND_IDS, 'allocations': {'mine': {'OTHER_001': 1}}, 'monthly_sip': 5000},
+        {'fund_ids': FUND_IDS, 'allocations': {'mine': {'LARGE_001': 0}}, 'monthly_sip': 5000},
+        {'fund_ids': FUND_IDS, 'allocations': {'mine': {'LARGE_001': -1, 'MID_001': 2}}, 'monthly_sip': 5000},
+        {'fund_ids': FUND_IDS, 'monthly_sip': 'NaN'},
+    ]
+    for body in bad_requests:
+        response = client.post('/backtest', json=body)
+        assert response.status_code == 400, body
+        assert response.get_json()['error'] not in ("'fund_ids'", "'bogus'")
+
+    response = client.post('/backtest', json={'fund_ids': FUND_IDS, 'monthly_sip': 5000, 'years': 3})
+    assert response.status_code == 200
+    assert 'NaN' not in response.get_data(as_text=True)
+
+if __name__ == "__main__":
+    from conftest import load_app
+    test_matches_day_by_day_simulation()
+    test_backtest_many_reports_metrics_per_allocation()
+    test_recommendations_include_backtest()
+    test_backtest_endpoint_rejects_bad_input(load_app())
+    print("✅ Backtester tests passed")
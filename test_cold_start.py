@@ -0,0 +1,46 @@
+#!/usr/bin/env python3
+"""
+Tests for the import-time cost of the serverless entry points
+"""
+
+import os
+import sys
+import subprocess
+
+HEAVY_MODULES = ['pandas', 'scipy', 'yfinance', 'bs4', 'requests', 'google.generativeai']
+
+def import_profile(module):
+    """Import `module` in a fresh interpreter; returns ({module: cumulative seconds}, loaded heavy modules)"""
+    code = f"import sys, {module}; print(','.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))"
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', code],
+        cwd=os.path.dirname(os.path.abspath(__file__)), capture_output=True, text=True, check=True
+    )
+    cumulative = {}
+    for line in result.stderr.splitlines():
+        if line.startswith('import time:') and '|' in line:
+            _, total, name = line[len('import time:'):].split('|')
+            if total.strip().isdigit():
+                cumulative[name.strip()] = int(total) / 1e6
+    loaded = [m for m in result.stdout.strip().split(',') if m]
+    return cumulative, loaded
+
+def test_entry_points_skip_heavy_imports():
+    """Importing the app (as wsgi.py and api/index.py do) loads no heavy optional dependency"""
+    for entry_point in ('wsgi', 'api.index'):
+        cumulative, loaded = import_profile(entry_point)
+        assert loaded == [], f"{entry_point} imported {loaded} at startup"
+        assert not [name for name in cumulative if name.split('.')[0] in ('pandas', 'scipy', 'yfinance', 'bs4')]
+
+def benchmark_import():
+    """Cumulative `python -X importtime` cost of importing the app.
+
+    Loading pandas, scipy, yfinance and the Gemini SDK eagerly took about 1.6s.
+    """
+    cumulative, _ = import_profile('app')
+    print(f"app imports in {cumulative['app'] * 1000:.0f} ms")
+
+if __name__ == "__main__":
+    test_entry_points_skip_heavy_imports()
+    benchmark_import()
+    print("✅ Cold start tests passed")
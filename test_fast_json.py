@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+Tests for the fast JSON encoder and the slim /analyze response format
+"""
+
+import json
+import time
+import numpy as np
+import fast_json
+from fast_json import dumps_bytes
+from llm_backends import FakeBackend
+
+USER_PROFILE = {
+    'name': 'Test User',
+    'age': 30,
+    'annual_income': 1000000,
+    'investment_amount': 100000,
+    'monthly_sip': 5000,
+    'risk_tolerance': 'high',
+    'investment_horizon': '10+ years',
+    'wait_for_analysis': True
+}
+
+def analyze(app_module, query=''):
+    """POST /analyze with the offline LLM backend; returns the response"""
+    recommender = app_module.llm_recommender
+    saved = recommender.backend, recommender.cache
+    recommender.backend, recommender.cache = FakeBackend(latency_median=0), None
+    try:
+        return app_module.app.test_client().post(f'/analyze{query}', json=USER_PROFILE)
+    finally:
+        recommender.backend, recommender.cache = saved
+
+def test_encoders_agree():
+    """orjson and the stdlib fallback encode numpy values, unicode and int keys the same way"""
+    payload = {'amount': np.float64(1.5), 'count': np.int64(3), 'series': np.arange(3), 'label': '₹10,000', 7: [None, True]}
+    expected = {'amount': 1.5, 'count': 3, 'series': [0, 1, 2], 'label': '₹10,000', '7': [None, True]}
+    assert json.loads(dumps_bytes(payload)) == expected
+
+    saved = fast_json.orjson
+    fast_json.orjson = None
+    try:
+        assert json.loads(dumps_bytes(payload)) == expected
+    finally:
+        fast_json.orjson = saved
+
+def test_slim_format_sends_each_fund_once(app_module):
+    """Funds are referenced by id and expand back to the full response"""
+    full = analyze(app_module).get_json()
+    slim = analyze(app_module, '?format=slim').get_json()
+
+    assert 'user_info' not in slim and 'funds' not in full
+    funds = slim['funds']
+    for category, fund_ids in slim['recommendations']['recommendations'].items():
+        assert [funds[fund_id] for fund_id in fund_ids] == full['recommendations']['recommendations'][category]
+    for category, suggestion in slim['llm_analysis']['suggested_allocations'].items():
+        assert [funds[fund_id] for fund_id in suggestion['funds']] == full['llm_analysis']['suggested_allocations'][category]['funds']
+    assert slim['recommendations']['advanced_analysis'] == full['recommendations']['advanced_analysis']
+
+def test_sparse_fieldset_limits_fund_attributes(app_module):
+    """fields= keeps only the named fund attributes, plus the id"""
+    response = analyze(app_module, '?format=slim&fields=name,nav')
+    funds = response.get_json()['funds']
+
+    assert funds and all(set(fund) == {'id', 'name', 'nav'} for fund in funds.values())
+    assert len(response.data) < len(analyze(app_module, '?format=slim').data) < len(analyze(app_module).data)
+
+def benchmark_payloads(app_module, repeats: int = 200):
+    """Payload sizes of each format and encode time of the stdlib encoder against orjson"""
+    sizes = {
+        'full': len(analyze(app_module).data),
+        'slim': len(analyze(app_module, '?format=slim').data),
+        'slim, 4 fields': len(analyze(app_module, '?format=slim&fields=name,category,expense_ratio,grow_url').data)
+    }
+    print(', '.join(f"{name}: {size / 1024:.1f} KB" for name, size in sizes.items()))
+
+    payload = json.loads(analyze(app_module).data)
+    started = time.perf_counter()
+    for _ in range(repeats):
+        json.dumps(payload, sort_keys=True)
+    stdlib = (time.perf_counter() - started) / repeats
+    started = time.perf_counter()
+    for _ in range(repeats):
+        dumps_bytes(payload)
+    fast = (time.perf_counter() - started) / repeats
+    print(f"Encode full payload: stdlib {stdlib * 1e6:.0f} us, {'orjson' if fast_json.orjson else 'fallback'} {fast * 1e6:.0f} us")
+
+if __name__ == "__main__":
+    from conftest import load_app
+    test_encoders_agree()
+    test_slim_format_sends_each_fund_once(load_app())
+    test_sparse_fieldset_limits_fund_attributes(load_app())
+    benchmark_payloads(load_app())
+    print("✅ Fast JSON tests passed")
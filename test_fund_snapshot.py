@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+"""
+Tests for the fund snapshot and its precomputed drawdown analytics
+"""
+
+import os
+import json
+import time
+import tempfile
+import numpy as np
+from fund_snapshot import FundSnapshot, SnapshotFormatError
+from mutual_fund_analyzer import MutualFundAnalyzer
+
+USER_INFO = {
+    'age': 35,
+    'annual_income': 1200000,
+    'investment_amount': 200000,
+    'monthly_sip': 10000,
+    'risk_tolerance': 'moderate',
+    'investment_horizon': '10+ years'
+}
+
+def analyzer_with_snapshot(path):
+    """Analyzer constructed with FUND_SNAPSHOT_PATH pointing at `path`"""
+    previous = os.environ.get('FUND_SNAPSHOT_PATH')
+    os.environ['FUND_SNAPSHOT_PATH'] = path
+    try:
+        return MutualFundAnalyzer()
+    finally:
+        if previous is None:
+            os.environ.pop('FUND_SNAPSHOT_PATH')
+        else:
+            os.environ['FUND_SNAPSHOT_PATH'] = previous
+
+def test_snapshot_covers_every_fund():
+    """Every sample fund has a NAV column ending at its current NAV"""
+    analyzer = MutualFundAnalyzer()
+    snapshot = analyzer.snapshot
+
+    for funds in analyzer.fund_data.values():
+        for fund in funds:
+            column = snapshot.fund_index[fund['id']]
+            assert abs(snapshot.nav_matrix[-1, column] - fund['nav']) < 1e-9
+
+def test_drawdowns_match_reference_loop():
+    """Vectorized max drawdown and recovery match a per-fund loop"""
+    snapshot = MutualFundAnalyzer().snapshot
+
+    for fund_id in ['LARGE_001', 'MID_003', 'SMALL_005']:
+        navs = snapshot.nav_matrix[:, snapshot.fund_index[fund_id]]
+        peak, peak_at, worst, trough_at, trough_peak = navs[0], 0, 0.0, 0, navs[0]
+        for t, nav in enumerate(navs):
+            if nav >= peak:
+                peak, peak_at = nav, t
+            if nav / peak - 1 < worst:
+                worst, trough_at, trough_peak = nav / peak - 1, t, peak
+        recovered_at = next((t for t in range(trough_at, len(navs)) if navs[t] >= trough_peak), None)
+
+        metrics = snapshot.drawdown_for(fund_id)
+        assert abs(metrics['max_drawdown'] - round(worst * 100, 2)) < 1e-9
+        assert metrics['trough_date'] == str(snapshot.nav_dates[trough_at])
+        if recovered_at is None:
+            assert metrics['recovery_days'] is None
+        else:
+            expected_days = (snapshot.nav_dates[recovered_at] - snapshot.nav_dates[trough_at]).astype(int)
+            assert metrics['recovery_days'] == expected_days
+
+def test_volatility_analysis_surfaces_drawdowns():
+    """Volatility analysis reports drawdowns for the recommended funds"""
+    analyzer = MutualFundAnalyzer()
+    user_info = {
+        'age': 28,
+        'annual_income': 600000,
+        'investment_amount': 50000,
+        'risk_tolerance': 'high',
+        'investment_horizon': '10+ years'
+    }
+
+    volatility = analyzer.get_recommendations(user_info)['advanced_analysis']['volatility_analysis']
+
+    assert volatility['worst_drawdown']['max_drawdown'] <= volatility['average_max_drawdown'] < 0
+    assert all(np.isfinite(m['max_drawdown']) for m in volatility['drawdowns'].values())
+
+def test_saved_snapshot_loads_as_read_only_memory_map():
+    """A loaded snapshot maps the same arrays, scores and rankings without copying them"""
+    built = MutualFundAnalyzer().snapshot
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'funds.snapshot')
+        built.save(path)
+        loaded = FundSnapshot.load(path)
+
+        assert isinstance(loaded.nav_matrix, np.memmap) and not loaded.nav_matrix.flags.writeable
+        assert loaded.snapshot_id == built.snapshot_id and loaded.fund_ids == built.fund_ids
+        assert np.array_equal(loaded.nav_matrix, built.nav_matrix)
+        assert np.array_equal(loaded.nav_dates, built.nav_dates)
+        assert all(np.array_equal(loaded.rankings[name], built.rankings[name]) for name in built.rankings)
+        assert loaded.drawdown_for('MID_003') == built.drawdown_for('MID_003')
+        assert [int(i) for i in loaded.ranked('composite_score', 'mid_cap')] == [int(i) for i in built.ranked('composite_score', 'mid_cap')]
+        assert loaded.records_by_category() == json.loads(json.dumps(built.records_by_category()))
+
+def test_rankings_match_sorting_by_score():
+    """Precomputed per-category rankings order funds exactly like sorting their scores"""
+    analyzer = MutualFundAnalyzer()
+    snapshot = analyzer.snapshot
+    for category, funds in analyzer.fund_data.items():
+        expected = sorted(funds, key=analyzer._calculate_composite_score, reverse=True)
+        assert [snapshot.fund_records[i]['id'] for i in snapshot.ranked('composite_score', category)] == [f['id'] for f in expected]
+    assert len(snapshot.ranked('composite_score', 'unknown')) == 0
+
+def test_recommendations_leave_snapshot_records_untouched():
+    """Each request annotates its own copies of the funds, never the shared snapshot records"""
+    analyzer = MutualFundAnalyzer()
+    before = json.dumps(analyzer.snapshot.fund_records, sort_keys=True)
+
+    recommendations = analyzer.get_recommendations(USER_INFO)
+    for funds in recommendations['recommendations'].values():
+        for fund in funds:
+            assert 'score' in fund
+            fund['grow_url'] = 'https://example.com'
+
+    assert json.dumps(analyzer.snapshot.fund_records, sort_keys=True) == before
+
+def test_analyzer_reuses_snapshot_file():
+    """The first analyzer writes the snapshot; later ones map it and give identical answers"""
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'funds.snapshot')
+        first = analyzer_with_snapshot(path)
+        assert os.path.exists(path) and first.snapshot.nav_matrix.flags.writeable
+
+        second = analyzer_with_snapshot(path)
+        assert not second.snapshot.nav_matrix.flags.writeable
+        assert second.data_version == first.data_version
+        assert second.get_recommendations(dict(USER_INFO)) == first.get_recommendations(dict(USER_INFO))
+        assert second.get_top_funds('small_cap') == first.get_top_funds('small_cap')
+
+def test_unreadable_snapshot_is_rebuilt():
+    """Foreign, truncated or old-format files are replaced by a fresh snapshot"""
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'funds.snapshot')
+        MutualFundAnalyzer().snapshot.save(path)
+        with open(path, 'rb') as f:
+            valid = f.read()
+
+        for broken in (b'not a snapshot', valid[:len(valid) // 2], valid[:8] + b'\x63' + valid[9:]):
+            with open(path, 'wb') as f:
+                f.write(broken)
+            try:
+                FundSnapshot.load(path)
+                assert False, "an unusable snapshot must be rejected"
+            except SnapshotFormatError:
+                pass
+
+            analyzer = analyzer_with_snapshot(path)
+            assert analyzer.get_top_funds('large_cap')
+            assert FundSnapshot.load(path).snapshot_id == analyzer.snapshot.snapshot_id
+
+def benchmark_startup(repeats: int = 20):
+    """Compare building the snapshot from source data with mapping a saved one"""
+    analyzer = MutualFundAnalyzer()
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'funds.snapshot')
+        analyzer.snapshot.save(path)
+        started = time.perf_counter()
+        for _ in range(repeats):
+            analyzer.build_snapshot()
+        built = (time.perf_counter() - started) / repeats
+        started = time.perf_counter()
+        for _ in range(repeats):
+            FundSnapshot.load(path)
+        loaded = (time.perf_counter() - started) / repeats
+        print(f"Build {built * 1000:.1f} ms, load {loaded * 1000:.2f} ms ({os.path.getsize(path) / 1e6:.1f} MB file)")
+
+if __name__ == "__main__":
+    test_snapshot_covers_every_fund()
+    test_drawdowns_match_reference_loop()
+    test_volatility_analysis_surfaces_drawdowns()
+    test_saved_snapshot_loads_as_read_only_memory_map()
+    test_rankings_match_sorting_by_score()
+    test_recommendations_leave_snapshot_records_untouched()
+    test_analyzer_reuses_snapshot_file()
+    test_unreadable_snapshot_is_rebuilt()
+    benchmark_startup()
+    print("✅ Fund snapshot tests passed")
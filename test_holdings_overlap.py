@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+Tests for the holdings-overlap engine
+"""
+
+import os
+import tempfile
+import numpy as np
+import pandas as pd
+from holdings_overlap import HoldingsOverlap
+from mutual_fund_analyzer import MutualFundAnalyzer
+
+def test_identical_portfolios_fully_overlap():
+    """Two funds holding the same stocks at the same weights overlap 100%"""
+    records = pd.DataFrame([
+        ('FUND_A', 'INE001', 60), ('FUND_A', 'INE002', 40),
+        ('FUND_B', 'INE001', 60), ('FUND_B', 'INE002', 40),
+        ('FUND_C', 'INE003', 100)
+    ], columns=['fund_id', 'security_id', 'weight'])
+
+    holdings = HoldingsOverlap.from_records(['FUND_A', 'FUND_B', 'FUND_C'], records)
+
+    assert np.allclose(holdings.overlap_matrix, [[1, 1, 0], [1, 1, 0], [0, 0, 1]])
+    assert holdings.common_holdings[0, 1] == 2
+    assert holdings.portfolio_overlap({'FUND_A': 50, 'FUND_B': 50})['overlap_score'] == 0.0
+
+def test_disclosure_files_are_ingested():
+    """Per-scheme disclosure files are read with their usual column names"""
+    with tempfile.TemporaryDirectory() as directory:
+        pd.DataFrame({
+            'Name of the Instrument': ['Reliance Industries', 'HDFC Bank', 'Infosys'],
+            '% to Net Assets': ['9.5%', '8.1%', '6.2%']
+        }).to_csv(os.path.join(directory, 'LARGE_001.csv'), index=False)
+        pd.DataFrame({
+            'Scheme_Code': ['LARGE_002', 'LARGE_002'],
+            'ISIN': ['Reliance Industries', 'TCS'],
+            'Weight': [7.0, 5.0]
+        }).to_csv(os.path.join(directory, 'combined.csv'), index=False)
+
+        holdings = HoldingsOverlap.from_disclosure_files(['LARGE_001', 'LARGE_002', 'MID_001'], directory)
+
+    assert holdings.common_holdings[0, 1] == 1
+    assert holdings.has_holdings('LARGE_001') and not holdings.has_holdings('MID_001')
+    assert 0 < holdings.overlap_for(['LARGE_001', 'LARGE_002'])[0, 1] < 1
+
+def test_excel_disclosures_are_ingested():
+    """Excel disclosures are read like CSV ones"""
+    with tempfile.TemporaryDirectory() as directory:
+        pd.DataFrame({
+            'Scheme_Code': ['LARGE_001', 'LARGE_001', 'LARGE_002'],
+            'ISIN': ['INE002A01018', 'INE040A01034', 'INE002A01018'],
+            '% to NAV': ['9.5%', '8.1%', '7.0%']
+        }).to_excel(os.path.join(directory, 'disclosures.xlsx'), index=False)
+
+        holdings = HoldingsOverlap.from_disclosure_files(['LARGE_001', 'LARGE_002'], directory)
+
+    assert holdings.has_holdings('LARGE_001') and holdings.has_holdings('LARGE_002')
+    assert holdings.common_holdings[0, 1] == 1
+
+def test_diversification_reports_holdings_overlap():
+    """Diversification analysis includes the overlap-based score"""
+    analyzer = MutualFundAnalyzer()
+    user_info = {
+        'age': 35,
+        'annual_income': 800000,
+        'investment_amount': 100000,
+        'risk_tolerance': 'moderate',
+        'investment_horizon': '5-10 years'
+    }
+
+    diversification = analyzer.get_recommendations(user_info)['advanced_analysis']['diversification_score']
+
+    overlap = diversification['holdings_overlap']
+    assert 0 <= overlap['overlap_score'] <= 100
+    assert overlap['effective_holdings'] <= overlap['distinct_holdings']
+
+if __name__ == "__main__":
+    test_identical_portfolios_fully_overlap()
+    test_disclosure_files_are_ingested()
+    test_excel_disclosures_are_ingested()
+    test_diversification_reports_holdings_overlap()
+    print("✅ Holdings overlap tests passed")
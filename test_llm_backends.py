@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+Tests for the pluggable LLM backends
+"""
+
+import os
+import time
+import threading
+import requests
+from llm_backends import LLMBackend, GeminiBackend, FakeBackend, HTTPBackend
+from llm_recommender import LLMRecommender
+from llm_stub_server import make_server
+from mutual_fund_analyzer import MutualFundAnalyzer
+
+USER_PROFILE = {
+    'name': 'Test User',
+    'age': 30,
+    'annual_income': 1000000,
+    'investment_amount': 100000,
+    'monthly_sip': 5000
+}
+
+def draws(backend, n):
+    return [backend._draw() for _ in range(n)]
+
+def test_backend_is_chosen_by_env():
+    """LLM_BACKEND picks the implementation and its settings come from the environment"""
+    environ = dict(os.environ)
+    try:
+        os.environ.update({'LLM_BACKEND': 'fake', 'FAKE_LLM_LATENCY_MEDIAN': '0.2', 'FAKE_LLM_SEED': '7'})
+        backend = LLMBackend.from_env()
+        assert isinstance(backend, FakeBackend) and backend.latency_median == 0.2
+
+        os.environ.update({'LLM_BACKEND': 'http', 'LLM_HTTP_URL': 'http://stub/generate'})
+        assert LLMBackend.from_env().url == 'http://stub/generate'
+
+        os.environ.pop('LLM_BACKEND')
+        assert isinstance(LLMBackend.from_env(), GeminiBackend)
+
+        os.environ['LLM_BACKEND'] = 'nope'
+        try:
+            LLMBackend.from_env()
+            assert False, "an unknown backend must be rejected"
+        except ValueError:
+            pass
+    finally:
+        os.environ.clear()
+        os.environ.update(environ)
+
+def test_fake_is_reproducible_with_a_seed():
+    """The same seed gives the same latencies and failures; responses depend only on the prompt"""
+    first = FakeBackend(latency_median=0.3, latency_sigma=0.8, error_rate=0.25, seed=42)
+    second = FakeBackend(latency_median=0.3, latency_sigma=0.8, error_rate=0.25, seed=42)
+    sequence = draws(first, 400)
+
+    assert sequence == draws(second, 400)
+    assert 0.1 < sum(failed for _, failed in sequence) / 400 < 0.4
+    latencies = sorted(latency for latency, _ in sequence)
+    assert 0.2 < latencies[200] < 0.45
+
+    assert FakeBackend.response_for('a') == FakeBackend.response_for('a') != FakeBackend.response_for('b')
+
+def test_fake_honours_timeout_and_streams():
+    """Slow calls give up at the timeout and streams add up to the full response"""
+    backend = FakeBackend(latency_median=1.0, latency_sigma=0.0)
+    started = time.monotonic()
+    try:
+        backend.generate('prompt', timeout=0.05)
+        assert False, "a call slower than its timeout must fail"
+    except TimeoutError:
+        assert time.monotonic() - started < 0.5
+
+    backend = FakeBackend(latency_median=0.04, latency_sigma=0.0, chunks=4)
+    chunks = list(backend.stream('prompt', timeout=5))
+    assert len(chunks) == 4 and ''.join(chunks) == FakeBackend.response_for('prompt')
+
+    failing = FakeBackend(latency_median=0, error_rate=1.0)
+    try:
+        failing.generate('prompt', timeout=5)
+        assert False, "error_rate=1 must always fail"
+    except ConnectionError:
+        pass
+
+def test_full_request_path_runs_offline():
+    """The recommender parses the fake's answer like a real one"""
+    recommender = LLMRecommender(cache=False, backend=FakeBackend(latency_median=0.01, seed=1))
+    fund_data = MutualFundAnalyzer().get_recommendations(USER_PROFILE)
+    result = recommender.generate_recommendations(USER_PROFILE, fund_data)
+
+    assert not result.get('fallback')
+    assert result['sections']['risk_assessment'].startswith('Moderate risk')
+    assert recommender.stats()['backend'] == 'fake'
+
+def test_http_backend_against_stub_server():
+    """The HTTP backend talks to the stub server for whole and streamed responses"""
+    server = make_server(FakeBackend(latency_median=0.01, seed=3, chunks=3), port=0)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        backend = HTTPBackend(f'http://127.0.0.1:{server.server_address[1]}/generate')
+        assert backend.generate('prompt', timeout=5) == FakeBackend.response_for('prompt')
+        assert ''.join(backend.stream('prompt', timeout=5)) == FakeBackend.response_for('prompt')
+
+        failing = make_server(FakeBackend(latency_median=0, error_rate=1.0), port=0)
+        threading.Thread(target=failing.serve_forever, daemon=True).start()
+        try:
+            HTTPBackend(f'http://127.0.0.1:{failing.server_address[1]}/generate').generate('prompt', timeout=5)
+            assert False, "an upstream failure must raise"
+        except requests.HTTPError as e:
+            assert e.response.status_code == 503
+        finally:
+            failing.shutdown()
+            failing.server_close()
+    finally:
+        server.shutdown()
+        server.server_close()
+
+if __name__ == "__main__":
+    test_backend_is_chosen_by_env()
+    test_fake_is_reproducible_with_a_seed()
+    test_fake_honours_timeout_and_streams()
+    test_full_request_path_runs_offline()
+    test_http_backend_against_stub_server()
+    print("✅ LLM backend tests passed")
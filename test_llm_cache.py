@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+"""
+Tests for the persistent LLM analysis cache
+"""
+
+import os
+import time
+import tempfile
+import multiprocessing
+from multiprocessing import Pool
+from llm_backends import FakeBackend
+from llm_cache import LLMAnalysisCache
+from llm_recommender import LLMRecommender
+from mutual_fund_analyzer import MutualFundAnalyzer
+
+def write_entries(args):
+    path, worker = args
+    cache = LLMAnalysisCache(path)
+    for i in range(20):
+        cache.set(cache.make_key(f"prompt {worker} {i}"), f"value {worker} {i}", 'v1')
+        cache.get(cache.make_key(f"prompt {(worker + 1) % 4} {i}"), 'v1')
+    # Pool workers are terminated without running atexit handlers
+    cache.flush()
+    return True
+
+def test_canonical_prompts_share_a_key():
+    """Whitespace-only differences hash to the same key"""
+    with tempfile.TemporaryDirectory() as directory:
+        cache = LLMAnalysisCache(os.path.join(directory, 'cache.sqlite3'))
+        assert cache.make_key("Age:  35\n\n\n\nGoal: retire ") == cache.make_key("  Age: 35\n\nGoal: retire")
+        assert cache.make_key("Age: 35") != cache.make_key("Age: 36")
+
+def test_ttl_lru_and_version_invalidation():
+    """Entries expire, the table stays bounded, and new data versions invalidate old entries"""
+    with tempfile.TemporaryDirectory() as directory:
+        cache = LLMAnalysisCache(os.path.join(directory, 'cache.sqlite3'), ttl_seconds=60, max_entries=3)
+
+        for i in range(5):
+            cache.set(f"key{i}", f"value{i}", 'v1')
+        assert cache.stats()['entries'] == 3
+        assert cache.get('key0', 'v1') is None
+        assert cache.get('key4', 'v1') == 'value4'
+
+        cache.ttl_seconds = -1
+        assert cache.get('key4', 'v1') is None
+        cache.ttl_seconds = 60
+
+        cache.set('key5', 'value5', 'v1')
+        cache.set('key6', 'value6', 'v2')
+        assert cache.get('key5', 'v2') is None
+        assert cache.get('key6', 'v2') == 'value6'
+        assert cache.stats()['hits'] == 2
+
+def test_reads_check_the_data_version():
+    """A read after a data version bump misses, without other workers' entries being wiped"""
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'cache.sqlite3')
+        LLMAnalysisCache(path).set('key', 'OLD', 'v1')
+
+        # A fresh worker on the new data version reads before it ever writes
+        new_worker = LLMAnalysisCache(path)
+        assert new_worker.get('key', 'v2') is None
+
+        # Rolling deploy: a worker still on v1 keeps its entries while v2 writes
+        new_worker.set('other', 'NEW', 'v2')
+        old_worker = LLMAnalysisCache(path)
+        assert old_worker.get('key', 'v1') == 'OLD'
+        assert old_worker.get('other', 'v2') == 'NEW'
+
+def test_versions_of_the_same_prompt_coexist():
+    """Workers on different data versions keep separate entries for the same prompt"""
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'cache.sqlite3')
+        old_worker, new_worker = LLMAnalysisCache(path), LLMAnalysisCache(path)
+        old_worker.set('key', 'OLD', 'v1')
+        new_worker.set('key', 'NEW', 'v2')
+
+        assert old_worker.get('key', 'v1') == 'OLD'
+        assert new_worker.get('key', 'v2') == 'NEW'
+        assert old_worker.stats()['entries'] == 2
+
+def test_hits_do_not_write_until_flushed():
+    """Lookups only read; counts and access times are written in batches"""
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'cache.sqlite3')
+        cache = LLMAnalysisCache(path)
+        cache.set('key', 'value', 'v1')
+        cache.FLUSH_SECONDS = 60
+
+        for _ in range(cache.FLUSH_LOOKUPS - 1):
+            assert cache.get('key', 'v1') == 'value'
+        assert LLMAnalysisCache(path)._connection().execute('SELECT COUNT(*) FROM stats').fetchone()[0] == 0
+
+        cache.get('missing', 'v1')
+        assert LLMAnalysisCache(path).stats()['hits'] == cache.FLUSH_LOOKUPS - 1
+        assert LLMAnalysisCache(path).stats()['misses'] == 1
+
+def test_cache_is_shared_across_processes():
+    """Concurrent worker processes can read and write the same cache file"""
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'cache.sqlite3')
+        LLMAnalysisCache(path)
+        with Pool(4) as pool:
+            assert all(pool.map(write_entries, [(path, worker) for worker in range(4)]))
+
+        stats = LLMAnalysisCache(path).stats()
+        assert stats['entries'] == 80
+        assert stats['hits'] + stats['misses'] == 80
+
+def test_forked_worker_opens_its_own_connection():
+    """A worker forked from a preloading master never reuses the master's SQLite connection"""
+    with tempfile.TemporaryDirectory() as directory:
+        cache = LLMAnalysisCache(os.path.join(directory, 'cache.sqlite3'))
+        inherited = cache._connection()
+
+        def worker():
+            own = cache._connection()
+            cache.set('key', 'from worker', 'v1')
+            os._exit(0 if own is not inherited and cache._connection() is own else 1)
+
+        process = multiprocessing.get_context('fork').Process(target=worker)
+        process.start()
+        process.join()
+
+        assert process.exitcode == 0
+        assert cache._connection() is inherited
+        assert cache.get('key', 'v1') == 'from worker'
+
+def test_recommender_skips_llm_on_cache_hit():
+    """An identical profile is answered without calling the model again"""
+    with tempfile.TemporaryDirectory() as directory:
+        recommender = LLMRecommender(
+            cache=LLMAnalysisCache(os.path.join(directory, 'cache.sqlite3')),
+            backend=FakeBackend(latency_median=0)
+        )
+        analyzer = MutualFundAnalyzer()
+        user_info = {
+            'name': 'Jane Smith',
+            'age': 35,
+            'annual_income': 1200000,
+            'investment_amount': 200000,
+            'risk_tolerance': 'moderate',
+            'investment_horizon': '5-10 years'
+        }
+        fund_data = analyzer.get_recommendations(user_info)
+
+        first = recommender.generate_recommendations(user_info, fund_data)
+        second = recommender.generate_recommendations(user_info, fund_data)
+
+        assert recommender.backend.calls == 1
+        assert first['sections']['full_analysis'] == second['sections']['full_analysis']
+        assert recommender.cache_stats()['hits'] == 1
+
+if __name__ == "__main__":
+    test_canonical_prompts_share_a_key()
+    test_ttl_lru_and_version_invalidation()
+    test_reads_check_the_data_version()
+    test_versions_of_the_same_prompt_coexist()
+    test_hits_do_not_write_until_flushed()
+    test_cache_is_shared_across_processes()
+    test_forked_worker_opens_its_own_connection()
+    test_recommender_skips_llm_on_cache_hit()
+    print("✅ LLM cache tests passed")
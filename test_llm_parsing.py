@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+Tests for splitting LLM responses into sections and extracting insights
+"""
+
+import time
+from llm_backends import FakeBackend
+from llm_recommender import LLMRecommender
+
+MARKDOWN_RESPONSE = """1. **Executive Summary**: A balanced equity portfolio for long-term growth.
+
+## Risk Assessment
+Moderate risk. Risk assessment is revisited yearly.
+
+**Portfolio Analysis:** Well diversified across five categories.
+
+### INVESTMENT STRATEGY
+- It is important to note that SIPs average out market swings.
+- Stay invested.
+
+__Key Insights__:
+- We recommend reviewing the allocation every year.
+
+RISK WARNINGS: Equity funds can fall 50% in a crash.
+
+Next steps
+Start the SIP this month.
+"""
+
+def make_recommender():
+    return LLMRecommender(cache=False, backend=FakeBackend(latency_median=0))
+
+def test_markdown_heading_variants_split_into_sections():
+    """Numbered, bold, '#' and plain-caps headings all start a section"""
+    sections = make_recommender()._split_sections(MARKDOWN_RESPONSE)
+
+    assert sections['executive_summary'] == 'A balanced equity portfolio for long-term growth.'
+    assert sections['risk_assessment'] == 'Moderate risk. Risk assessment is revisited yearly.'
+    assert sections['portfolio_analysis'] == 'Well diversified across five categories.'
+    assert sections['investment_strategy'].startswith('- It is important to note')
+    assert sections['key_insights'] == '- We recommend reviewing the allocation every year.'
+    assert sections['risk_warnings'] == 'Equity funds can fall 50% in a crash.'
+    assert sections['next_steps'] == 'Start the SIP this month.'
+    assert sections['portfolio_allocation'] == '' and sections['fund_analysis'] == ''
+
+def test_legacy_headings_and_repeats():
+    """The older inline 'HEADING:' markers still parse and the first occurrence wins"""
+    text = "RISK ASSESSMENT: High. FUND SELECTION ANALYSIS: ignored inline\nRISK ASSESSMENT:\nRepeated.\nFUND ANALYSIS: Strong picks."
+    sections = make_recommender()._split_sections(text)
+
+    assert sections['risk_assessment'] == 'High. FUND SELECTION ANALYSIS: ignored inline'
+    assert sections['fund_analysis'] == 'Strong picks.'
+
+def test_insights_use_one_pattern_and_stop_at_five():
+    """Lines with an advisory phrase in any case are insights, short ones are not"""
+    lines = ['We RECOMMEND index funds for the core.', 'Consider it.', 'Nothing to see in this line at all.']
+    lines += [f'Point {i}: it is crucial to rebalance yearly.' for i in range(10)]
+    insights = make_recommender()._extract_key_insights('\n'.join(lines))
+
+    assert insights[0] == 'We RECOMMEND index funds for the core.'
+    assert len(insights) == 5 and 'Consider it.' not in insights
+
+def test_parse_response_keeps_full_text():
+    """The structured result carries every section plus the raw analysis"""
+    user_info = {'age': 30, 'annual_income': 1000000, 'investment_amount': 100000}
+    fund_data = {'risk_profile': 'moderate', 'allocation': {}, 'recommendations': {}}
+    result = make_recommender()._parse_llm_response(MARKDOWN_RESPONSE, user_info, fund_data)
+
+    assert result['sections']['full_analysis'] == MARKDOWN_RESPONSE
+    assert result['key_insights'][0] == '- It is important to note that SIPs average out market swings.'
+
+def benchmark_large_response(repeats: int = 2000):
+    """Time parsing a response of `repeats` copies of the markdown fixture"""
+    recommender = make_recommender()
+    text = MARKDOWN_RESPONSE * repeats
+    started = time.perf_counter()
+    sections = recommender._split_sections(text)
+    insights = recommender._extract_key_insights(text)
+    elapsed = time.perf_counter() - started
+    assert sections['next_steps'] and len(insights) == 5
+    print(f"Parsed {len(text) / 1e6:.1f} MB in {elapsed * 1000:.1f} ms")
+
+if __name__ == "__main__":
+    test_markdown_heading_variants_split_into_sections()
+    test_legacy_headings_and_repeats()
+    test_insights_use_one_pattern_and_stop_at_five()
+    test_parse_response_keeps_full_text()
+    benchmark_large_response()
+    print("✅ LLM parsing tests passed")
@@ -0,0 +1,293 @@
+#!/usr/bin/env python3
+"""
+Tests for LLM deadlines, the circuit breaker, latency histograms and concurrency limits
+"""
+
+import time
+import asyncio
+import threading
+from llm_backends import LLMBackend
+from llm_recommender import LLMRecommender
+from llm_resilience import CircuitBreaker, LatencyHistogram, LLMConcurrencyLimiter, LLMOverloadedError, LLMUnavailableError
+from mutual_fund_analyzer import MutualFundAnalyzer
+
+USER_PROFILE = {
+    'name': 'Test User',
+    'age': 30,
+    'annual_income': 1000000,
+    'investment_amount': 100000,
+    'monthly_sip': 5000
+}
+
+class UnreliableBackend(LLMBackend):
+    """LLM backend that fails or hangs like an outage would"""
+
+    def __init__(self, fail=True, delay=0.0):
+        self.fail = fail
+        self.delay = delay
+        self.calls = 0
+        self.timeouts = []
+
+    def generate(self, prompt, timeout):
+        self.calls += 1
+        self.timeouts.append(timeout)
+        if self.delay:
+            # Honour the request timeout like the SDK does
+            time.sleep(min(self.delay, timeout))
+            if self.delay > timeout:
+                raise TimeoutError("deadline exceeded")
+        if self.fail:
+            raise ConnectionError("upstream unavailable")
+        return 'We recommend a diversified SIP portfolio.'
+
+class GatedBackend(LLMBackend):
+    """LLM backend that records its peak concurrency"""
+
+    def __init__(self):
+        self.release = threading.Event()
+        self.running = 0
+        self.peak = 0
+        self.lock = threading.Lock()
+
+    def generate(self, prompt, timeout):
+        with self.lock:
+            self.running += 1
+            self.peak = max(self.peak, self.running)
+        self.release.wait(5)
+        with self.lock:
+            self.running -= 1
+        return 'We recommend a diversified SIP portfolio.'
+
+def wait_until(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+def make_recommender(backend, **kwargs):
+    return LLMRecommender(cache=False, backend=backend, **kwargs)
+
+def test_breaker_opens_and_recovers():
+    """Consecutive failures open the breaker; after the cooldown one probe decides"""
+    breaker = CircuitBreaker(failure_threshold=2, cooldown_seconds=0.05)
+    breaker.record_failure()
+    assert breaker.state == 'closed'
+    breaker.record_failure()
+    assert breaker.state == 'open' and not breaker.allow_request()
+
+    time.sleep(0.06)
+    assert breaker.allow_request() and not breaker.allow_request()
+    breaker.record_failure()
+    assert breaker.state == 'open'
+
+    time.sleep(0.06)
+    assert breaker.allow_request()
+    breaker.record_success()
+    assert breaker.state == 'closed' and breaker.stats()['times_opened'] == 2
+
+class SlowBackend(LLMBackend):
+    """LLM backend whose calls take long enough for the caller to give up on them"""
+
+    def stream(self, prompt, timeout):
+        yield 'We recommend'
+        yield ' a diversified SIP portfolio.'
+
+    async def agenerate(self, prompt, timeout):
+        await asyncio.sleep(10)
+
+def test_abandoned_probe_frees_the_breaker():
+    """A half-open probe whose caller disconnects or is cancelled doesn't leave the breaker stuck open"""
+    breaker = CircuitBreaker(failure_threshold=1, cooldown_seconds=0.05)
+    recommender = make_recommender(SlowBackend(), breaker=breaker)
+
+    breaker.record_failure()
+    time.sleep(0.06)
+    stream = recommender._stream_analysis('prompt', deadline=time.monotonic() + 5)
+    assert next(stream) == 'We recommend'
+    # The client disconnects mid-stream
+    stream.close()
+    assert breaker.state == 'half_open' and breaker.allow_request()
+
+    async def cancelled_call():
+        task = asyncio.ensure_future(recommender._agenerate_uncached('prompt', 'key', '', time.monotonic() + 5))
+        await asyncio.sleep(0.01)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+    breaker.record_failure()
+    time.sleep(0.06)
+    asyncio.run(cancelled_call())
+    assert breaker.allow_request()
+
+    # A probe that never reports back is given up on after a cooldown
+    breaker.record_failure()
+    time.sleep(0.06)
+    assert breaker.allow_request() and not breaker.allow_request()
+    time.sleep(0.06)
+    assert breaker.allow_request()
+
+def test_open_breaker_serves_fallback_without_calling_model():
+    """Once tripped, requests get the fallback immediately"""
+    backend = UnreliableBackend(fail=True)
+    recommender = make_recommender(backend, breaker=CircuitBreaker(failure_threshold=3, cooldown_seconds=60))
+    fund_data = MutualFundAnalyzer().get_recommendations(USER_PROFILE)
+
+    for _ in range(5):
+        result = recommender.generate_recommendations(USER_PROFILE, fund_data)
+        assert result['fallback']
+
+    stats = recommender.stats()
+    assert backend.calls == 3
+    assert stats['breaker']['state'] == 'open'
+    assert stats['outcomes']['error'] == 3 and stats['outcomes']['short_circuited'] == 2
+    assert stats['outcomes']['fallback'] == 5
+
+def test_call_gets_remaining_deadline():
+    """The model call is bounded by the request deadline and overruns count as timeouts"""
+    backend = UnreliableBackend(fail=False, delay=1.0)
+    recommender = make_recommender(backend, deadline_seconds=0.1)
+    fund_data = MutualFundAnalyzer().get_recommendations(USER_PROFILE)
+
+    result = recommender.generate_recommendations(USER_PROFILE, fund_data)
+
+    assert result['fallback']
+    assert 0 < backend.timeouts[0] <= 0.1
+    assert recommender.stats()['outcomes']['timeout'] == 1
+
+    # A deadline that has already passed never reaches the model
+    recommender.generate_recommendations(USER_PROFILE, fund_data, deadline=time.monotonic() - 1)
+    assert backend.calls == 1
+
+def test_latency_histogram():
+    """Observations land in cumulative buckets with bucket-bound quantiles"""
+    histogram = LatencyHistogram(buckets=(0.1, 1.0))
+    for seconds in (0.05, 0.05, 0.5, 5.0):
+        histogram.observe(seconds)
+
+    stats = histogram.stats()
+    assert stats['buckets'] == {'0.1': 2, '1.0': 3, '+Inf': 4}
+    assert stats['p50_le'] == 0.1 and stats['p95_le'] is None
+
+def test_limiter_queues_then_rejects():
+    """Callers past the concurrency limit queue; a full queue rejects and queued callers expire"""
+    limiter = LLMConcurrencyLimiter(max_concurrency=1, max_queue=1)
+    holding, release = threading.Event(), threading.Event()
+
+    def hold_slot():
+        with limiter.slot():
+            holding.set()
+            release.wait(5)
+
+    holder = threading.Thread(target=hold_slot)
+    holder.start()
+    holding.wait(5)
+
+    outcomes = []
+    def queued_caller():
+        try:
+            with limiter.slot(time.monotonic() + 5):
+                outcomes.append('ran')
+        except LLMUnavailableError as e:
+            outcomes.append(e)
+
+    queued = threading.Thread(target=queued_caller)
+    queued.start()
+    assert wait_until(lambda: limiter.stats()['queue_depth'] == 1)
+
+    try:
+        with limiter.slot(time.monotonic() + 5):
+            pass
+        assert False, "a full queue must reject"
+    except LLMOverloadedError:
+        pass
+
+    release.set()
+    holder.join()
+    queued.join()
+    assert outcomes == ['ran']
+
+    # Nothing frees up before the deadline: the caller gives up
+    with limiter.slot():
+        try:
+            with limiter.slot(time.monotonic() + 0.05):
+                pass
+            assert False, "an expired wait must not run"
+        except LLMOverloadedError:
+            assert False, "the queue has room"
+        except LLMUnavailableError:
+            pass
+
+    stats = limiter.stats()
+    assert (stats['admitted'], stats['rejected'], stats['expired']) == (3, 1, 1)
+    assert stats['wait_time']['count'] == 3 and stats['active'] == 0
+
+def test_async_and_thread_callers_share_the_limit():
+    """Coroutines queue on the event loop for slots that threads release, and vice versa"""
+    limiter = LLMConcurrencyLimiter(max_concurrency=2, max_queue=10)
+    peak = [0]
+
+    def thread_caller():
+        with limiter.slot(time.monotonic() + 5):
+            peak[0] = max(peak[0], limiter.active)
+            time.sleep(0.1)
+
+    async def coroutine_caller():
+        async with limiter.aslot(time.monotonic() + 5):
+            peak[0] = max(peak[0], limiter.active)
+            await asyncio.sleep(0.1)
+
+    async def expiring_caller():
+        try:
+            async with limiter.aslot(time.monotonic() + 0.05):
+                return 'ran'
+        except LLMUnavailableError:
+            return 'expired'
+
+    async def run():
+        threads = [threading.Thread(target=thread_caller) for _ in range(3)]
+        for thread in threads:
+            thread.start()
+        results = await asyncio.gather(*(coroutine_caller() for _ in range(4)), expiring_caller())
+        for thread in threads:
+            thread.join()
+        return results[-1]
+
+    assert asyncio.run(run()) == 'expired'
+    stats = limiter.stats()
+    assert peak[0] == 2 and stats['active'] == 0 and stats['queue_depth'] == 0
+    assert (stats['admitted'], stats['expired']) == (7, 1)
+
+def test_burst_is_capped_and_overflow_gets_fallback():
+    """A burst of distinct requests never exceeds the upstream concurrency limit"""
+    backend = GatedBackend()
+    recommender = make_recommender(backend, limiter=LLMConcurrencyLimiter(max_concurrency=2, max_queue=2))
+    analyzer = MutualFundAnalyzer()
+
+    results = []
+    def request(i):
+        profile = dict(USER_PROFILE, name=f'User {i}')
+        results.append(recommender.generate_recommendations(profile, analyzer.get_recommendations(profile)))
+
+    threads = [threading.Thread(target=request, args=(i,)) for i in range(6)]
+    for thread in threads:
+        thread.start()
+    assert wait_until(lambda: recommender.limiter.stats()['rejected'] == 2 and backend.running == 2)
+
+    backend.release.set()
+    for thread in threads:
+        thread.join()
+
+    assert backend.peak == 2
+    assert sum(1 for result in results if result.get('fallback')) == 2
+    assert recommender.stats()['concurrency']['queue_depth'] == 0
+
+if __name__ == "__main__":
+    test_breaker_opens_and_recovers()
+    test_abandoned_probe_frees_the_breaker()
+    test_open_breaker_serves_fallback_without_calling_model()
+    test_call_gets_remaining_deadline()
+    test_latency_histogram()
+    test_limiter_queues_then_rejects()
+    test_async_and_thread_callers_share_the_limit()
+    test_burst_is_capped_and_overflow_gets_fallback()
+    print("✅ LLM resilience tests passed")
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+Tests for streaming the LLM analysis as Server-Sent Events
+"""
+
+import os
+import json
+import tempfile
+import threading
+from llm_backends import LLMBackend
+from llm_cache import LLMAnalysisCache
+from llm_recommender import LLMRecommender
+from mutual_fund_analyzer import MutualFundAnalyzer
+
+CHUNKS = ['RISK ASSESSMENT: Moderate risk. ', 'We recommend staying invested ', 'for the long term.']
+
+USER_PROFILE = {
+    'name': 'Test User',
+    'age': 30,
+    'annual_income': 1000000,
+    'investment_amount': 100000,
+    'monthly_sip': 5000
+}
+
+class StreamingBackend(LLMBackend):
+    """LLM backend that streams fixed chunks.
+
+    After the first chunk it waits for `release`, so tests can check what
+    reached the client before the backend finished.
+    """
+
+    def __init__(self):
+        self.release = threading.Event()
+        self.calls = 0
+
+    def stream(self, prompt, timeout):
+        self.calls += 1
+        for i, text in enumerate(CHUNKS):
+            if i == 1:
+                self.release.wait(5)
+            yield text
+
+def parse_events(body):
+    """Split an event-stream body into (event, data) pairs"""
+    events = []
+    for block in body.strip().split('\n\n'):
+        lines = dict(line.split(': ', 1) for line in block.split('\n'))
+        events.append((lines['event'], json.loads(lines['data'])))
+    return events
+
+def test_stream_yields_chunks_then_structured_analysis():
+    """Chunks arrive in order and the final event carries the parsed sections"""
+    with tempfile.TemporaryDirectory() as directory:
+        backend = StreamingBackend()
+        backend.release.set()
+        recommender = LLMRecommender(cache=LLMAnalysisCache(os.path.join(directory, 'cache.sqlite3')), backend=backend)
+        analyzer = MutualFundAnalyzer()
+        fund_data = analyzer.get_recommendations(USER_PROFILE)
+
+        events = list(recommender.stream_recommendations(USER_PROFILE, fund_data))
+        assert [event['event'] for event in events] == ['chunk'] * len(CHUNKS) + ['analysis']
+        assert events[-1]['data']['sections']['full_analysis'] == ''.join(CHUNKS)
+
+        # A repeated request is replayed from the cache as a single chunk
+        replay = list(recommender.stream_recommendations(USER_PROFILE, fund_data))
+        assert backend.calls == 1
+        assert replay[0]['data']['text'] == ''.join(CHUNKS)
+
+def test_stream_endpoint_sends_first_chunk_before_model_finishes(app_module):
+    """/analyze/stream flushes recommendations and the first chunk while the backend is still generating"""
+    recommender = app_module.llm_recommender
+    original_backend, original_cache = recommender.backend, recommender.cache
+    backend = StreamingBackend()
+    recommender.backend, recommender.cache = backend, None
+    try:
+        response = app_module.app.test_client().post('/analyze/stream', json=USER_PROFILE)
+        assert response.mimetype == 'text/event-stream'
+
+        body = response.iter_encoded()
+        first = parse_events(next(body).decode())[0]
+        assert first[0] == 'recommendations' and first[1]['recommendations']['risk_profile']
+        assert parse_events(next(body).decode()) == [('chunk', {'text': CHUNKS[0]})]
+
+        backend.release.set()
+        events = parse_events(b''.join(body).decode())
+        assert [name for name, _ in events] == ['chunk'] * (len(CHUNKS) - 1) + ['analysis', 'done']
+        assert events[-2][1]['sections']['full_analysis'] == ''.join(CHUNKS)
+    finally:
+        backend.release.set()
+        recommender.backend, recommender.cache = original_backend, original_cache
+
+if __name__ == "__main__":
+    from conftest import load_app
+    test_stream_yields_chunks_then_structured_analysis()
+    test_stream_endpoint_sends_first_chunk_before_model_finishes(load_app())
+    print("✅ LLM streaming tests passed")
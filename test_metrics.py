@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""
+Tests for the metrics registry, its cross-worker merge and the /metrics endpoint
+"""
+
+import os
+import json
+import time
+import tempfile
+import threading
+import multiprocessing
+from metrics import MetricsRegistry
+
+def samples(text):
+    """Parse exposition text into {'name{labels}': value}"""
+    return {line.rsplit(' ', 1)[0]: float(line.rsplit(' ', 1)[1]) for line in text.splitlines() if not line.startswith('#')}
+
+def test_thread_shards_sum_and_render():
+    """Each thread records into its own shard; the scrape adds them up in the text format"""
+    registry = MetricsRegistry(directory='')
+    requests = registry.counter('requests_total', "Requests", ('route',))
+    latency = registry.histogram('latency_seconds', "Latency", buckets=(0.1, 1.0))
+
+    def work():
+        for _ in range(1000):
+            requests.inc('/a"b')
+            latency.observe(0.05)
+        latency.observe(0.5)
+        latency.observe(5)
+
+    threads = [threading.Thread(target=work) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    text = registry.render()
+    assert '# TYPE requests_total counter' in text and '# TYPE latency_seconds histogram' in text
+    values = samples(text)
+    assert values['requests_total{route="/a\\"b"}'] == 8000
+    assert values['latency_seconds_bucket{le="0.1"}'] == 8000
+    assert values['latency_seconds_bucket{le="1"}'] == 8008
+    assert values['latency_seconds_bucket{le="+Inf"}'] == values['latency_seconds_count'] == 8016
+    assert abs(values['latency_seconds_sum'] - (8000 * 0.05 + 8 * 5.5)) < 1e-6
+
+def record_in_worker(registry, counter, amount):
+    counter.inc('worker', amount=amount)
+    registry.flush()
+
+def test_workers_are_merged_and_start_from_zero():
+    """Forked workers don't inherit the parent's values, and a scrape adds up every worker's file"""
+    with tempfile.TemporaryDirectory() as directory:
+        registry = MetricsRegistry(directory=directory)
+        counter = registry.counter('jobs_total', "Jobs", ('kind',))
+        counter.inc('worker', amount=100)
+
+        context = multiprocessing.get_context('fork')
+        workers = [context.Process(target=record_in_worker, args=(registry, counter, amount)) for amount in (1, 2)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        assert len(os.listdir(directory)) == 2
+
+        # Exited workers keep counting, alongside the scraping process's own values
+        assert samples(registry.render())['jobs_total{kind="worker"}'] == 103
+
+        # Their files were folded into the aggregate, so the directory doesn't grow with restarts
+        files = [name for name in os.listdir(directory) if name.endswith('.json')]
+        assert sorted(name.split('-')[0] for name in files) == sorted([str(os.getpid()), 'aggregate.json'])
+        worker = context.Process(target=record_in_worker, args=(registry, counter, 4))
+        worker.start()
+        worker.join()
+        assert samples(registry.render())['jobs_total{kind="worker"}'] == 107
+        assert samples(registry.render())['jobs_total{kind="worker"}'] == 107
+        assert len([name for name in os.listdir(directory) if name.endswith('.json')]) == 2
+
+        # A scrape that died after writing the aggregate but before deleting the files doesn't count them twice
+        stale = '4194305-1.json'
+        with open(os.path.join(directory, stale), 'w') as f:
+            json.dump([['jobs_total', ['worker'], 10]], f)
+        with open(os.path.join(directory, 'aggregate.json')) as f:
+            aggregate = json.load(f)
+        aggregate['entries'][0][2] += 10
+        aggregate['folded'].append(stale)
+        with open(os.path.join(directory, 'aggregate.json'), 'w') as f:
+            json.dump(aggregate, f)
+        assert samples(registry.render())['jobs_total{kind="worker"}'] == 117
+        assert not os.path.exists(os.path.join(directory, stale))
+
+def test_metrics_endpoint_covers_routes_caches_llm_and_snapshot(app_module):
+    """/metrics reports request latency per route, cache lookups, analyzer and LLM metrics, and snapshot age"""
+    from llm_backends import FakeBackend
+    client = app_module.app.test_client()
+    recommender = app_module.llm_recommender
+    saved = recommender.backend, recommender.cache
+    recommender.backend, recommender.cache = FakeBackend(latency_median=0, error_rate=1.0), None
+    try:
+        client.post('/analyze', json={'age': 30, 'annual_income': 1e6, 'investment_amount': 1e5, 'wait_for_analysis': True})
+    finally:
+        recommender.backend, recommender.cache = saved
+    client.get('/top-funds?category=mid_cap')
+    client.get('/top-funds?category=mid_cap')
+    client.get('/no-such-page')
+
+    response = client.get('/metrics')
+    assert response.status_code == 200 and response.mimetype == 'text/plain'
+    values = samples(response.get_data(as_text=True))
+    assert values['mf_http_requests_total{route="/top-funds",method="GET",status="200"}'] >= 2
+    assert values['mf_http_requests_total{route="unmatched",method="GET",status="404"}'] >= 1
+    assert values['mf_http_request_seconds_count{route="/analyze"}'] >= 1
+    assert values['mf_request_stage_seconds_count{stage="advanced_analysis"}'] >= 1
+    assert values['mf_analyzer_compute_seconds_count'] >= 1
+    assert values['mf_cache_lookups_total{cache="top_funds",result="hit"}'] >= 1
+    assert values['mf_llm_outcomes_total{outcome="fallback"}'] >= 1 and values['mf_llm_analyses_total'] >= 1
+    assert values['mf_llm_call_seconds_count{result="error"}'] >= 1
+    assert 0 <= values['mf_fund_snapshot_age_seconds'] < 24 * 3600
+
+def benchmark_recording(repeats: int = 100000):
+    """Cost of a counter and a histogram update"""
+    registry = MetricsRegistry(directory='')
+    counter = registry.counter('hot_total', "Hot", ('route',))
+    histogram = registry.histogram('hot_seconds', "Hot", ('route',))
+
+    started = time.perf_counter()
+    for _ in range(repeats):
+        counter.inc('/analyze')
+    inc = (time.perf_counter() - started) / repeats
+    started = time.perf_counter()
+    for _ in range(repeats):
+        histogram.observe(0.2, '/analyze')
+    observe = (time.perf_counter() - started) / repeats
+    print(f"Counter inc: {inc * 1e9:.0f} ns, histogram observe: {observe * 1e9:.0f} ns")
+
+if __name__ == "__main__":
+    from conftest import load_app
+    test_thread_shards_sum_and_render()
+    test_workers_are_merged_and_start_from_zero()
+    test_metrics_endpoint_covers_routes_caches_llm_and_snapshot(load_app())
+    benchmark_recording()
+    print("✅ Metrics tests passed")
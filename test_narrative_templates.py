@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+Tests for sharing one LLM narrative across users with the same portfolio
+"""
+
+import os
+import random
+import tempfile
+from llm_backends import LLMBackend
+from llm_cache import LLMAnalysisCache
+from llm_recommender import LLMRecommender
+from mutual_fund_analyzer import MutualFundAnalyzer
+
+NARRATIVE = (
+    "1. **Executive Summary**: {name}, at {age} this portfolio suits you.\n"
+    "2. **Investment Strategy**: We recommend investing {investment_amount} now and {monthly_sip} a month "
+    "over {investment_horizon}. Keep {braces} as written."
+)
+
+class PlaceholderBackend(LLMBackend):
+    """LLM backend that answers with a placeholder narrative, split at awkward points when streaming"""
+
+    def __init__(self):
+        self.prompts = []
+
+    def generate(self, prompt, timeout):
+        self.prompts.append(prompt)
+        return NARRATIVE
+
+    def stream(self, prompt, timeout):
+        self.prompts.append(prompt)
+        for i in range(0, len(NARRATIVE), 7):
+            yield NARRATIVE[i:i + 7]
+
+def make_profile(name, **values):
+    profile = {
+        'name': name,
+        'age': 30,
+        'annual_income': 1000000,
+        'investment_amount': 300000,
+        'monthly_sip': 5000,
+        'risk_tolerance': 'moderate',
+        'investment_horizon': '5-10 years'
+    }
+    profile.update(values)
+    return profile
+
+def test_users_with_the_same_portfolio_share_one_call():
+    """A second user in the same cohort is served from the cache with their own values"""
+    analyzer = MutualFundAnalyzer()
+    asha = make_profile('Asha', age=29, investment_amount=250000, monthly_sip=7000)
+    ravi = make_profile('Ravi', age=34, investment_amount=400000, monthly_sip=12000)
+    asha_funds, ravi_funds = analyzer.get_recommendations(asha), analyzer.get_recommendations(ravi)
+    assert asha_funds['allocation'] == ravi_funds['allocation']
+
+    with tempfile.TemporaryDirectory() as directory:
+        backend = PlaceholderBackend()
+        recommender = LLMRecommender(
+            cache=LLMAnalysisCache(os.path.join(directory, 'cache.sqlite3')),
+            backend=backend,
+            narrative_templates=True
+        )
+        first = recommender.generate_recommendations(asha, asha_funds)
+        second = recommender.generate_recommendations(ravi, ravi_funds)
+
+        assert len(backend.prompts) == 1 and recommender.cache_stats()['hits'] == 1
+        assert 'Asha' not in backend.prompts[0] and '250,000' not in backend.prompts[0]
+        assert first['sections']['executive_summary'] == 'Asha, at 29 this portfolio suits you.'
+        assert second['sections']['executive_summary'] == 'Ravi, at 34 this portfolio suits you.'
+        assert '₹400,000 now and ₹12,000 a month over 5-10 years' in second['sections']['investment_strategy']
+        assert '{braces}' in second['sections']['investment_strategy']
+
+def test_hit_rate_across_many_users():
+    """Distinct users only cost one call per (risk profile, goal, horizon band) cohort"""
+    analyzer = MutualFundAnalyzer()
+    rng = random.Random(7)
+    with tempfile.TemporaryDirectory() as directory:
+        backend = PlaceholderBackend()
+        recommender = LLMRecommender(
+            cache=LLMAnalysisCache(os.path.join(directory, 'cache.sqlite3')),
+            backend=backend,
+            narrative_templates=True
+        )
+        cohorts = set()
+        for i in range(40):
+            profile = make_profile(
+                f'User {i}',
+                age=rng.randint(25, 40),
+                investment_amount=rng.randrange(50000, 500000, 1000),
+                monthly_sip=rng.randrange(2000, 20000, 500),
+                risk_tolerance=rng.choice(['moderate', 'high']),
+                investment_horizon=rng.choice(['5-10 years', '10-15 years'])
+            )
+            fund_data = analyzer.get_recommendations(profile)
+            cohorts.add((fund_data['risk_profile'], profile['investment_horizon']))
+            assert f'User {i}' in recommender.generate_recommendations(profile, fund_data)['sections']['full_analysis']
+
+        assert len(backend.prompts) == len(cohorts) <= 4
+        assert recommender.cache_stats()['hits'] == 40 - len(cohorts)
+
+def test_streamed_placeholders_are_filled_across_chunk_boundaries():
+    """Placeholders split between chunks still reach the client filled in"""
+    profile = make_profile('Meera', investment_amount=150000)
+    fund_data = MutualFundAnalyzer().get_recommendations(profile)
+    recommender = LLMRecommender(cache=False, backend=PlaceholderBackend(), narrative_templates=True)
+
+    events = list(recommender.stream_recommendations(profile, fund_data))
+    streamed = ''.join(event['data']['text'] for event in events if event['event'] == 'chunk')
+
+    assert '{name}' not in streamed and '{investment_amount}' not in streamed
+    assert streamed.startswith('1. **Executive Summary**: Meera, at 30')
+    assert '₹150,000' in streamed and '{braces}' in streamed
+    assert events[-1]['data']['sections']['full_analysis'] == streamed
+
+if __name__ == "__main__":
+    test_users_with_the_same_portfolio_share_one_call()
+    test_hit_rate_across_many_users()
+    test_streamed_placeholders_are_filled_across_chunk_boundaries()
+    print("✅ Narrative template tests passed")
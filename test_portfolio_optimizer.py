@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""
+Tests for the mean-variance portfolio optimizer
+"""
+
+import numpy as np
+from mutual_fund_analyzer import MutualFundAnalyzer
+from portfolio_optimizer import PortfolioOptimizer
+
+def test_capped_simplex_projection():
+    """Projected weights are long-only, capped and fully invested"""
+    rng = np.random.default_rng(7)
+    for _ in range(100):
+        v = rng.normal(size=8)
+        weights = PortfolioOptimizer._project_capped_simplex(v, 0.3)
+        assert abs(weights.sum() - 1) < 1e-9
+        assert weights.min() >= 0
+        assert weights.max() <= 0.3 + 1e-12
+
+def test_frontier_is_cached_per_fund_set():
+    """A repeated fund set is served from the frontier cache"""
+    analyzer = MutualFundAnalyzer()
+    optimizer = PortfolioOptimizer()
+    fund_ids = ['LARGE_001', 'MID_001', 'FLEXI_001', 'SMALL_001']
+
+    first = optimizer.get_frontier(analyzer.snapshot, fund_ids)
+    second = optimizer.get_frontier(analyzer.snapshot, list(reversed(fund_ids)))
+
+    assert first is second
+    assert optimizer.cache_stats() == {'hits': 1, 'misses': 1, 'size': 1}
+    assert np.all(np.diff(first['returns']) >= 0)
+
+def test_risk_profiles_move_along_frontier():
+    """Higher risk profiles get higher expected return and volatility"""
+    analyzer = MutualFundAnalyzer()
+    fund_ids = ['LARGE_001', 'LARGE_002', 'MID_001', 'FLEXI_001', 'SMALL_001', 'MULTI_001']
+
+    results = [analyzer.optimizer.optimize(analyzer.snapshot, fund_ids, profile) for profile in ('low', 'moderate', 'high')]
+
+    assert results[0]['expected_return'] <= results[1]['expected_return'] <= results[2]['expected_return']
+    assert results[0]['volatility'] <= results[2]['volatility']
+    for result in results:
+        assert abs(sum(result['fund_weights'].values()) - 1) < 1e-6
+
+def test_recommendation_allocation_sums_to_100():
+    """The optimized category allocation replaces the fixed table"""
+    analyzer = MutualFundAnalyzer()
+    user_info = {
+        'name': 'John Doe',
+        'age': 35,
+        'annual_income': 800000,
+        'investment_amount': 100000,
+        'risk_tolerance': 'moderate',
+        'investment_horizon': '5-10 years'
+    }
+
+    recommendations = analyzer.get_recommendations(user_info)
+
+    assert recommendations['optimization']
+    assert abs(sum(recommendations['allocation'].values()) - 100) < 1e-6
+    assert set(recommendations['allocation']) == {'large_cap', 'mid_cap', 'flexi_cap', 'small_cap', 'multi_cap'}
+
+if __name__ == "__main__":
+    test_capped_simplex_projection()
+    test_frontier_is_cached_per_fund_set()
+    test_risk_profiles_move_along_frontier()
+    test_recommendation_allocation_sums_to_100()
+    print("✅ Portfolio optimizer tests passed")
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+Tests for the pre-rendered, cacheable GET /top-funds responses
+"""
+
+import gzip
+import json
+import time
+from prerendered import PrerenderedCache
+
+def test_get_matches_post_and_is_rendered_once(app_module):
+    """GET serves the same funds as POST, and repeat requests reuse the rendered bytes"""
+    client = app_module.app.test_client()
+    app_module.top_funds_responses.clear()
+
+    posted = client.post('/top-funds', json={'category': 'mid_cap'})
+    fetched = client.get('/top-funds?category=mid_cap')
+    assert posted.status_code == fetched.status_code == 200
+    assert fetched.get_json() == posted.get_json() and len(fetched.get_json()['funds']) == 5
+    assert fetched.headers['Cache-Control'].startswith('public, max-age=')
+    assert fetched.headers['Vary'] == 'Accept-Encoding'
+
+    calls = []
+    saved = app_module.analyzer.get_top_funds
+    app_module.analyzer.get_top_funds = lambda category: calls.append(category) or saved(category)
+    try:
+        client.get('/top-funds?category=mid_cap')
+        # Unknown categories share the large cap entry
+        client.get('/top-funds?category=large_cap')
+        client.get('/top-funds?category=not_a_category')
+    finally:
+        app_module.analyzer.get_top_funds = saved
+    assert calls == ['large_cap']
+
+def test_compression_and_conditional_requests(app_module):
+    """gzip is served when accepted, and a matching If-None-Match gets an empty 304"""
+    client = app_module.app.test_client()
+
+    plain = client.get('/top-funds?category=large_cap')
+    compressed = client.get('/top-funds?category=large_cap', headers={'Accept-Encoding': 'gzip, deflate'})
+    assert 'Content-Encoding' not in plain.headers and compressed.headers['Content-Encoding'] == 'gzip'
+    assert gzip.decompress(compressed.data) == plain.data
+    assert len(compressed.data) < len(plain.data)
+    assert plain.headers['ETag'] != compressed.headers['ETag']
+
+    for etag in (plain.headers['ETag'], compressed.headers['ETag'], f'W/{plain.headers["ETag"]}', '*'):
+        revalidated = client.get('/top-funds?category=large_cap', headers={'If-None-Match': etag})
+        assert revalidated.status_code == 304 and revalidated.data == b''
+        assert revalidated.headers['ETag'] == plain.headers['ETag']
+
+    # Another category's tag doesn't match
+    other = client.get('/top-funds?category=small_cap').headers['ETag']
+    assert client.get('/top-funds?category=large_cap', headers={'If-None-Match': other}).status_code == 200
+
+def test_new_data_version_replaces_cached_responses():
+    """Entries are keyed by data version; rendering a new version drops the old generation"""
+    cache = PrerenderedCache()
+    first = cache.get('large_cap', 'v1', lambda: {'funds': [1]})
+    assert cache.get('large_cap', 'v1', lambda: {'funds': [2]}) is first
+
+    second = cache.get('large_cap', 'v2', lambda: {'funds': [2]})
+    assert json.loads(second.body) == {'funds': [2]} and second.etags != first.etags
+    assert list(cache._entries) == [('large_cap', 'v2')]
+
+def benchmark_top_funds(app_module, repeats: int = 500):
+    """Server-side cost of rendering a /top-funds response against reusing it, and the bytes sent"""
+    cache = app_module.top_funds_responses
+    version = app_module.analyzer.data_version
+
+    started = time.perf_counter()
+    for _ in range(repeats):
+        cache.clear()
+        rendered = cache.get('large_cap', version, lambda: app_module._render_top_funds('large_cap'))
+    uncached = (time.perf_counter() - started) / repeats
+    started = time.perf_counter()
+    for _ in range(repeats):
+        cache.get('large_cap', version, lambda: app_module._render_top_funds('large_cap'))
+    cached = (time.perf_counter() - started) / repeats
+
+    sizes = ', '.join(f"{coding} {len(body)} B" for coding, body in rendered.bodies.items())
+    print(f"Render and compress: {uncached * 1e6:.0f} us, cache hit: {cached * 1e6:.1f} us ({sizes})")
+
+if __name__ == "__main__":
+    from conftest import load_app
+    test_get_matches_post_and_is_rendered_once(load_app())
+    test_compression_and_conditional_requests(load_app())
+    test_new_data_version_replaces_cached_responses()
+    benchmark_top_funds(load_app())
+    print("✅ Prerendered response tests passed")
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+Tests for the token-budgeted prompt builder
+"""
+
+from llm_backends import LLMBackend
+from llm_recommender import LLMRecommender
+from mutual_fund_analyzer import MutualFundAnalyzer
+from prompt_builder import PromptBuilder, format_table
+
+USER_PROFILE = {
+    'name': 'Test User',
+    'age': 30,
+    'annual_income': 1000000,
+    'investment_amount': 100000,
+    'monthly_sip': 5000
+}
+
+class RecordingBackend(LLMBackend):
+    """LLM backend that keeps the last prompt and always gives the same answer"""
+
+    def generate(self, prompt, timeout):
+        self.prompt = prompt
+        return 'We recommend a diversified SIP portfolio.'
+
+def test_lowest_priority_sections_are_dropped_first():
+    """Over budget, optional sections go in priority order; required ones stay"""
+    builder = PromptBuilder(token_budget=30)
+    builder.add('intro', 'a' * 40, required=True)
+    builder.add('detail', 'b' * 40, priority=0)
+    builder.add('table', 'c' * 40, priority=2)
+    builder.add('extra', 'd' * 40, priority=0)
+    builder.add('empty', '   ')
+
+    prompt, usage = builder.build()
+
+    assert prompt == 'a' * 40 + '\n\n' + 'c' * 40
+    assert usage['dropped_sections'] == ['detail', 'extra']
+    assert usage['prompt_tokens'] == PromptBuilder.estimate_tokens(prompt) <= 30
+
+    # Without a budget nothing is dropped
+    prompt, usage = PromptBuilder().add('one', 'x').add('two', 'y').build()
+    assert prompt == 'x\n\ny' and usage['dropped_sections'] == []
+
+def test_table_is_pipe_delimited():
+    """Each fund is one row and cell values cannot break the columns"""
+    assert format_table(['name', 'aum'], [['A|B Fund', 1200], ['C Fund', None]]) == 'name|aum\nA/B Fund|1200\nC Fund|'
+
+def test_recommender_reports_token_usage():
+    """The prompt holds one table row per fund and the result carries its token usage"""
+    fund_data = MutualFundAnalyzer().get_recommendations(USER_PROFILE)
+    funds = [fund for category in fund_data['recommendations'].values() for fund in category]
+
+    recommender = LLMRecommender(cache=False, backend=RecordingBackend())
+    result = recommender.generate_recommendations(USER_PROFILE, fund_data)
+
+    assert all(f"|{fund['name']}|" in recommender.backend.prompt for fund in funds)
+    assert result['usage']['prompt_tokens'] == PromptBuilder.estimate_tokens(recommender.backend.prompt)
+    assert result['usage']['response_tokens'] == PromptBuilder.estimate_tokens('We recommend a diversified SIP portfolio.')
+
+    # A tight budget drops the derived analysis before the fund table
+    recommender.prompt_token_budget = result['usage']['prompt_tokens'] - 100
+    result = recommender.generate_recommendations(USER_PROFILE, fund_data)
+    assert result['usage']['prompt_tokens'] <= recommender.prompt_token_budget
+    assert 'volatility' in result['usage']['dropped_sections']
+    assert 'funds' not in result['usage']['dropped_sections']
+    assert 'Please provide a comprehensive analysis' in recommender.backend.prompt
+
+    tokens = recommender.stats()['tokens']
+    assert tokens['requests'] == 2 and tokens['trimmed_prompts'] == 1
+
+if __name__ == "__main__":
+    test_lowest_priority_sections_are_dropped_first()
+    test_table_is_pipe_delimited()
+    test_recommender_reports_token_usage()
+    print("✅ Prompt builder tests passed")
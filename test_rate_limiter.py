@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+"""
+Tests for per-client rate limiting and /analyze load shedding
+"""
+
+import os
+import json
+import time
+import asyncio
+import tempfile
+from analysis_jobs import AnalysisJobManager
+from rate_limiter import RateLimiter
+
+def test_bucket_allows_burst_then_refills():
+    """A client gets `burst` requests at once, then one per refill interval, with an accurate Retry-After"""
+    with tempfile.TemporaryDirectory() as directory:
+        limiter = RateLimiter(os.path.join(directory, 'limits.sqlite3'), buckets={'analyze': (600.0, 3.0)})
+        assert [limiter.acquire('analyze', 'ip:1')[0] for _ in range(3)] == [True, True, True]
+        allowed, retry_after = limiter.acquire('analyze', 'ip:1')
+        assert not allowed and 0 < retry_after <= 0.1
+
+        # Other clients have their own bucket
+        assert limiter.acquire('analyze', 'ip:2') == (True, 0.0)
+
+        time.sleep(retry_after + 0.01)
+        assert limiter.acquire('analyze', 'ip:1')[0]
+        assert not limiter.acquire('analyze', 'ip:1')[0]
+
+def test_buckets_are_shared_between_processes():
+    """A forked worker spends from the same bucket, so clients can't multiply their allowance"""
+    with tempfile.TemporaryDirectory() as directory:
+        limiter = RateLimiter(os.path.join(directory, 'limits.sqlite3'), buckets={'analyze': (1.0, 4.0)})
+        # The parent's connection is open before the fork, as in a preloaded gunicorn master
+        assert limiter.acquire('analyze', 'ip:1')[0]
+        pid = os.fork()
+        if pid == 0:
+            allowed = [limiter.acquire('analyze', 'ip:1')[0] for _ in range(2)]
+            os._exit(0 if allowed == [True, True] else 1)
+        _, status = os.waitpid(pid, 0)
+        assert os.waitstatus_to_exitcode(status) == 0
+        assert limiter.acquire('analyze', 'ip:1')[0]
+        assert not limiter.acquire('analyze', 'ip:1')[0]
+
+def test_client_id_prefers_api_key_and_only_trusts_forwarded_for_when_told():
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'limits.sqlite3')
+        limiter = RateLimiter(path)
+        key_id = limiter.client_id('secret-key', '10.0.0.1')
+        assert key_id.startswith('key:') and 'secret-key' not in key_id
+        assert limiter.client_id(None, '10.0.0.1', '1.2.3.4') == 'ip:10.0.0.1'
+
+        # Behind one proxy the client is the entry it appended, whatever the client sent before it
+        behind_proxy = RateLimiter(path, trusted_proxies=1)
+        assert behind_proxy.client_id(None, '10.0.0.1', '1.2.3.4') == 'ip:1.2.3.4'
+        assert behind_proxy.client_id(None, '10.0.0.1', 'spoofed-1, 1.2.3.4') == 'ip:1.2.3.4'
+        assert RateLimiter(path, trusted_proxies=2).client_id(None, '10.0.0.1', 'spoofed, 1.2.3.4, 10.0.0.2') == 'ip:1.2.3.4'
+        # Fewer entries than trusted proxies: the header can't be trusted at all
+        assert RateLimiter(path, trusted_proxies=2).client_id(None, '10.0.0.1', '1.2.3.4') == 'ip:10.0.0.1'
+
+def test_spoofed_forwarded_for_does_not_get_a_fresh_bucket():
+    with tempfile.TemporaryDirectory() as directory:
+        limiter = RateLimiter(os.path.join(directory, 'limits.sqlite3'), buckets={'analyze': (1.0, 2.0)},
+                              trusted_proxies=1)
+        allowed = [limiter.acquire('analyze', limiter.client_id(None, '10.0.0.1', f"198.51.100.{i}, 1.2.3.4"))[0]
+                   for i in range(5)]
+        assert allowed == [True, True, False, False, False]
+
+def test_fails_open_when_the_store_is_unavailable():
+    with tempfile.TemporaryDirectory() as directory:
+        limiter = RateLimiter(os.path.join(directory, 'limits.sqlite3'), buckets={'analyze': (1.0, 1.0)})
+        limiter._connection().execute('DROP TABLE buckets')
+        assert limiter.acquire('analyze', 'ip:1') == (True, 0.0)
+
+def test_sheds_when_the_backlog_is_full():
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'limits.sqlite3')
+        assert not RateLimiter(path).should_shed(1, 2)
+        assert RateLimiter(path).should_shed(2, 2)
+        assert not RateLimiter(path, shed_queue_depth=3).should_shed(2, 2)
+        assert not RateLimiter(path, shed_queue_depth=0).should_shed(2, 2)
+
+def test_flask_returns_429_and_503_with_retry_after(app_module):
+    """The app refuses over-limit clients with 429 and sheds /analyze with 503, leaving /metrics alone"""
+    client = app_module.app.test_client()
+    saved_limiter, saved_jobs = app_module.rate_limiter, app_module.analysis_jobs
+    directory = tempfile.TemporaryDirectory()
+    try:
+        app_module.rate_limiter = RateLimiter(os.path.join(directory.name, 'limits.sqlite3'),
+                                              buckets={'analyze': (1.0, 1.0), 'default': (1.0, 2.0)})
+        # An invalid body still costs a token, and is answered without calling the LLM
+        assert client.post('/analyze', json={}).status_code == 400
+        response = client.post('/analyze', json={})
+        assert response.status_code == 429
+        assert int(response.headers['Retry-After']) >= 59 and response.get_json()['retry_after'] >= 59
+        # The stream shares the analyze bucket; an API key is a different client
+        assert client.post('/analyze/stream', json={}).status_code == 429
+        assert client.post('/analyze', json={}, headers={'X-API-Key': 'k'}).status_code == 400
+
+        assert client.get('/llm-stats').status_code == 200
+        assert client.get('/cache-stats').status_code == 200
+        assert client.get('/llm-stats').status_code == 429
+        assert client.get('/metrics').status_code == 200
+        assert 'mf_requests_rejected_total{reason="rate_limited",bucket="default"}' in client.get('/metrics').get_data(as_text=True)
+
+        # Background analyses pile up in the job queue, not the LLM limiter
+        jobs = app_module.analysis_jobs = AnalysisJobManager(max_workers=1, max_queue=1)
+        jobs.running, jobs.queued = 1, 1
+        response = client.post('/analyze', json={}, headers={'X-API-Key': 'other'})
+        assert response.status_code == 503 and response.headers['Retry-After'] == '5'
+        assert app_module.llm_recommender.limiter.waiting == 0
+    finally:
+        app_module.rate_limiter, app_module.analysis_jobs = saved_limiter, saved_jobs
+        directory.cleanup()
+
+def test_async_analyze_is_limited(asgi_module):
+
+    messages = []
+
+    async def receive():
+        return {'type': 'http.request', 'body': b'{}', 'more_body': False}
+
+    async def send(message):
+        messages.append(message)
+
+    scope = {'type': 'http', 'method': 'POST', 'path': '/analyze', 'client': ('10.0.0.9', 1234), 'headers': []}
+    saved = asgi_module.flask_app.rate_limiter
+    directory = tempfile.TemporaryDirectory()
+    try:
+        asgi_module.flask_app.rate_limiter = RateLimiter(os.path.join(directory.name, 'limits.sqlite3'),
+                                                  buckets={'analyze': (1.0, 1.0), 'default': (1.0, 1.0)})
+        asyncio.run(asgi_module.app(scope, receive, send))
+        asyncio.run(asgi_module.app(scope, receive, send))
+    finally:
+        asgi_module.flask_app.rate_limiter = saved
+        directory.cleanup()
+
+    assert [m['status'] for m in messages if m['type'] == 'http.response.start'] == [400, 429]
+    assert b'retry-after' in dict(messages[2]['headers'])
+    assert json.loads(messages[3]['body'])['success'] is False
+
+def benchmark_acquire(repeats: int = 2000):
+    """Cost of checking a bucket: one small SQLite transaction"""
+    with tempfile.TemporaryDirectory() as directory:
+        limiter = RateLimiter(os.path.join(directory, 'limits.sqlite3'))
+        started = time.perf_counter()
+        for i in range(repeats):
+            limiter.acquire('default', f"ip:{i % 50}")
+        elapsed = (time.perf_counter() - started) / repeats
+    print(f"Rate limit check: {elapsed * 1e6:.1f} us")
+
+if __name__ == "__main__":
+    from conftest import load_app, load_asgi
+    test_bucket_allows_burst_then_refills()
+    test_buckets_are_shared_between_processes()
+    test_client_id_prefers_api_key_and_only_trusts_forwarded_for_when_told()
+    test_spoofed_forwarded_for_does_not_get_a_fresh_bucket()
+    test_fails_open_when_the_store_is_unavailable()
+    test_sheds_when_the_backlog_is_full()
+    test_flask_returns_429_and_503_with_retry_after(load_app())
+    test_async_analyze_is_limited(load_asgi())
+    benchmark_acquire()
+    print("✅ Rate limiter tests passed")
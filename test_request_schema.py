@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+"""
+Tests for the /analyze request schema: decoding, structured 400s and malformed-input fuzzing
+"""
+
+import json
+import time
+import random
+from llm_backends import FakeBackend
+from request_schema import UserProfile, ValidationError, USER_PROFILE_FIELDS, loads
+
+PROFILE = {
+    'name': 'Test User',
+    'age': 35,
+    'annual_income': 1500000,
+    'investment_amount': 200000,
+    'risk_tolerance': 'high',
+    'investment_goal': 'retirement',
+    'investment_horizon': '10-15',
+    'monthly_sip': 10000,
+    'tax_bracket': 30,
+    'wait_for_analysis': True
+}
+
+def legacy_parse(data):
+    """The per-field casts /analyze used before the schema, kept to compare results and decode time"""
+    return {
+        'name': data.get('name'),
+        'age': int(data.get('age')),
+        'annual_income': float(data.get('annual_income')),
+        'investment_amount': float(data.get('investment_amount')),
+        'risk_tolerance': data.get('risk_tolerance', 'moderate'),
+        'investment_goal': data.get('investment_goal', 'wealth_creation'),
+        'investment_horizon': data.get('investment_horizon', '5-10 years'),
+        'monthly_sip': float(data.get('monthly_sip', 0)),
+        'existing_investments': float(data.get('existing_investments', 0)),
+        'tax_bracket': int(data.get('tax_bracket', 20)),
+        'emergency_fund': data.get('emergency_fund', 'yes'),
+        'fund_type_preference': data.get('fund_type_preference', 'direct'),
+        'esg_preference': data.get('esg_preference', 'no_preference'),
+        'dividend_preference': data.get('dividend_preference', 'growth'),
+        'lumpsum_investment': float(data.get('lumpsum_investment', 0)),
+        'sip_investment': float(data.get('sip_investment', 0))
+    }
+
+def test_valid_profiles_decode_like_the_old_casts():
+    """Valid bodies give the same values and types as before, including numeric strings"""
+    for body in (PROFILE, {'age': '42', 'annual_income': '800000', 'investment_amount': 50000.0}):
+        profile = UserProfile.decode(body)
+        expected = legacy_parse(body)
+        assert profile == expected and dict(profile) == expected
+        assert all(type(profile[key]) is type(value) for key, value in expected.items())
+    assert profile.age == profile['age'] == profile.get('age') == 42 and profile.get('missing', 'x') == 'x'
+
+def test_invalid_fields_are_all_reported():
+    """Every bad field is listed; explicit nulls count as missing"""
+    try:
+        UserProfile.decode({'age': True, 'annual_income': None, 'investment_amount': 'lots', 'risk_tolerance': 'yolo',
+                            'tax_bracket': 12.5, 'monthly_sip': -1, 'name': 'x' * 500, 'unknown_field': 1})
+        assert False, "expected ValidationError"
+    except ValidationError as e:
+        assert e.errors == [
+            {'field': 'name', 'message': 'must be at most 200 characters'},
+            {'field': 'age', 'message': 'must be an integer'},
+            {'field': 'annual_income', 'message': 'is required'},
+            {'field': 'investment_amount', 'message': 'must be a number'},
+            {'field': 'risk_tolerance', 'message': 'must be one of low, moderate, high'},
+            {'field': 'monthly_sip', 'message': 'must be at least 0'},
+            {'field': 'tax_bracket', 'message': 'must be an integer'}
+        ]
+
+    for body in (b'', b'{', b'[1, 2]', b'"age"', b'\xff\xfe'):
+        try:
+            loads(body)
+            assert False, f"expected ValidationError for {body!r}"
+        except ValidationError as e:
+            assert e.errors[0]['field'] == 'body'
+
+def test_missing_age_is_a_400(app_module):
+    """A missing age used to surface as a TypeError and a 500"""
+    response = app_module.app.test_client().post('/analyze', json={'name': 'No age', 'annual_income': 1e6, 'investment_amount': 1e5})
+    assert response.status_code == 400
+    assert response.get_json() == {
+        'success': False,
+        'error': 'age: is required',
+        'errors': [{'field': 'age', 'message': 'is required'}]
+    }
+
+    response = app_module.app.test_client().post('/analyze/stream', data=b'not json')
+    assert response.status_code == 400 and response.get_json()['errors'][0]['field'] == 'body'
+
+def random_value(rng):
+    return rng.choice([
+        None, True, False, 0, -1, 17, 30, 101, 10 ** 30, 1.5, float('inf'), float('nan'), -1e308,
+        '', ' 30 ', '1e3', 'abc', 'moderate', 'high', '\u0000', 'x' * 300, [], [30], {}, {'age': 30}
+    ])
+
+def fuzz_bodies(rng, count):
+    """Malformed bodies: profile fields dropped, retyped or mangled, and non-object JSON"""
+    for _ in range(count):
+        if rng.random() < 0.1:
+            yield json.dumps(random_value(rng)).encode()
+            continue
+        body = dict(PROFILE)
+        for key in rng.sample(sorted(USER_PROFILE_FIELDS), rng.randint(1, 4)):
+            if rng.random() < 0.3:
+                body.pop(key, None)
+            else:
+                body[key] = random_value(rng)
+        encoded = json.dumps(body).encode()
+        if rng.random() < 0.05:
+            encoded = encoded[:rng.randrange(len(encoded))]
+        yield encoded
+
+def test_fuzzed_bodies_never_raise_unexpected_errors():
+    """Decoding either succeeds with in-range values or raises ValidationError, never anything else"""
+    rng = random.Random(1234)
+    outcomes = {'ok': 0, 'invalid': 0}
+    for body in fuzz_bodies(rng, 5000):
+        try:
+            profile = UserProfile.decode(loads(body))
+        except ValidationError as e:
+            assert e.errors and all(set(error) == {'field', 'message'} for error in e.errors)
+            outcomes['invalid'] += 1
+            continue
+        for name, field in USER_PROFILE_FIELDS.items():
+            value = profile[name]
+            assert value is None and not field.required or isinstance(value, field.kind)
+            assert field.minimum is None or value >= field.minimum
+            assert field.maximum is None or value <= field.maximum
+        outcomes['ok'] += 1
+    assert outcomes['ok'] > 100 and outcomes['invalid'] > 1000, outcomes
+
+def test_fuzzed_requests_get_200_or_400(app_module):
+    """Through the routes, malformed input is a 400 and accepted input a 200; never a 500"""
+    client = app_module.app.test_client()
+    recommender = app_module.llm_recommender
+    saved = recommender.backend, recommender.cache
+    recommender.backend, recommender.cache = FakeBackend(latency_median=0), None
+    try:
+        rng = random.Random(99)
+        for body in fuzz_bodies(rng, 60):
+            response = client.post('/analyze', data=body, content_type='application/json')
+            assert response.status_code in (200, 400), (body, response.get_json())
+            assert response.get_json()['success'] == (response.status_code == 200)
+    finally:
+        recommender.backend, recommender.cache = saved
+
+def benchmark_decode(repeats: int = 20000):
+    """Body decode time of the old json.loads and casts against the schema"""
+    body = json.dumps(PROFILE).encode()
+    started = time.perf_counter()
+    for _ in range(repeats):
+        legacy_parse(json.loads(body))
+    legacy = (time.perf_counter() - started) / repeats
+    started = time.perf_counter()
+    for _ in range(repeats):
+        UserProfile.decode(loads(body))
+    schema = (time.perf_counter() - started) / repeats
+    print(f"Decode /analyze body: legacy casts {legacy * 1e6:.1f} us, schema {schema * 1e6:.1f} us")
+
+if __name__ == "__main__":
+    from conftest import load_app
+    test_valid_profiles_decode_like_the_old_casts()
+    test_invalid_fields_are_all_reported()
+    test_missing_age_is_a_400(load_app())
+    test_fuzzed_bodies_never_raise_unexpected_errors()
+    test_fuzzed_requests_get_200_or_400(load_app())
+    benchmark_decode()
+    print("✅ Request schema tests passed")
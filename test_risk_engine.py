@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+"""
+Tests for the portfolio VaR/CVaR and stress-scenario engine
+"""
+
+import numpy as np
+from mutual_fund_analyzer import MutualFundAnalyzer
+from risk_engine import PortfolioRiskEngine
+
+FUND_WEIGHTS = {'LARGE_001': 40, 'MID_001': 30, 'SMALL_001': 30}
+
+def test_var_and_cvar_are_ordered():
+    """CVaR is at least as large a loss as VaR, for both methods"""
+    analyzer = MutualFundAnalyzer()
+    risk = analyzer.risk_engine.portfolio_risk(FUND_WEIGHTS, 100000)
+
+    assert 0 < risk['historical_var'] <= risk['historical_cvar']
+    assert 0 < risk['parametric_var'] <= risk['parametric_cvar']
+    assert abs(risk['historical_var_amount'] - risk['historical_var'] * 1000) <= 5
+
+def test_category_shock_scenario():
+    """A category shock applies the same return to every fund in that category"""
+    snapshot = MutualFundAnalyzer().snapshot
+    engine = PortfolioRiskEngine(snapshot, scenarios=[
+        {'name': 'Small cap crash', 'shocks': {'small_cap': -0.4}}
+    ])
+
+    risk = engine.portfolio_risk(FUND_WEIGHTS, 100000)
+
+    assert risk['stress_tests'] == [{'scenario': 'Small cap crash', 'portfolio_return': -12.0, 'loss_amount': 12000.0}]
+
+def test_historical_scenario_replays_window():
+    """Historical scenarios use the NAV moves across the window"""
+    snapshot = MutualFundAnalyzer().snapshot
+    engine = PortfolioRiskEngine(snapshot, scenarios=[
+        {'name': 'Covid', 'start': '2020-02-20', 'end': '2020-03-23'}
+    ])
+
+    navs = snapshot.nav_for(['LARGE_001'])[:, 0]
+    start = np.searchsorted(snapshot.nav_dates, np.datetime64('2020-02-20'))
+    end = np.searchsorted(snapshot.nav_dates, np.datetime64('2020-03-23'))
+    expected = (navs[end] / navs[start] - 1) * 100
+
+    risk = engine.portfolio_risk({'LARGE_001': 1})
+    assert abs(risk['stress_tests'][0]['portfolio_return'] - round(expected, 2)) < 1e-9
+
+def test_risk_warnings_are_numeric():
+    """Risk warnings quote the portfolio VaR"""
+    analyzer = MutualFundAnalyzer()
+    user_info = {
+        'age': 35,
+        'annual_income': 800000,
+        'investment_amount': 100000,
+        'risk_tolerance': 'moderate',
+        'investment_horizon': '5-10 years'
+    }
+
+    warnings = analyzer.get_recommendations(user_info)['advanced_analysis']['risk_warnings']
+    assert any('bad month' in warning for warning in warnings)
+
+if __name__ == "__main__":
+    test_var_and_cvar_are_ordered()
+    test_category_shock_scenario()
+    test_historical_scenario_replays_window()
+    test_risk_warnings_are_numeric()
+    print("✅ Risk engine tests passed")
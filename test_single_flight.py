@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+Tests for coalescing identical in-flight LLM requests
+"""
+
+import os
+import time
+import tempfile
+import threading
+from multiprocessing import Pool
+from llm_backends import LLMBackend
+from llm_cache import LLMAnalysisCache
+from llm_recommender import LLMRecommender
+from mutual_fund_analyzer import MutualFundAnalyzer
+from single_flight import SingleFlight
+
+USER_PROFILE = {
+    'name': 'Test User',
+    'age': 30,
+    'annual_income': 1000000,
+    'investment_amount': 100000,
+    'monthly_sip': 5000
+}
+
+class GatedBackend(LLMBackend):
+    """LLM backend that answers only once released"""
+
+    def __init__(self):
+        self.release = threading.Event()
+        self.calls = 0
+
+    def generate(self, prompt, timeout):
+        self.calls += 1
+        self.release.wait(5)
+        return 'We recommend a diversified SIP portfolio.'
+
+def wait_until(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+def generate_in_worker(args):
+    """One worker process asking for the same analysis as its siblings"""
+    directory, worker = args
+    cache = LLMAnalysisCache(os.path.join(directory, 'cache.sqlite3'))
+    flight = SingleFlight(os.path.join(directory, 'locks'))
+
+    def generate():
+        with open(os.path.join(directory, 'upstream_calls'), 'a') as calls:
+            calls.write(f'{worker}\n')
+        time.sleep(1.0)
+        cache.set('analysis', 'shared analysis', 'v1')
+        return 'shared analysis'
+
+    return flight.do('analysis', generate, lambda: cache.get('analysis', 'v1'), timeout=10)
+
+def test_concurrent_identical_requests_share_one_call():
+    """Threads asking for the same analysis wait for one upstream call"""
+    with tempfile.TemporaryDirectory() as directory:
+        recommender = LLMRecommender(cache=False, single_flight=SingleFlight(directory), backend=GatedBackend())
+        fund_data = MutualFundAnalyzer().get_recommendations(USER_PROFILE)
+
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(recommender.generate_recommendations(USER_PROFILE, fund_data)))
+            for _ in range(8)
+        ]
+        for thread in threads:
+            thread.start()
+        assert wait_until(lambda: recommender.single_flight.stats()['coalesced'] == 7)
+
+        recommender.backend.release.set()
+        for thread in threads:
+            thread.join()
+
+        assert recommender.backend.calls == 1
+        assert len(results) == 8 and not any(result.get('fallback') for result in results)
+        assert len({result['sections']['full_analysis'] for result in results}) == 1
+        assert recommender.single_flight.stats()['in_flight'] == 0
+
+def test_failures_are_shared_and_not_cached():
+    """Followers get the leader's exception; the next call tries again"""
+    flight = SingleFlight()
+    started, release = threading.Event(), threading.Event()
+    errors = []
+
+    def failing():
+        started.set()
+        release.wait(5)
+        raise ConnectionError("upstream unavailable")
+
+    def call():
+        try:
+            flight.do('key', failing)
+        except ConnectionError as e:
+            errors.append(e)
+
+    leader = threading.Thread(target=call)
+    leader.start()
+    started.wait(5)
+    follower = threading.Thread(target=call)
+    follower.start()
+    assert wait_until(lambda: flight.stats()['coalesced'] == 1)
+    release.set()
+    leader.join()
+    follower.join()
+
+    assert len(errors) == 2
+    assert flight.do('key', lambda: 'recovered') == 'recovered'
+
+def test_worker_processes_share_one_call():
+    """Worker processes coalesce through the lock file and the shared cache"""
+    with tempfile.TemporaryDirectory() as directory:
+        LLMAnalysisCache(os.path.join(directory, 'cache.sqlite3'))
+        with Pool(4) as pool:
+            results = pool.map(generate_in_worker, [(directory, worker) for worker in range(4)])
+
+        with open(os.path.join(directory, 'upstream_calls')) as calls:
+            assert len(calls.readlines()) == 1
+        assert results == ['shared analysis'] * 4
+        assert os.listdir(os.path.join(directory, 'locks')) == []
+
+if __name__ == "__main__":
+    test_concurrent_identical_requests_share_one_call()
+    test_failures_are_shared_and_not_cached()
+    test_worker_processes_share_one_call()
+    print("✅ Single-flight tests passed")
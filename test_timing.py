@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+"""
+Tests for per-request stage timing, the Server-Timing header and ?debug_timing=1
+"""
+
+import os
+import time
+import json
+import asyncio
+import tempfile
+import threading
+import timing
+from timing import stage, note
+from llm_backends import FakeBackend
+from llm_cache import LLMAnalysisCache
+
+USER_PROFILE = {
+    'name': 'Test User',
+    'age': 30,
+    'annual_income': 1000000,
+    'investment_amount': 100000,
+    'monthly_sip': 5000,
+    'risk_tolerance': 'high',
+    'investment_horizon': '10+ years',
+    'wait_for_analysis': True
+}
+
+def server_timing(header):
+    """Parse a Server-Timing header into {name: milliseconds}"""
+    entries = {}
+    for entry in header.split(', '):
+        name, duration = entry.split(';dur=')
+        entries[name] = float(duration)
+    return entries
+
+def test_stages_accumulate_and_are_noops_outside_a_request():
+    """Repeated stages add up; without a bound timer, stage() and note() do nothing"""
+    timing.stop()
+    with stage('ignored'):
+        note('ignored')
+
+    timer = timing.start()
+    try:
+        for _ in range(3):
+            with stage('loop'):
+                time.sleep(0.002)
+        note('llm_cache', 'hit')
+    finally:
+        timing.stop()
+    assert timing.current() is None
+    assert timer.stages['loop'] >= 0.006 and timer.flags == {'llm_cache': 'hit'}
+    assert set(server_timing(timer.server_timing())) == {'loop', 'total'}
+
+def test_timers_are_isolated_per_thread_and_task():
+    """Concurrent requests (threads or asyncio tasks) each record into their own timer"""
+    timers = {}
+
+    def worker(name):
+        timers[name] = timing.start()
+        with stage(name):
+            time.sleep(0.01)
+
+    threads = [threading.Thread(target=worker, args=(name,)) for name in ('a', 'b')]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert list(timers['a'].stages) == ['a'] and list(timers['b'].stages) == ['b']
+
+    def work(name):
+        with stage(name):
+            pass
+
+    async def request(name):
+        timer = timing.start()
+        # Work handed to a thread records into the caller's timer
+        await asyncio.to_thread(work, name)
+        return timer
+
+    async def both():
+        return await asyncio.gather(request('x'), request('y'))
+
+    x, y = asyncio.run(both())
+    assert list(x.stages) == ['x'] and list(y.stages) == ['y']
+
+def test_analyze_reports_each_stage_and_cache_flags(app_module):
+    """/analyze sends Server-Timing for every stage, and ?debug_timing=1 adds the breakdown and cache flags"""
+    client = app_module.app.test_client()
+    recommender = app_module.llm_recommender
+    saved = recommender.backend, recommender.cache
+    recommender.backend = FakeBackend(latency_median=0.05, latency_sigma=0.0)
+    directory = tempfile.TemporaryDirectory()
+    recommender.cache = LLMAnalysisCache(os.path.join(directory.name, 'cache.sqlite3'))
+    try:
+        response = client.post('/analyze', json=USER_PROFILE)
+        stages = server_timing(response.headers['Server-Timing'])
+        assert 'debug_timing' not in response.get_json()
+        assert set(stages) == {'parse', 'ranking', 'optimization', 'advanced_analysis', 'grow_urls',
+                               'prompt', 'llm', 'llm_parse', 'serialize', 'total'}
+        assert stages['llm'] >= 50 and stages['total'] >= sum(ms for name, ms in stages.items() if name != 'total')
+
+        debug = client.post('/analyze?debug_timing=1', json=USER_PROFILE).get_json()['debug_timing']
+        assert debug['flags'] == {'llm_cache': 'hit'} and 'llm' not in debug['stages_ms']
+        assert debug['total_ms'] >= sum(debug['stages_ms'].values())
+
+        recommender.backend = FakeBackend(latency_median=0, error_rate=1.0)
+        recommender.cache = None
+        debug = client.post('/analyze?debug_timing=1', json=USER_PROFILE).get_json()['debug_timing']
+        assert debug['flags'] == {'llm_cache': 'disabled', 'llm_fallback': True}
+    finally:
+        recommender.backend, recommender.cache = saved
+        directory.cleanup()
+
+    # Every route gets the header, including errors
+    assert 'total' in server_timing(client.get('/llm-stats').headers['Server-Timing'])
+    assert 'parse' in server_timing(client.post('/analyze', json={}).headers['Server-Timing'])
+
+def test_async_analyze_sends_server_timing(asgi_module):
+    """The ASGI /analyze records the same stages, including the awaited LLM call"""
+
+    recommender = asgi_module.flask_app.llm_recommender
+    saved = recommender.backend, recommender.cache
+    recommender.backend, recommender.cache = FakeBackend(latency_median=0.05, latency_sigma=0.0), None
+    messages = []
+
+    async def receive():
+        return {'type': 'http.request', 'body': json.dumps(USER_PROFILE).encode(), 'more_body': False}
+
+    async def send(message):
+        messages.append(message)
+
+    scope = {'type': 'http', 'method': 'POST', 'path': '/analyze', 'query_string': b'debug_timing=1'}
+    try:
+        asyncio.run(asgi_module.app(scope, receive, send))
+    finally:
+        recommender.backend, recommender.cache = saved
+
+    headers = dict(messages[0]['headers'])
+    stages = server_timing(headers[b'server-timing'].decode())
+    assert {'parse', 'ranking', 'grow_urls', 'prompt', 'llm', 'llm_parse', 'serialize'} <= set(stages)
+    assert stages['llm'] >= 50
+    assert json.loads(messages[1]['body'])['debug_timing']['flags'] == {'llm_cache': 'disabled'}
+
+def benchmark_stage_overhead(repeats: int = 100000):
+    """Cost of timing a stage with a timer bound, and of the no-op without one"""
+    timing.start()
+    try:
+        started = time.perf_counter()
+        for _ in range(repeats):
+            with stage('hot'):
+                pass
+        enabled = (time.perf_counter() - started) / repeats
+    finally:
+        timing.stop()
+    started = time.perf_counter()
+    for _ in range(repeats):
+        with stage('hot'):
+            pass
+    disabled = (time.perf_counter() - started) / repeats
+    print(f"Stage overhead: {enabled * 1e6:.2f} us with a timer, {disabled * 1e6:.2f} us without")
+
+if __name__ == "__main__":
+    from conftest import load_app, load_asgi
+    test_stages_accumulate_and_are_noops_outside_a_request()
+    test_timers_are_isolated_per_thread_and_task()
+    test_analyze_reports_each_stage_and_cache_flags(load_app())
+    test_async_analyze_sends_server_timing(load_asgi())
+    benchmark_stage_overhead()
+    print("✅ Timing tests passed")
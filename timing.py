@@ -0,0 +1,110 @@
+"""
+Per-request stage timing.
+
+A StageTimer is bound to the current request through a context variable, so
+code anywhere below the route (the analyzer, the LLM recommender) can time a
+stage with `with stage('name'):` or record a flag such as a cache hit with
+`note('llm_cache', 'hit')` without the timer being passed around. Outside a
+request (tests, scripts, background jobs) both are no-ops. Context variables
+follow asyncio tasks and asyncio.to_thread, so the async /analyze path is
+covered too.
+"""
+
+import time
+import contextvars
+from typing import Dict, Any, Optional
+
+_current: contextvars.ContextVar[Optional['StageTimer']] = contextvars.ContextVar('stage_timer', default=None)
+
+
+class _Stage:
+    __slots__ = ('timer', 'name', 'started')
+
+    def __init__(self, timer: 'StageTimer', name: str):
+        self.timer = timer
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.timer.add(self.name, time.perf_counter() - self.started)
+        return False
+
+
+class _NoStage:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NO_STAGE = _NoStage()
+
+
+class StageTimer:
+    """Durations of the named stages of one request, plus flags describing how it was served.
+
+    A stage timed more than once (e.g. one per fund category) accumulates.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.stages: Dict[str, float] = {}
+        self.flags: Dict[str, Any] = {}
+
+    def add(self, name: str, seconds: float):
+        self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    def stage(self, name: str) -> _Stage:
+        return _Stage(self, name)
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started
+
+    def server_timing(self) -> str:
+        """Server-Timing header value: each stage and the total, in milliseconds"""
+        entries = [f"{name};dur={seconds * 1000:.2f}" for name, seconds in self.stages.items()]
+        entries.append(f"total;dur={self.elapsed() * 1000:.2f}")
+        return ', '.join(entries)
+
+    def summary(self) -> Dict[str, Any]:
+        """The debug_timing block: stage and total milliseconds, and the flags"""
+        return {
+            'stages_ms': {name: round(seconds * 1000, 3) for name, seconds in self.stages.items()},
+            'total_ms': round(self.elapsed() * 1000, 3),
+            'flags': dict(self.flags)
+        }
+
+
+def start() -> StageTimer:
+    """Bind a new timer to the current context (request) and return it"""
+    timer = StageTimer()
+    _current.set(timer)
+    return timer
+
+
+def current() -> Optional[StageTimer]:
+    return _current.get()
+
+
+def stage(name: str):
+    """Context manager timing `name` for the current request, if there is one"""
+    timer = _current.get()
+    return _NO_STAGE if timer is None else _Stage(timer, name)
+
+
+def note(flag: str, value: Any = True):
+    """Record a flag (e.g. a cache hit or a fallback) for the current request, if there is one"""
+    timer = _current.get()
+    if timer is not None:
+        timer.flags[flag] = value
+
+
+def stop():
+    """Unbind the current timer, e.g. when a request ends on a thread that will serve another"""
+    _current.set(None)